@@ -9,6 +9,7 @@ setup(
     python_requires='>=3.7.5',
     install_requires=[
             "numpy",
+            "scipy",
             "hyperspy",
             "h5py",
             "scikit-image>=0.19.3",
@@ -16,6 +17,7 @@ setup(
             "nexusformat",
             "matplotlib>=3.5.3",
         ],
+    extras_require={"notebook": ["ipywidgets>=7.6"]},
     package_dir={"": "src"},
     packages=find_packages(where='src'),
     description="Package handling magnetic imaging data and tools for image alignments",
@@ -0,0 +1,383 @@
+""" Module containing batch alignments of many images. ``align_stack`` registers images against
+one reference image, the registrations are distributed to a pool of processes and large arrays are
+passed to the workers through shared memory instead of being pickled for every task.
+``iter_drift`` and ``track_drift`` follow the drift of a time series frame by frame.
+``replay_sessions`` repeats recorded interactive alignments on new images without a figure.
+
+The aligner modules import ``matplotlib.pyplot``, they are imported on first use, so the module
+can be imported in headless scripts and workers without pyplot.
+
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from align_panel.image_transformer import ImageTransformer
+from align_panel.align.registration import RegistrationTarget, warp_to
+from align_panel.align.metrics import alignment_metrics, ncc
+from align_panel.align.session import AlignmentSession
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.7, the stacks are pickled for the workers
+    shared_memory = None
+
+# registration targets of the shared reference images, kept for the lifetime of a worker
+_TARGETS = {}
+
+
+def _align_auto(*args, **kwargs):
+    """``crop.align_auto``, imported on the first registration."""
+    from align_panel.align.crop import align_auto  # pylint: disable=import-outside-toplevel
+
+    return align_auto(*args, **kwargs)
+
+
+def _replay(aligner: str):
+    """Headless replay of the sessions recorded by ``aligner``."""
+    # pylint: disable=import-outside-toplevel
+    from align_panel.align.crop import CropAlignments
+    from align_panel.align.fine import FineAlignments
+    from align_panel.align.points import PointAlignments
+
+    replays = {
+        "crop": CropAlignments.replay,
+        "points": PointAlignments.replay,
+        "fine": FineAlignments.replay,
+    }
+    return replays[aligner]
+
+
+def _register(ref_image, mov_image: np.ndarray, method: str, kwargs: dict):
+    """Register one image, returns the matrix, the elapsed time and the quality metrics of the
+    result. ``ref_image`` can be a ``RegistrationTarget``.
+
+    """
+    start = time.perf_counter()
+    matrix = _align_auto(ref_image, mov_image, method, **kwargs).params
+    elapsed = time.perf_counter() - start
+    if isinstance(ref_image, RegistrationTarget):
+        ref_image = ref_image.ref_image
+    metrics = alignment_metrics(
+        ref_image,
+        mov_image,
+        matrix,
+        level=kwargs.get("metrics_level", 1),
+        inverse=kwargs.get("inverse", True),
+    )
+    return matrix, elapsed, metrics
+
+
+def _attach(spec: tuple):
+    """Attach to a shared memory block described by ``(name, shape, dtype)``."""
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _register_shared(ref_spec: tuple, mov_spec: tuple, index: int, method: str, kwargs: dict):
+    """Worker function, registers image ``index`` of the shared stack to the shared reference."""
+    ref_block, ref_image = _attach(ref_spec)
+    mov_block, mov_images = _attach(mov_spec)
+    try:
+        if method == "cross_corelation_fft":
+            if ref_spec[0] not in _TARGETS:
+                _TARGETS.clear()
+                _TARGETS[ref_spec[0]] = _make_target(ref_image, kwargs)
+            ref_image = _TARGETS[ref_spec[0]]
+        return _register(ref_image, mov_images[index], method, kwargs)
+    finally:
+        del ref_image, mov_images
+        ref_block.close()
+        mov_block.close()
+
+
+def _make_target(ref_image: np.ndarray, kwargs: dict):
+    """Registration target of a copy of the reference, independent of the shared memory."""
+    return RegistrationTarget(
+        np.array(ref_image), upsample_factor=kwargs.get("sub_pixel_factor", 2)
+    )
+
+
+def _to_shared(array: np.ndarray):
+    """Copy an array into a new shared memory block, returns the block and its description."""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    shared[...] = array
+    del shared
+    return block, (block.name, array.shape, array.dtype)
+
+
+def align_stack(
+    ref_image: np.ndarray,
+    mov_images,
+    method: str,
+    workers: int = None,
+    shared_threshold: int = 2**20,
+    **kwargs,
+):
+    """Register every image of a stack to one reference image with ``align_auto``, in parallel.
+
+    Parameters
+    ----------
+    ref_image : np.ndarray
+        Reference image.
+    mov_images : np.ndarray or list
+        Stack of images to be aligned, a 3D array or a list of images of the reference shape.
+    method : str
+        Method for alignment, see ``align_auto``.
+    workers : int, optional
+        Number of processes. The default is None, the number of CPUs. For 1, the images are
+        registered in the current process.
+    shared_threshold : int, optional
+        Stacks larger than this number of bytes are passed to the workers through shared memory,
+        from Python 3.8 on. The default is 1 MiB. For ``cross_corelation_fft``, the spectrum of
+        the reference is computed once per process.
+    **kwargs
+        Further parameters of ``align_auto``, such as ``inverse``, ``sub_pixel_factor``,
+        ``levels`` or ``metrics_level``.
+
+    Returns
+    -------
+    matrices : np.ndarray
+        Array of shape (N, 3, 3) with the transformation matrices.
+    stats : dict
+        Per-image ``time`` of the registration in seconds and the quality metrics of the aligned
+        image, ``ncc``, ``mutual_information``, ``overlap`` and ``peak_sharpness``, see
+        ``metrics.alignment_metrics``. They can be thresholded to reject failed registrations.
+
+    """
+    ref_image = np.ascontiguousarray(ref_image)
+    mov_images = np.ascontiguousarray(np.stack([np.asarray(image) for image in mov_images]))
+    n_images = mov_images.shape[0]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, n_images))
+
+    if workers == 1:
+        target = _make_target(ref_image, kwargs) if method == "cross_corelation_fft" else ref_image
+        results = [_register(target, image, method, kwargs) for image in mov_images]
+    elif shared_memory is not None and mov_images.nbytes + ref_image.nbytes > shared_threshold:
+        ref_block, ref_spec = _to_shared(ref_image)
+        mov_block, mov_spec = _to_shared(mov_images)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(_register_shared, ref_spec, mov_spec, index, method, kwargs)
+                    for index in range(n_images)
+                ]
+                results = [future.result() for future in futures]
+        finally:
+            for block in (ref_block, mov_block):
+                block.close()
+                block.unlink()
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_register, ref_image, image, method, kwargs)
+                for image in mov_images
+            ]
+            results = [future.result() for future in futures]
+
+    matrices, times, metrics = zip(*results)
+    stats = {"time": np.array(times)}
+    for key in metrics[0]:
+        stats[key] = np.array([image_metrics[key] for image_metrics in metrics])
+    return np.stack(matrices), stats
+
+
+def _corner_shift(transform, shape: tuple):
+    """Largest displacement of the image corners by a transformation, in pixels."""
+    corners = np.array([[0, 0], [shape[1], 0], [0, shape[0]], [shape[1], shape[0]]], dtype=float)
+    return float(np.abs(transform(corners) - corners).max())
+
+
+def iter_drift(
+    frames,
+    method: str,
+    reference: str = "previous",
+    alpha: float = 0.2,
+    jump_threshold: float = 20.0,
+    min_ncc: float = 0.5,
+    **kwargs,
+):
+    """Follow the drift of a series of frames, one frame at a time. Every frame is first moved by
+    the transformation of the previous frame, then the residual is registered with ``align_auto``
+    against the reference and composed with the transformation of the previous frame.
+    Only the current frame and the reference are kept in memory, so ``frames`` can be a lazily
+    loaded stack, such as a generator, a memory map or an ``h5py`` dataset.
+
+    A residual moving the corners by more than ``jump_threshold`` pixels, or an alignment with
+    normalised cross-correlation below ``min_ncc``, is treated as a drift jump. The frame is then
+    registered from scratch against the anchor, the first frame, and the reference is restarted
+    from the re-anchored frame if that gives a better correlation.
+
+    Parameters
+    ----------
+    frames : iterable
+        Frames of the series, in the order of acquisition.
+    method : str
+        Method for alignment, see ``align_auto``.
+    reference : str, optional
+        ``previous`` to register frame k to the aligned frame k - 1, ``running`` to register it to
+        the running average of the aligned frames. The default is ``previous``.
+    alpha : float, optional
+        Weight of a new frame in the running average. The default is 0.2.
+    jump_threshold : float, optional
+        Residual displacement in pixels treated as a jump. The default is 20.
+    min_ncc : float, optional
+        Normalised cross-correlation below which the alignment is treated as a jump.
+        The default is 0.5.
+    **kwargs
+        Further parameters of ``align_auto``. ``inverse`` defaults to False, the frames share the
+        contrast.
+
+    Yields
+    ------
+    matrix : np.ndarray
+        Transformation matrix aligning the frame to the first frame.
+    stats : dict
+        ``time`` of the registration in seconds, ``ncc`` of the aligned frame and the reference,
+        ``residual`` displacement in pixels and ``reanchored`` bool.
+
+    """
+    if reference not in ("previous", "running"):
+        raise ValueError(f"Unknown reference: {reference}")
+    kwargs.setdefault("inverse", False)
+    # transformation of the previous frame, the residuals are composed into it, so every frame
+    # costs the same however long the series is
+    matrix, anchor, ref_frame = None, None, None
+    for frame in frames:
+        frame = np.asarray(frame)
+        start = time.perf_counter()
+        if matrix is None:
+            matrix = np.eye(3)
+            anchor = frame.astype(np.float32 if frame.dtype == np.float32 else np.float64)
+            ref_frame = anchor.copy()
+            yield matrix, {
+                "time": time.perf_counter() - start,
+                "ncc": 1.0,
+                "residual": 0.0,
+                "reanchored": False,
+            }
+            continue
+
+        predicted = warp_to(frame, matrix, output_shape=anchor.shape)
+        filled = np.where(np.isnan(ref_frame), np.nanmean(ref_frame), ref_frame)
+        residual = _align_auto(filled, predicted, method, **kwargs)
+        trans = ImageTransformer(frame)
+        trans.add_transform(matrix, residual)
+        aligned = trans.warp_preserving_dtype(output_shape=anchor.shape)
+        frame_ncc = ncc(ref_frame, aligned)
+        residual_shift = _corner_shift(residual, anchor.shape)
+        reanchored = False
+        if residual_shift > jump_threshold or not frame_ncc >= min_ncc:
+            direct = _align_auto(anchor, frame, method, **kwargs)
+            direct_trans = ImageTransformer(frame)
+            direct_trans.add_transform(direct)
+            direct_aligned = direct_trans.warp_preserving_dtype(output_shape=anchor.shape)
+            direct_ncc = ncc(anchor, direct_aligned)
+            if direct_ncc > frame_ncc or np.isnan(frame_ncc):
+                trans = direct_trans
+                aligned, frame_ncc, reanchored = direct_aligned, direct_ncc, True
+
+        if reference == "previous" or reanchored:
+            ref_frame = aligned
+        else:
+            # new pixels are taken from the frame, known pixels are averaged
+            ref_frame = np.where(
+                np.isnan(ref_frame), aligned, np.where(
+                    np.isnan(aligned), ref_frame, (1.0 - alpha) * ref_frame + alpha * aligned
+                )
+            )
+        matrix = trans.get_combined_transform().params
+        yield matrix, {
+            "time": time.perf_counter() - start,
+            "ncc": frame_ncc,
+            "residual": residual_shift,
+            "reanchored": reanchored,
+        }
+
+
+def track_drift(frames, method: str, **kwargs):
+    """Follow the drift of a series of frames with ``iter_drift`` and collect the results.
+
+    Returns
+    -------
+    matrices : np.ndarray
+        Array of shape (N, 3, 3) with the transformation matrices aligning the frames to the first
+        frame.
+    stats : dict
+        Per-frame arrays ``time``, ``ncc``, ``residual`` and ``reanchored``.
+
+    """
+    matrices, stats = [], {"time": [], "ncc": [], "residual": [], "reanchored": []}
+    for matrix, frame_stats in iter_drift(frames, method, **kwargs):
+        matrices.append(matrix)
+        for key, value in frame_stats.items():
+            stats[key].append(value)
+    return np.stack(matrices), {key: np.array(values) for key, values in stats.items()}
+
+
+def replay_session(session, ref_image, mov_image, materialise: bool = False):
+    """Replay one recorded session on two images without a figure, see ``replay_sessions``.
+    ``session`` can also be a dictionary or JSON string of a session.
+
+    """
+    if isinstance(session, str):
+        session = AlignmentSession.from_json(session)
+    elif isinstance(session, dict):
+        session = AlignmentSession.from_dict(session)
+    results = _replay(session.aligner)(session, ref_image, mov_image)
+    if materialise:
+        results["result_image"] = results["result_view"].materialise()
+    return results
+
+
+def replay_sessions(sessions, image_pairs, workers: int = None, materialise: bool = False):
+    """Replay recorded alignment sessions on pairs of images, in parallel and without a figure,
+    e.g. to reprocess the data after a change of the parameters or at full resolution. The
+    inputs of sessions recorded on images of a different resolution are rescaled.
+
+    The sessions run on a pool of threads, the images are shared with the workers without
+    copies and the registrations and resampling spend most of the time in numpy and scipy,
+    which release the GIL.
+
+    Parameters
+    ----------
+    sessions : AlignmentSession or list
+        Sessions recorded by the ``session`` property of ``CropAlignments``,
+        ``PointAlignments`` or ``FineAlignments``, also as dictionaries or JSON strings. A
+        single session is replayed on all image pairs.
+    image_pairs : list
+        List of ``(ref_image, mov_image)`` tuples, of the same length as ``sessions``.
+    workers : int, optional
+        Number of threads. The default is None, the number of CPUs.
+    materialise : bool, optional
+        If True, the results are also resampled to ``result_image``. The default is False,
+        only the lazy ``result_view`` is returned.
+
+    Returns
+    -------
+    results : list
+        Dictionary of each pair with the transformation matrix ``tmat``, the lazy result
+        ``result_view`` and the aligner specific results.
+
+    """
+    image_pairs = list(image_pairs)
+    if isinstance(sessions, (AlignmentSession, str, dict)):
+        sessions = [sessions] * len(image_pairs)
+    sessions = list(sessions)
+    if len(sessions) != len(image_pairs):
+        raise ValueError(
+            f"Got {len(sessions)} sessions for {len(image_pairs)} image pairs"
+        )
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(sessions)))
+    tasks = [(session, ref, mov, materialise) for session, (ref, mov) in zip(sessions, image_pairs)]
+    if workers == 1:
+        return [replay_session(*task) for task in tasks]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda task: replay_session(*task), tasks))
@@ -0,0 +1,383 @@
+""" Module containing synthetic benchmarks of the automatic alignments. Pairs of images with a known
+transformation are generated, registered, and the time and the registration error are recorded.
+
+Run as a script to print a table of all ``align_auto`` methods and optionally save the results
+as JSON, to track regressions between versions:
+
+```bash
+python -m align_panel.align.benchmark --sizes 256 512 --noise 0 0.5 --json results.json
+python -m align_panel.align.benchmark --pyramid
+python -m align_panel.align.benchmark --redraw
+```
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+from scipy import ndimage as ndi
+from skimage import transform as sktransform
+from align_panel.image_transformer import ImageTransformer
+from align_panel.align.crop import align_auto, AUTO_METHODS
+
+
+def synthetic_pair(
+    shape: tuple = (512, 512),
+    transform=None,
+    noise: float = 0.0,
+    sigma: float = 4.0,
+    margin: int = 128,
+    seed: int = 0,
+):
+    """Generate a reference image and a moving image displaced by a known transformation.
+    The images are crops of a larger smooth random texture, so the displaced image has no
+    empty borders.
+
+    Parameters
+    ----------
+    shape : tuple, optional
+        Shape of the images. The default is (512, 512).
+    transform : sktransform.AffineTransform, optional
+        Transformation which aligns the moving image to the reference image, in the convention
+        of ``align_auto``. The default is None, the identity.
+    noise : float, optional
+        Standard deviation of the Gaussian noise added to both images, relative to the standard
+        deviation of the texture. The default is 0.
+    sigma : float, optional
+        Correlation length of the texture in pixels. The default is 4.
+    margin : int, optional
+        Margin of the texture around the reference image. The default is 128.
+    seed : int, optional
+        Seed of the random generator. The default is 0.
+
+    Returns
+    -------
+    ref_image, mov_image : np.ndarray
+        Reference and moving image, float32.
+
+    """
+    rng = np.random.default_rng(seed)
+    big_shape = (shape[0] + 2 * margin, shape[1] + 2 * margin)
+    texture = ndi.gaussian_filter(rng.standard_normal(big_shape), sigma)
+    texture = ((texture - texture.mean()) / texture.std()).astype(np.float32)
+    if transform is None:
+        transform = sktransform.AffineTransform()
+    ref_image = texture[margin : margin + shape[0], margin : margin + shape[1]].copy()
+    trans = ImageTransformer(texture)
+    trans.translate(margin, margin)
+    trans.add_transform(np.linalg.inv(transform.params), output_shape=shape)
+    mov_image = trans.warp_preserving_dtype(order=3, cval=0.0)
+    if noise:
+        ref_image += rng.normal(0, noise, shape).astype(np.float32)
+        mov_image += rng.normal(0, noise, shape).astype(np.float32)
+    return ref_image, mov_image
+
+
+def registration_error(estimated, expected, shape: tuple):
+    """Largest displacement, in pixels, between the image corners mapped by the estimated and the
+    expected transformation.
+
+    """
+    corners = np.array([[0, 0], [shape[1], 0], [0, shape[0]], [shape[1], shape[0]]], dtype=float)
+    return float(np.abs(estimated(corners) - expected(corners)).max())
+
+
+def _run(ref_image, mov_image, transform, success_error, **kwargs):
+    start = time.perf_counter()
+    estimated = align_auto(ref_image, mov_image, inverse=False, **kwargs)
+    elapsed = time.perf_counter() - start
+    error = registration_error(estimated, transform, ref_image.shape)
+    return elapsed, error, error < success_error
+
+
+def benchmark_pyramid(
+    methods: tuple = ("PyStackReg_translation", "PyStackReg_rigid", "cross_corelation_hyperspy"),
+    shape: tuple = (512, 512),
+    shifts: tuple = (4.0, 16.0, 48.0, 96.0),
+    repeats: int = 3,
+    levels: int = 3,
+    success_error: float = 1.0,
+):
+    """Compare single scale and coarse-to-fine registration of ``align_auto`` on synthetic pairs
+    displaced by translations of increasing size.
+
+    Parameters
+    ----------
+    methods : tuple, optional
+        ``align_auto`` methods to compare.
+    shape : tuple, optional
+        Shape of the images. The default is (512, 512).
+    shifts : tuple, optional
+        Sizes of the translations in pixels, applied along a random direction.
+    repeats : int, optional
+        Number of pairs for every shift. The default is 3.
+    levels : int, optional
+        Number of pyramid levels. The default is 3.
+    success_error : float, optional
+        Registration error in pixels below which the registration is successful. The default is 1.
+
+    Returns
+    -------
+    results : dict
+        For every method, the total time, the success rate and the mean error of the single scale
+        (``single``) and the pyramid (``pyramid``) registration, and the ``speedup``.
+
+    """
+    rng = np.random.default_rng(0)
+    pairs = []
+    for shift in shifts:
+        for _ in range(repeats):
+            angle = rng.uniform(0, 2 * np.pi)
+            transform = sktransform.AffineTransform(
+                translation=(shift * np.cos(angle), shift * np.sin(angle))
+            )
+            pairs.append((transform, synthetic_pair(shape, transform, noise=0.1, seed=len(pairs))))
+
+    results = {}
+    for method in methods:
+        results[method] = {}
+        for name, method_levels in (("single", 1), ("pyramid", levels)):
+            runs = [
+                _run(ref, mov, transform, success_error, method=method, levels=method_levels)
+                for transform, (ref, mov) in pairs
+            ]
+            times, errors, successes = zip(*runs)
+            results[method][name] = {
+                "time": float(np.sum(times)),
+                "success_rate": float(np.mean(successes)),
+                "mean_error": float(np.mean(errors)),
+            }
+        results[method]["speedup"] = (
+            results[method]["single"]["time"] / results[method]["pyramid"]["time"]
+        )
+    return results
+
+
+def _random_transform(kind: str, shape: tuple, max_shift: float, max_rotation: float, rng):
+    """Random ``translation`` or ``rigid`` transformation, rotating about the image centre."""
+    angle = rng.uniform(0, 2 * np.pi)
+    shift = rng.uniform(0.1, 1.0) * max_shift
+    translation = sktransform.EuclideanTransform(
+        translation=(shift * np.cos(angle), shift * np.sin(angle))
+    )
+    if kind == "translation":
+        return sktransform.AffineTransform(matrix=translation.params)
+    if kind == "rigid":
+        center = np.array(shape[::-1]) / 2 - 0.5
+        rotation = (
+            sktransform.EuclideanTransform(translation=center).params
+            @ sktransform.EuclideanTransform(
+                rotation=np.deg2rad(rng.uniform(-max_rotation, max_rotation))
+            ).params
+            @ sktransform.EuclideanTransform(translation=-center).params
+        )
+        return sktransform.AffineTransform(matrix=rotation @ translation.params)
+    raise ValueError(f"Unknown transformation: {kind}")
+
+
+def benchmark_methods(
+    methods: tuple = AUTO_METHODS,
+    sizes: tuple = (256, 512),
+    noises: tuple = (0.0, 0.5),
+    transforms: tuple = ("translation", "rigid"),
+    repeats: int = 3,
+    max_shift: float = 12.0,
+    max_rotation: float = 3.0,
+    success_error: float = 1.0,
+    **kwargs,
+):
+    """Time every ``align_auto`` method on the same synthetic pairs with known transformations and
+    record the registration error.
+
+    Parameters
+    ----------
+    methods : tuple, optional
+        ``align_auto`` methods. The default is all of them.
+    sizes : tuple, optional
+        Sizes of the square images. The default is (256, 512).
+    noises : tuple, optional
+        Noise levels relative to the texture, see ``synthetic_pair``. The default is (0, 0.5).
+    transforms : tuple, optional
+        Kinds of transformation, ``translation`` and ``rigid``.
+    repeats : int, optional
+        Number of pairs for every size, noise level and transformation. The default is 3.
+    max_shift : float, optional
+        Largest translation in pixels. The default is 12.
+    max_rotation : float, optional
+        Largest rotation in degrees of the ``rigid`` transformations. The default is 3.
+    success_error : float, optional
+        Registration error in pixels below which the registration is successful. The default is 1.
+    **kwargs
+        Further parameters of ``align_auto``, such as ``sub_pixel_factor`` or ``levels``.
+
+    Returns
+    -------
+    records : list
+        One dict per registration with the ``method``, ``size``, ``noise``, ``transform`` kind,
+        ``time`` in seconds, registration ``error`` in pixels and ``success``. Methods raising an
+        exception have ``error`` None.
+
+    """
+    rng = np.random.default_rng(0)
+    records = []
+    for size in sizes:
+        shape = (size, size)
+        for noise in noises:
+            for kind in transforms:
+                for repeat in range(repeats):
+                    transform = _random_transform(kind, shape, max_shift, max_rotation, rng)
+                    ref, mov = synthetic_pair(shape, transform, noise=noise, seed=len(records))
+                    for method in methods:
+                        record = {"method": method, "size": size, "noise": noise,
+                                  "transform": kind, "repeat": repeat}
+                        try:
+                            elapsed, error, success = _run(
+                                ref, mov, transform, success_error, method=method, **kwargs
+                            )
+                        except Exception as error:  # pylint: disable=broad-except
+                            print(f"{method} failed: {error}")
+                            elapsed, error, success = np.nan, None, False
+                        record.update(time=elapsed, error=error, success=bool(success))
+                        records.append(record)
+    return records
+
+
+def summarise(records: list):
+    """Aggregate the records of ``benchmark_methods`` by method, size, noise and transformation.
+
+    Returns
+    -------
+    summary : list
+        One dict per group with the median ``time``, the ``median_error``, the ``max_error`` and
+        the ``success_rate``.
+
+    """
+    groups = {}
+    for record in records:
+        key = (record["method"], record["size"], record["noise"], record["transform"])
+        groups.setdefault(key, []).append(record)
+    summary = []
+    for (method, size, noise, kind), group in groups.items():
+        errors = np.array([np.inf if r["error"] is None else r["error"] for r in group])
+        summary.append({
+            "method": method,
+            "size": size,
+            "noise": noise,
+            "transform": kind,
+            "time": float(np.nanmedian([r["time"] for r in group])),
+            "median_error": float(np.median(errors)),
+            "max_error": float(errors.max()),
+            "success_rate": float(np.mean([r["success"] for r in group])),
+        })
+    return summary
+
+
+def format_table(summary: list):
+    """Format the output of ``summarise`` as a plain text table."""
+    header = (f"{'method':28s} {'size':>5s} {'noise':>5s} {'transform':>11s} {'time [ms]':>10s} "
+              f"{'median err':>10s} {'max err':>8s} {'success':>7s}")
+    lines = [header, "-" * len(header)]
+    for row in summary:
+        lines.append(
+            f"{row['method']:28s} {row['size']:5d} {row['noise']:5.2f} {row['transform']:>11s} "
+            f"{1e3 * row['time']:10.1f} {row['median_error']:10.3f} {row['max_error']:8.3f} "
+            f"{row['success_rate']:7.2f}"
+        )
+    return "\n".join(lines)
+
+
+def _finite(row: dict):
+    """Copy of a record or summary row with the NaN and infinite values replaced by None."""
+    return {
+        key: None if isinstance(value, float) and not np.isfinite(value) else value
+        for key, value in row.items()
+    }
+
+
+def save_json(records: list, path: str, **config):
+    """Save the records of ``benchmark_methods``, their summary and the benchmark configuration
+    to a JSON file. Times and errors of failed registrations, NaN or infinite, are saved as null,
+    the file is strict JSON.
+
+    """
+    summary = [_finite(row) for row in summarise(records)]
+    records = [_finite(record) for record in records]
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(
+            {"config": config, "summary": summary, "records": records},
+            file,
+            indent=2,
+            allow_nan=False,
+        )
+
+
+def benchmark_redraw(shape: tuple = (2048, 2048), rebin: int = 4, n_frames: int = 50):
+    """Frame rate of the ``FineAlignments`` window for key presses, redrawing the whole canvas
+    (``full``) and blitting the moving image over the cached background (``blit``). Every frame
+    shows a new translation, so the frame cache of the ``ImageTransformer`` is not used.
+    The window is rendered off-screen, matplotlib is switched to the ``agg`` backend.
+
+    Returns
+    -------
+    results : dict
+        ``full`` and ``blit`` dictionaries with the ``fps`` and the ``mean_ms`` of a frame.
+
+    """
+    # pylint: disable=import-outside-toplevel
+    import matplotlib.pyplot as plt
+    from align_panel.align.fine import FineAlignments
+
+    plt.switch_backend("agg")
+    ref_image, mov_image = synthetic_pair(shape, margin=16)
+    aligner = FineAlignments(ref_image, mov_image, rebin=rebin, show_result=False)
+    canvas = aligner._figure.canvas
+    canvas.draw()
+    results = {}
+    for name, redraw in (("full", canvas.draw), ("blit", aligner._blit.update)):
+        start = time.perf_counter()
+        for _ in range(n_frames):
+            aligner._trans.translate(xshift=1.0)
+            aligner._show_transformed()
+            redraw()
+        mean = (time.perf_counter() - start) / n_frames
+        results[name] = {"fps": 1.0 / mean, "mean_ms": 1e3 * mean}
+    plt.close(aligner._figure)
+    return results
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Benchmark of the align_auto methods.")
+    parser.add_argument("--methods", nargs="+", default=list(AUTO_METHODS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[256, 512])
+    parser.add_argument("--noise", nargs="+", type=float, default=[0.0, 0.5])
+    parser.add_argument("--transforms", nargs="+", default=["translation", "rigid"])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", help="path of the JSON output")
+    parser.add_argument("--pyramid", action="store_true",
+                        help="compare single scale and pyramid registration instead")
+    parser.add_argument("--redraw", action="store_true",
+                        help="measure the frame rate of the FineAlignments window instead")
+    args = parser.parse_args()
+
+    if args.redraw:
+        for name, result in benchmark_redraw().items():
+            print(f"{name:5s} {result['fps']:7.1f} fps {result['mean_ms']:7.2f} ms per frame")
+        return
+    if args.pyramid:
+        for method_name, result in benchmark_pyramid().items():
+            print(
+                f"{method_name:28s} speedup {result['speedup']:5.2f}  "
+                f"success single {result['single']['success_rate']:.2f} "
+                f"pyramid {result['pyramid']['success_rate']:.2f}"
+            )
+        return
+    config = {"methods": args.methods, "sizes": args.sizes, "noises": args.noise,
+              "transforms": args.transforms, "repeats": args.repeats}
+    records = benchmark_methods(**config)
+    print(format_table(summarise(records)))
+    if args.json:
+        save_json(records, args.json, **config)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,283 @@
+""" Module containing the BlitManager class, which redraws only the moving artists of the
+interactive aligners. The static part of the figure (reference image, axes, sliders) is rendered
+once and cached, every update restores it and draws the moving artists on top of it.
+
+Based on the matplotlib blitting tutorial:
+https://matplotlib.org/stable/users/explain/animations/blitting.html
+
+"""
+
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _is_interactive(canvas):
+    """True if the timers of ``canvas`` are fired by an event loop, i.e. for the GUI backends and
+    the web backends (webagg, nbagg, ipympl)."""
+    if canvas.required_interactive_framework is not None:
+        return True
+    try:
+        from matplotlib.backends.backend_webagg_core import FigureCanvasWebAggCore
+    except ImportError:
+        return False
+    return isinstance(canvas, FigureCanvasWebAggCore)
+
+
+def _single_shot_timer(figure, interval: int, callback):
+    """Single shot timer of the canvas of ``figure`` running ``callback`` from the event loop after
+    ``interval`` milliseconds. None for non-interactive backends, whose timers never fire.
+
+    """
+    if not _is_interactive(figure.canvas):
+        return None
+    timer = figure.canvas.new_timer(interval=interval)
+    timer.single_shot = True
+    timer.add_callback(callback)
+    return timer
+
+
+class BlitManager:
+    """Blitting of animated artists with coalescing of update requests. Requests arriving while an
+    update is pending, e.g. from a held-down key, are merged into one update of the latest state.
+
+    Attributes
+    ----------
+    _figure : matplotlib.figure.Figure
+        Figure object.
+    _artists : list
+        Animated artists, drawn over the cached background.
+    _background : object
+        Cached background of the figure, None before the first full draw.
+    _pending : list
+        Callbacks of the requested update, None if no update is pending.
+    _timer : matplotlib.backend_bases.TimerBase
+        Single shot timer running the pending update from the event loop, None for
+        non-interactive backends.
+    _stats : dict
+        Dictionary containing the durations of the recent updates, the number of updates and the
+        number of coalesced requests.
+
+    """
+
+    def __init__(self, figure, artists: tuple = (), history: int = 100):
+        """
+        Parameters
+        ----------
+        figure : matplotlib.figure.Figure
+            Figure with the artists.
+        artists : tuple, optional
+            Artists to be animated, more can be added by ``add_artist``.
+        history : int, optional
+            Number of update durations kept for the frame rate. The default is 100.
+
+        """
+        self._figure = figure
+        self._artists = []
+        self._background = None
+        self._pending = None
+        self._stats = {"durations": deque(maxlen=history), "updates": 0, "coalesced": 0}
+        for artist in artists:
+            self.add_artist(artist)
+        self._timer = _single_shot_timer(figure, 0, self._run_pending)
+        figure.canvas.mpl_connect("draw_event", self._on_draw)
+
+    @property
+    def _canvas(self):
+        return self._figure.canvas
+
+    @property
+    def supports_blit(self):
+        return getattr(self._canvas, "supports_blit", False)
+
+    def add_artist(self, artist):
+        """Animate an artist, it is drawn over the cached background on every update."""
+        artist.set_animated(True)
+        self._artists.append(artist)
+
+    def _on_draw(self, event):
+        """Callback for draw events, caches the background and draws the animated artists."""
+        del event
+        if self.supports_blit:
+            self._background = self._canvas.copy_from_bbox(self._figure.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for artist in self._artists:
+            self._figure.draw_artist(artist)
+
+    def update(self):
+        """Redraw the animated artists. Without a cached background, the whole figure is drawn."""
+        start = time.perf_counter()
+        if self._background is None or not self.supports_blit:
+            self._canvas.draw()
+        else:
+            self._canvas.restore_region(self._background)
+            self._draw_animated()
+            self._canvas.blit(self._figure.bbox)
+        self._canvas.flush_events()
+        self._stats["durations"].append(time.perf_counter() - start)
+        self._stats["updates"] += 1
+
+    def request_update(self, *callbacks):
+        """Request an update, run from the event loop once the pending events are handled.
+        ``callbacks`` prepare the artists, e.g. set the data of an image, and run only once per
+        update, so the work of coalesced requests is skipped. For non-interactive backends the
+        update runs immediately.
+
+        """
+        if self._pending is not None:
+            self._stats["coalesced"] += 1
+            self._pending.extend(cb for cb in callbacks if cb not in self._pending)
+            return
+        self._pending = list(callbacks)
+        if self._timer is None:
+            self._run_pending()
+        else:
+            self._timer.start()
+
+    def _run_pending(self):
+        callbacks, self._pending = self._pending or [], None
+        for callback in callbacks:
+            callback()
+        self.update()
+
+    def frame_rate(self):
+        """Statistics of the recent updates.
+
+        Returns
+        -------
+        stats : dict
+            ``fps`` frames per second, ``mean_ms`` and ``max_ms`` duration of an update,
+            ``updates`` number of updates and ``coalesced`` number of merged requests.
+
+        """
+        durations = self._stats["durations"]
+        mean = sum(durations) / len(durations) if durations else float("nan")
+        return {
+            "fps": 1.0 / mean if durations else float("nan"),
+            "mean_ms": 1e3 * mean,
+            "max_ms": 1e3 * max(durations, default=float("nan")),
+            "updates": self._stats["updates"],
+            "coalesced": self._stats["coalesced"],
+        }
+
+
+class DebouncedTask:
+    """Computation on a background thread for the latest of a stream of requests, e.g. an automatic
+    alignment while a selector is dragged. The computation starts once the requests pause for
+    ``delay`` milliseconds, a queued computation of an older request is cancelled and the result of
+    a computation overtaken by a newer request is dropped. Results are applied from the event loop,
+    where the artists can be changed safely.
+
+    Attributes
+    ----------
+    _compute : callable
+        Computation, called on the background thread with the arguments of the request.
+    _apply : callable
+        Called from the event loop with the result of the latest request.
+    _args : tuple
+        Arguments of the latest request.
+    _generation : int
+        Number of the latest request, results of older requests are stale.
+    _future : tuple
+        Number of the request and ``concurrent.futures.Future`` of the running computation, None
+        if no computation is running.
+    _timers : dict
+        Single shot ``debounce`` and ``poll`` timers, None for non-interactive backends.
+    _stats : dict
+        Numbers of the ``requests``, the ``submitted``, ``cancelled``, ``dropped`` and ``applied``
+        computations.
+
+    """
+
+    def __init__(self, figure, compute, apply, delay: int = 150, poll: int = 25):
+        """
+        Parameters
+        ----------
+        figure : matplotlib.figure.Figure
+            Figure whose event loop applies the results.
+        compute : callable
+            Computation, it must not change the figure.
+        apply : callable
+            Called with the result of the computation, e.g. to update the artists.
+        delay : int, optional
+            Pause of the requests in milliseconds before the computation starts. The default is
+            150.
+        poll : int, optional
+            Interval in milliseconds of the checks for a finished computation. The default is 25.
+
+        """
+        self._compute = compute
+        self._apply = apply
+        self._args = ()
+        self._generation = 0
+        self._future = None
+        self._timers = {
+            "debounce": _single_shot_timer(figure, delay, self._submit),
+            "poll": _single_shot_timer(figure, poll, self._poll),
+        }
+        # one worker, the computations of successive requests never run concurrently
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._stats = dict.fromkeys(("requests", "submitted", "cancelled", "dropped", "applied"), 0)
+
+    @property
+    def stats(self):
+        return dict(self._stats)
+
+    def request(self, *args):
+        """Request the computation with ``args``, replacing the previous request. For
+        non-interactive backends the computation runs and is applied immediately.
+
+        """
+        self._args = args
+        self._generation += 1
+        self._stats["requests"] += 1
+        debounce = self._timers["debounce"]
+        if debounce is None:
+            self._stats["submitted"] += 1
+            self._finish(self._compute(*args))
+            return
+        debounce.stop()
+        debounce.start()
+
+    def _submit(self):
+        """Start the computation of the latest request, cancel the queued older one."""
+        if self._future is not None and self._future[1].cancel():
+            self._stats["cancelled"] += 1
+        future = self._executor.submit(self._compute, *self._args)
+        self._future = (self._generation, future)
+        self._stats["submitted"] += 1
+        self._timers["poll"].start()
+
+    def _poll(self):
+        """Apply the finished computation, if it belongs to the latest request."""
+        if self._future is None:
+            return
+        generation, future = self._future
+        if not future.done():
+            self._timers["poll"].start()
+            return
+        self._future = None
+        if future.cancelled() or generation != self._generation:
+            # the newer request is submitted by its own debounce timer
+            self._stats["dropped"] += 1
+            return
+        self._finish(future.result())
+
+    def _finish(self, result):
+        self._stats["applied"] += 1
+        self._apply(result)
+
+    def close(self):
+        """Stop the timers, cancel the computations and drop their results."""
+        self._generation += 1
+        for timer in self._timers.values():
+            if timer is not None:
+                timer.stop()
+        # with one worker and the older request cancelled on submit, only the latest future can
+        # be queued, cancelled here instead of by shutdown(cancel_futures=True) of Python 3.9
+        if self._future is not None:
+            self._future[1].cancel()
+            self._future = None
+        self._executor.shutdown(wait=False)
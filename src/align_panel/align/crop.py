@@ -8,9 +8,39 @@ import matplotlib.pyplot as plt
 from pystackreg import StackReg
 from hyperspy._signals.signal2d import estimate_image_shift
 from skimage.registration import phase_cross_correlation
-from skimage.transform import rescale
+from skimage.transform import ProjectiveTransform
 from matplotlib.widgets import RectangleSelector
 from align_panel.image_transformer import ImageTransformer
+from align_panel.align.registration import (
+    register_pyramid,
+    RegistrationTarget,
+    fourier_mellin,
+    rotation_scan,
+    rescale_matrix,
+)
+from align_panel.align.metrics import alignment_metrics
+from align_panel.align.results import _AlignmentResults
+from align_panel.align.refine import refine_ecc
+from align_panel.align.preview import preview, preview_extent
+from align_panel.align.blit import DebouncedTask
+from align_panel.align.overlay import OverlayPreview
+from align_panel.align.session import AlignmentSession
+
+
+# methods of ``align_auto``
+AUTO_METHODS = (
+    "PyStackReg_translation",
+    "PyStackReg_rigid",
+    "cross_corelation_hyperspy",
+    "cross_corelation_skimage",
+    "cross_corelation_fft",
+    "fourier_mellin",
+    "rotation_scan",
+    "ecc_affine",
+    "ecc_projective",
+)
+# smallest crop side in preview pixels aligned in the live mode
+MIN_LIVE_CROP = 8
 
 
 def normal_round(number: float):
@@ -19,33 +49,102 @@ def normal_round(number: float):
 
 
 def align_auto(
-    ref_image: np.ndarray, mov_image: np.ndarray, method: str, inverse=True, sub_pixel_factor: int = 2
+    ref_image: np.ndarray,
+    mov_image: np.ndarray,
+    method: str,
+    inverse=True,
+    sub_pixel_factor: int = 2,
+    levels: int = 1,
+    pyramid: str = "binned",
+    max_iter: int = 3,
+    metrics: bool = False,
+    metrics_level: int = 1,
+    initial=None,
 ):
     """Automatic alignment of two images. As an input, the function takes two images, of
     ``numpy array`` type, and the method for alignment.
 
     Parameters
     ----------
-    ref_image : np.ndarray
-        Reference image.
-    mov_image : np.ndarray
+    ref_image : np.ndarray, TransformedView or RegistrationTarget
+        Reference image. A ``RegistrationTarget`` keeps the spectrum of the reference between
+        calls of the ``cross_corelation_fft`` method, its own upsample factor is used.
+    mov_image : np.ndarray or TransformedView
         Image to be aligned.
     method : str
         Method for alignment. The options are: ``PyStackReg_translation``, ``PyStackReg_rigid``,
-        ``cross_corelation_hyperspy``, ``cross_corelation_skimage`` and ``None``.
+        ``cross_corelation_hyperspy``, ``cross_corelation_skimage``, ``cross_corelation_fft``,
+        ``fourier_mellin``, ``rotation_scan``, ``ecc_affine``, ``ecc_projective`` and ``None``.
+        ``fourier_mellin`` recovers rotation, scale and translation, ``rotation_scan`` searches
+        all rotations, which suits images with weak features. The ``ecc`` methods refine
+        ``initial``, or the translation of ``cross_corelation_fft``, by maximising the correlation
+        coefficient on a pyramid of at least three levels, see ``refine.refine_ecc``.
     inverse : bool, optional
         If True, the image will be inverted before alignment. The default is True.
     sub_pixel_factor : int, optional
         Subpixel factor for cross corelation methods. The default is 2.
+    levels : int, optional
+        Number of pyramid levels. For more than one level, the images are registered coarse to
+        fine, see ``registration.register_pyramid``. The default is 1, single scale registration.
+    pyramid : str, optional
+        Pyramid type, ``binned`` or ``gaussian``. The default is ``binned``.
+    max_iter : int, optional
+        Maximal number of registrations per pyramid level. The default is 3.
+    metrics : bool, optional
+        If True, quality metrics of the alignment are returned as well. The default is False.
+    metrics_level : int, optional
+        Pyramid level of the metrics, see ``metrics.alignment_metrics``. The default is 1.
+    initial : sktransform.AffineTransform, optional
+        Initial transformation of the ``ecc`` methods, e.g. the result of another method.
+        The default is None.
 
     Returns
     -------
     matrix : sktransform.AffineTransform
-        Transformation matrix for the alignment.
+        Transformation matrix for the alignment, ``ProjectiveTransform`` for ``ecc_projective``.
+    metrics : dict
+        Only for ``metrics=True``. Normalised cross-correlation, mutual information, overlap
+        fraction and peak sharpness of the aligned images.
 
     """
+    target = None
+    if isinstance(ref_image, RegistrationTarget):
+        target, ref_image = ref_image, ref_image.ref_image
+    ref_image, mov_image = np.asarray(ref_image), np.asarray(mov_image)
     if inverse:
         mov_image = -mov_image
+    if method.startswith("ecc_"):
+        if initial is None:
+            initial = _align_single(
+                ref_image, mov_image, "cross_corelation_fft", sub_pixel_factor, target
+            )
+        matrix = refine_ecc(
+            ref_image, mov_image, initial, motion=method[len("ecc_") :], levels=max(levels, 3)
+        )
+    elif levels > 1 and method != "None":
+        matrix = register_pyramid(
+            ref_image,
+            mov_image,
+            lambda ref, mov: _align_single(ref, mov, method, sub_pixel_factor),
+            levels=levels,
+            mode=pyramid,
+            max_iter=max_iter,
+        )
+    else:
+        matrix = _align_single(ref_image, mov_image, method, sub_pixel_factor, target)
+    if metrics:
+        return matrix, alignment_metrics(ref_image, mov_image, matrix, level=metrics_level)
+    return matrix
+
+
+def _align_single(
+    ref_image: np.ndarray,
+    mov_image: np.ndarray,
+    method: str,
+    sub_pixel_factor: int,
+    target: RegistrationTarget = None,
+):
+    """Single registration of two images with one of the ``align_auto`` methods."""
     trans = ImageTransformer(mov_image)
     if method == "PyStackReg_translation":
         stack_reg = StackReg(StackReg.TRANSLATION)
@@ -62,18 +161,94 @@ def align_auto(
         shifts = np.flip(shifts[0])
         trans.translate(xshift=shifts[0], yshift=shifts[1])
     elif method == "cross_corelation_skimage":
+        # plain cross correlation, the phase normalisation fails on non-periodic crops
         shifts, error, phasediff = phase_cross_correlation(
-            ref_image, mov_image, upsample_factor=sub_pixel_factor
+            ref_image, mov_image, upsample_factor=sub_pixel_factor, normalization=None
         )
         del error, phasediff
-        trans.translate(xshift=shifts[0], yshift=shifts[1])
+        # shifts are (row, col) of the moving image relative to the reference
+        trans.translate(xshift=-shifts[1], yshift=-shifts[0])
+    elif method == "cross_corelation_fft":
+        if target is None:
+            target = RegistrationTarget(ref_image, upsample_factor=sub_pixel_factor)
+        trans.add_transform(target.transform(mov_image))
+    elif method == "fourier_mellin":
+        trans.add_transform(
+            fourier_mellin(ref_image, mov_image, upsample_factor=max(sub_pixel_factor, 20))
+        )
+    elif method == "rotation_scan":
+        transform, _ = rotation_scan(
+            ref_image, mov_image, upsample_factor=max(sub_pixel_factor, 20)
+        )
+        trans.add_transform(transform)
     elif method == "None":
         trans.add_null_transform()
 
     return trans.get_combined_transform()
 
 
+def _align_crops(
+    images: dict, positions: dict, centers: dict, method: str, inverse: bool, sub_pixel_factor: int
+):
+    """Align the crops of the reference and moving image, the shared part of ``CropAlignments``
+    and its replay. ``positions`` holds the (x0, x1, y0, y1) extents and ``centers`` the (x, y)
+    centers of the crops. Returns the ``ImageTransformer`` of the moving image and the crops.
+
+    """
+    translation = centers["mov"] - centers["ref"]
+    cropped = {
+        name: images[name][
+            positions[name][2] : positions[name][3], positions[name][0] : positions[name][1]
+        ]
+        for name in ("ref", "mov")
+    }
+    trans = ImageTransformer(images["mov"])
+    trans.translate(translation[0], translation[1])
+    matrix = align_auto(cropped["ref"], cropped["mov"], method, inverse, sub_pixel_factor)
+    trans.add_transform(matrix)
+    return trans, cropped
+
+
+def _align_previews(
+    previews: dict, positions: dict, factor: int, method: str, inverse: bool, sub_pixel_factor: int
+):
+    """Align the crops on the previews binned by ``factor``, the live mode of ``CropAlignments``.
+    ``positions`` are the full resolution extents of the crops, the moving crop takes the size of
+    the reference crop. Returns the matrix of the previews, the full resolution transformation and
+    the metrics of the previews, None for crops smaller than ``MIN_LIVE_CROP`` preview pixels or
+    not inside the images.
+
+    """
+    binned = {name: np.asarray(positions[name]) // factor for name in ("ref", "mov")}
+    size = binned["ref"][[1, 3]] - binned["ref"][[0, 2]]
+    binned["mov"][[1, 3]] = binned["mov"][[0, 2]] + size
+    if size.min() < MIN_LIVE_CROP:
+        return None
+    for name in ("ref", "mov"):
+        rows, cols = np.shape(previews[name])[:2]
+        x_0, x_1, y_0, y_1 = binned[name]
+        if min(x_0, y_0) < 0 or x_1 > cols or y_1 > rows:
+            return None
+    # corners of the crops, the translation is exact in preview pixels
+    centers = {name: binned[name][[0, 2]] for name in ("ref", "mov")}
+    trans, _ = _align_crops(previews, binned, centers, method, inverse, sub_pixel_factor)
+    matrix = trans.get_combined_transform().params
+    return {
+        "matrix": matrix,
+        "tmat": ProjectiveTransform(matrix=rescale_matrix(matrix, factor)),
+        "metrics": alignment_metrics(
+            previews["ref"], previews["mov"], matrix, level=0, inverse=inverse
+        ),
+    }
+
+
 class FixedSizeSelector(RectangleSelector):
+    def __init__(self, *args, on_move=None, **kwargs):
+        """Arguments of ``RectangleSelector``, ``on_move`` is called without arguments whenever
+        the rectangle is drawn, moved or resized."""
+        super().__init__(*args, **kwargs)
+        self.on_move = on_move
+
     def _onmove(self, event):
         """Redefining the _onmove method to prevent the rectangle from changing
         shape when moving the center handle when some part of the rectangle is
@@ -93,6 +268,7 @@ class FixedSizeSelector(RectangleSelector):
 
         # Custom behavior only if selector is moving
         if not self._active_handle == "C":
+            self._moved()
             return
 
         # End bbox
@@ -107,6 +283,11 @@ class FixedSizeSelector(RectangleSelector):
             e_y0, e_y1 = s_y0, s_y1
 
         self.extents = e_x0, e_x1, e_y0, e_y1
+        self._moved()
+
+    def _moved(self):
+        if self.on_move is not None:
+            self.on_move()
 
 
 class UnscalableRectangleSelector(FixedSizeSelector):  # need for this class?
@@ -136,12 +317,16 @@ class UnscalableRectangleSelector(FixedSizeSelector):  # need for this class?
         self.update()
 
 
-class CropAlignments:
+class CropAlignments(_AlignmentResults):
     """Class for cropping and aligning images. The class is based on the
     ``matplotlib`` library and uses the ``RectangleSelector`` widget. Input images
     are ``numpy ndarray`` type. Resuls are aligned image and transformation matrix for
     the alignments, or cropped images when only cropping is performed.
 
+    In the live mode, the crops are aligned on the previews on a background thread whenever a
+    selector is moved, and the aligned moving image and the metrics are shown over the reference
+    image, so a poor crop can be corrected before it is confirmed.
+
     Attributes
     ----------
     _image_dict : dict
@@ -159,7 +344,11 @@ class CropAlignments:
        ImageTransformer object. Used for image transformation, contains the moving image,
         transformation matrices and functions for image transformation.
     _results: dict
-        Dictionary containing the transformation matrix and the transformed image.
+        Dictionary containing the transformation matrix, the transformed image, its lazy
+        ``TransformedView`` and the quality metrics of the alignment.
+    _live : dict
+        Dictionary containing the ``DebouncedTask`` of the live mode, the overlay and metrics text
+        artists and the latest live result. Empty if the live mode is off.
 
     """
 
@@ -172,27 +361,33 @@ class CropAlignments:
         inverse: bool = True,
         sub_pixel_factor: int = 2,
         show_result: bool = True,
+        live: bool = False,
     ):
         """
         Parameters
         ----------
-        ref_image : np.ndarray
+        ref_image : np.ndarray or TransformedView
             Reference image.
-        mov_image : np.ndarray
-            Image to be aligned.
+        mov_image : np.ndarray or TransformedView
+            Image to be aligned. A ``TransformedView`` is cropped and transformed lazily, the
+            result is resampled once from its source array.
         rebin : int, optional
             Rebinning factor for the images. The default is 8.
         method : str, optional
             Method for alignment. The options are: ``PyStackReg_translation``, ``PyStackReg_rigid``,
-            ``cross_corelation_hyperspy``, ``cross_corelation_skimage`` and ``None``. The default is
-            "None". For none, only cropping is performed, and corresponding translation is saved in
-            the transformation matrix.
+            ``cross_corelation_hyperspy``, ``cross_corelation_skimage``, ``cross_corelation_fft``,
+            ``fourier_mellin``, ``rotation_scan``, ``ecc_affine``, ``ecc_projective`` and
+            ``None``. The default is "None". For none, only cropping is performed, and
+            corresponding translation is saved in the transformation matrix.
         inverse : bool, optional
             If True, the image will be inverted before alignment. The default is True.
         sub_pixel_factor : int, optional
             Subpixel factor for cross corelation methods. The default is 2.
         show_result : bool, optional
             If True, the result of the alignment will be shown. The default is True.
+        live : bool, optional
+            If True, the crops are aligned on the previews whenever a selector moves and the
+            result is shown over the reference image. The default is False.
 
         """
         self._dict_images = {"ref": ref_image, "mov": mov_image}
@@ -202,6 +397,7 @@ class CropAlignments:
             "inverse": inverse,
             "sub_pixel_factor": sub_pixel_factor,
             "show_result": show_result,
+            "live": live,
         }
         self._positions = {"ref": None, "mov": None}
         self.figure, self.axes = None, None
@@ -209,7 +405,15 @@ class CropAlignments:
         self._cropped_images = {"ref": None, "mov": None}
         self._selectors = []
         self._trans = None
-        self._results = {"tmat": None, "result_image": None}
+        self._live = {}
+        self._results = {
+            "tmat": None,
+            "result_image": None,
+            "result_view": None,
+            "metrics": None,
+            "result_future": None,
+            "overlay": None,
+        }
 
         self._init_plot()
 
@@ -230,23 +434,86 @@ class CropAlignments:
         return self._results["tmat"]
 
     @property
-    def result_image(self):
-        return self._results["result_image"]
+    def live_transform(self):
+        """Full resolution transformation of the latest live alignment of the previews, None if
+        the live mode is off or no crop is selected."""
+        result = self._live.get("result")
+        return None if result is None else result["tmat"]
+
+    @property
+    def live_metrics(self):
+        """Metrics of the latest live alignment on the previews, see ``alignment_metrics``."""
+        result = self._live.get("result")
+        return None if result is None else result["metrics"]
+
+    @property
+    def session(self):
+        """Record of the confirmed crops, which can be replayed without a figure, see
+        ``replay``. None before the crops are confirmed."""
+        if self._positions["ref"] is None:
+            return None
+        return AlignmentSession(
+            "crop",
+            {key: self._params[key] for key in ("rebin", "method", "inverse", "sub_pixel_factor")},
+            {"positions": self._positions, "centers": self._centers},
+            np.shape(self._dict_images["ref"]),
+        )
+
+    @staticmethod
+    def replay(session: AlignmentSession, ref_image, mov_image):
+        """Align two images with the crops of a recorded session, without a figure. The crops
+        are rescaled to images of a different resolution, e.g. the full resolution images of a
+        session recorded on binned images.
+
+        Parameters
+        ----------
+        session : AlignmentSession
+            Session recorded by ``CropAlignments``.
+        ref_image : np.ndarray or TransformedView
+            Reference image.
+        mov_image : np.ndarray or TransformedView
+            Image to be aligned.
+
+        Returns
+        -------
+        results : dict
+            ``tmat`` transformation matrix and ``result_view`` lazy result.
+
+        """
+        scale = session.scale_to(ref_image)
+        inputs = session.inputs
+        positions = {
+            name: np.array([normal_round(scale * x) for x in inputs["positions"][name]])
+            for name in ("ref", "mov")
+        }
+        # both crops keep the same shape
+        sizes = positions["ref"][[1, 3]] - positions["ref"][[0, 2]]
+        positions["mov"][[1, 3]] = positions["mov"][[0, 2]] + sizes
+        centers = {
+            name: np.array([normal_round(scale * x) for x in inputs["centers"][name]])
+            for name in ("ref", "mov")
+        }
+        trans, _ = _align_crops(
+            {"ref": ref_image, "mov": mov_image},
+            positions,
+            centers,
+            session.params["method"],
+            session.params["inverse"],
+            session.params["sub_pixel_factor"],
+        )
+        return {
+            "tmat": trans.get_combined_transform(),
+            "result_view": trans.get_transformed_view(),
+        }
+
+    def _result_images(self):
+        return self._dict_images["ref"], self._dict_images["mov"]
 
     def _init_plot(self):
         """Initialize the plot and the selector widgets. The plot contains the reference
         and moving images. The selector widgets are used for cropping and alignment.
 
         """
-        original_shape = self._dict_images["ref"].shape
-        resized_images = list(
-            map(
-                lambda image: rescale(
-                    image.copy(), 1 / self._rebin, anti_aliasing=False
-                ),
-                self._dict_images.values(),
-            )
-        )
 
         self.figure = plt.figure(layout="constrained")
         self.axes = self.figure.subplots(1, 2)
@@ -254,17 +521,20 @@ class CropAlignments:
         for axis, selector_class, image, name in zip(
             self.axes,
             [FixedSizeSelector, FixedSizeSelector],
-            resized_images,
+            self._dict_images.values(),
             names,
         ):
             axis.imshow(
-                image, cmap="gray", extent=[0, original_shape[1], original_shape[0], 0]
+                preview(image, self._rebin),
+                cmap="gray",
+                extent=preview_extent(image, self._rebin),
             )
             axis.set_title(f"{name}")
             self._selectors.append(
                 selector_class(
                     axis,
                     self._select_callback,
+                    on_move=self._request_live if self._params["live"] else None,
                     useblit=True,
                     button=[1],
                     minspanx=5,
@@ -274,6 +544,8 @@ class CropAlignments:
                     drag_from_anywhere=True,
                 )
             )
+        if self._params["live"]:
+            self._init_live()
         self.figure.canvas.mpl_connect("key_press_event", self._toggle_selector)
         self.figure.canvas.mpl_connect("close_event", self._close_event)
         self.figure.canvas.draw()
@@ -282,6 +554,100 @@ class CropAlignments:
         )
         plt.show()
 
+    def _init_live(self):
+        """Create the background task and the overlay and metrics artists of the live mode."""
+        mov_preview = preview(self._dict_images["mov"], self._rebin)
+        ref_shape = np.shape(preview(self._dict_images["ref"], self._rebin))
+        overlay = self.axes[0].imshow(
+            np.full(ref_shape, np.nan, dtype=np.float32),
+            cmap="gray",
+            alpha=0.5,
+            extent=preview_extent(self._dict_images["ref"], self._rebin),
+            vmin=np.nanmin(mov_preview),
+            vmax=np.nanmax(mov_preview),
+        )
+        overlay.set_visible(False)
+        self._live = {
+            "task": DebouncedTask(self.figure, self._align_live, self._show_live),
+            "trans": ImageTransformer(mov_preview),
+            "shape": ref_shape,
+            "overlay": overlay,
+            "text": self.figure.text(0.5, 0.02, "", ha="center"),
+            "result": None,
+        }
+
+    def _request_live(self):
+        """Callback for moves of the selectors, requests the live alignment of the crops."""
+        positions, _ = self._crop_inputs()
+        self._live["task"].request(positions)
+
+    def _align_live(self, positions: dict):
+        """Live alignment of the crops on the previews, runs on a background thread."""
+        previews = {
+            name: preview(image, self._rebin) for name, image in self._dict_images.items()
+        }
+        return _align_previews(
+            previews,
+            positions,
+            self._rebin,
+            self._method,
+            self._params["inverse"],
+            self._params["sub_pixel_factor"],
+        )
+
+    def _show_live(self, result):
+        """Show the moving preview aligned by the live result and its metrics."""
+        live = self._live
+        live["result"] = result
+        if result is None:
+            live["overlay"].set_visible(False)
+            live["text"].set_text("Live alignment needs crops inside both images.")
+        else:
+            trans = live["trans"]
+            trans.clear_transforms()
+            trans.add_transform(
+                ProjectiveTransform(matrix=result["matrix"]), output_shape=live["shape"]
+            )
+            live["overlay"].set_data(trans.warp_preserving_dtype())
+            live["overlay"].set_visible(True)
+            metrics = result["metrics"]
+            shift = result["tmat"].params[:2, 2]
+            live["text"].set_text(
+                f"Live {self._method}: shift ({shift[0]:.1f}, {shift[1]:.1f}) px, "
+                f"NCC {metrics['ncc']:.3f}, overlap {metrics['overlap']:.0%}"
+            )
+        self.figure.canvas.draw_idle()
+
+    def _crop_inputs(self):
+        """Extents and centers of the selected crops in full resolution pixels. The moving crop
+        takes the size of the reference crop, and its position if it is not drawn yet.
+
+        """
+        selectors = {"ref": self._selectors[0], "mov": self._selectors[1]}
+        x_0, x_1, y_0, y_1 = selectors["mov"].extents
+        if x_1 - x_0 <= 0 or y_1 - y_0 <= 0:
+            selectors["mov"] = selectors["ref"]
+        positions = {
+            name: np.array([normal_round(x) for x in selector.extents])
+            for name, selector in selectors.items()
+        }
+        centers = {
+            name: np.array([normal_round(x) for x in selector.center])
+            for name, selector in selectors.items()
+        }
+        shape_ref = positions["ref"][[1, 3]] - positions["ref"][[0, 2]]
+        shape_mov = positions["mov"][[1, 3]] - positions["mov"][[0, 2]]
+        if np.any(shape_ref != shape_mov):
+            positions["mov"] = np.array(
+                [
+                    normal_round(centers["mov"][0] - shape_ref[0] / 2),
+                    normal_round(centers["mov"][0] + shape_ref[0] / 2),
+                    normal_round(centers["mov"][1] - shape_ref[1] / 2),
+                    normal_round(centers["mov"][1] + shape_ref[1] / 2),
+                ]
+            )
+        return positions, centers
+
     def _select_callback(self, eclick, erelease):
         """Callback for line selection.
 
@@ -293,8 +659,9 @@ class CropAlignments:
     def _toggle_selector(self, event):
         """Callback for key press event. Press 't' to toggle the selector on and off.
         Press 'space' to show the selector widget on the moving image, also to redraw the
-        selector widget. Press 'enter' to save the reference image position and start the
-        alignment. After pressing 'enter', close the figure to continue with the alignment.
+        selector widget. Press 'enter' to save the positions, align the crops and start computing
+        the full resolution result in the background. After pressing 'enter', close the figure
+        to continue.
 
         """
         if event.key == "t":
@@ -313,76 +680,51 @@ class CropAlignments:
             self._selectors[1]._edge_handles.set_data(*self._selectors[0].edge_centers)
             self._selectors[1]._corner_handles.set_data(*self._selectors[0].corners)
             self.figure.canvas.draw()
+            if self._live:
+                self._request_live()
         if event.key == "enter":
-            self._positions["ref"] = np.array(
-                [normal_round(x) for x in self._selectors[0].extents]
-            )
-            self._centers["ref"] = np.array(
-                [normal_round(x) for x in self._selectors[0].center]
-            )
-            self._positions["mov"] = np.array(
-                [normal_round(x) for x in self._selectors[1].extents]
-            )
-            self._centers["mov"] = np.array(
-                [normal_round(x) for x in self._selectors[1].center]
-            )
-            shape_ref = np.array(
-                [
-                    self._positions["ref"][1] - self._positions["ref"][0],
-                    self._positions["ref"][3] - self._positions["ref"][2],
-                ]
-            )
-            shape_mov = np.array(
-                [
-                    self._positions["mov"][1] - self._positions["mov"][0],
-                    self._positions["mov"][3] - self._positions["mov"][2],
-                ]
-            )
-            if np.any(shape_ref != shape_mov):
-                self._positions["mov"][0] = normal_round(
-                    self._centers["mov"][0] - shape_ref[0] / 2
-                )
-                self._positions["mov"][1] = normal_round(
-                    self._centers["mov"][0] + shape_ref[0] / 2
-                )
-                self._positions["mov"][2] = normal_round(
-                    self._centers["mov"][1] - shape_ref[1] / 2
-                )
-                self._positions["mov"][3] = normal_round(
-                    self._centers["mov"][1] + shape_ref[1] / 2
-                )
+            self._positions, self._centers = self._crop_inputs()
+            self._confirm()
             print(
-                "Images are prepared for alignment. Close the plot window to continue."
+                "Images are aligned, the result is computed in the background. "
+                "Close the plot window to continue."
             )
 
     def _close_event(self, event):
-        """Callback for close event. Start the alignment after closing the plot window.
-        
+        """Callback for close event. Align the images after closing the plot window, if they were
+        not aligned by the ``enter`` key.
+
         """
         del event
-        translation = self._centers["mov"] - self._centers["ref"]
-        self._cropped_images["ref"] = self._dict_images["ref"][
-            self._positions["ref"][2] : self._positions["ref"][3],
-            self._positions["ref"][0] : self._positions["ref"][1],
-        ]
-        self._cropped_images["mov"] = self._dict_images["mov"][
-            self._positions["mov"][2] : self._positions["mov"][3],
-            self._positions["mov"][0] : self._positions["mov"][1],
-        ]
-        self._trans = ImageTransformer(self._dict_images["mov"])
-        self._trans.translate(translation[0], translation[1])
-        matrix = align_auto(
-            self._cropped_images["ref"],
-            self._cropped_images["mov"],
+        if self._live:
+            self._live["task"].close()
+        if self.tmat is None:
+            self._confirm()
+        if self._show_result:
+            self._results["overlay"] = OverlayPreview(
+                self._dict_images["ref"],
+                self._dict_images["mov"],
+                self.tmat,
+                inverse=self._params["inverse"],
+            )
+            self._results["overlay"].show()
+            plt.show()
+
+    def _confirm(self):
+        """Align the selected crops and start resampling the full resolution result on a
+        background thread.
+
+        """
+        self._trans, self._cropped_images = _align_crops(
+            self._dict_images,
+            self._positions,
+            self._centers,
             self._method,
             self._params["inverse"],
             self._params["sub_pixel_factor"],
         )
-        self._trans.add_transform(matrix)
         self._results["tmat"] = self._trans.get_combined_transform()
-        self._results["result_image"] = self._trans.get_transformed_image()
-        if self._show_result:
-            plt.figure("result")
-            plt.imshow(self._dict_images["ref"], cmap="gray")
-            plt.imshow(self.result_image, cmap="gray", alpha=0.5)
-            plt.show()
+        self._results["result_view"] = self._trans.get_transformed_view()
+        self._results["result_future"] = self.result_view.materialise_async()
+        self._results["result_image"] = None
+        self._results["metrics"] = None
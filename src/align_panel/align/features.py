@@ -0,0 +1,317 @@
+""" Module containing the automatic point alignment based on image features.
+Keypoints are detected in both images, their descriptors are matched and the matched points are
+used for the alignment with the ImageTransformer class, as the manually defined points of the
+PointAlignments class.
+
+"""
+
+import numpy as np
+import matplotlib.pyplot as plt
+from skimage.feature import ORB, SIFT, BRIEF, corner_harris, corner_peaks
+from align_panel.image_transformer import ImageTransformer
+from align_panel.align.registration import bin_image
+from align_panel.align.results import _AlignmentResults
+from align_panel.align.points import PointAlignments
+from align_panel.align.overlay import OverlayPreview
+
+
+def _normalise(image: np.ndarray):
+    """Scale an image to the range [0, 1], the detectors use absolute thresholds."""
+    image = np.asarray(image, dtype=float)
+    low, high = np.nanmin(image), np.nanmax(image)
+    return (image - low) / (high - low) if high > low else np.zeros_like(image)
+
+
+def available_detectors():
+    """The keypoint detectors of ``detect_features``."""
+    return ["orb", "sift", "harris"]
+
+
+def detect_features(image: np.ndarray, detector: str = "orb", n_keypoints: int = 500):
+    """Detect keypoints and extract their descriptors.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Input image.
+    detector : str, optional
+        ``orb``, ``sift`` or ``harris`` (Harris corners with BRIEF descriptors).
+        The default is ``orb``.
+    n_keypoints : int, optional
+        Maximal number of keypoints. The default is 500.
+
+    Returns
+    -------
+    keypoints : np.ndarray
+        Array of shape (N, 2) with the (x, y) positions of the keypoints.
+    descriptors : np.ndarray
+        Array of shape (N, D), boolean for the binary descriptors of ``orb`` and ``harris``.
+
+    """
+    image = _normalise(image)
+    if detector == "orb":
+        extractor = ORB(n_keypoints=n_keypoints)
+        extractor.detect_and_extract(image)
+        keypoints, descriptors = extractor.keypoints, extractor.descriptors
+    elif detector == "sift":
+        extractor = SIFT(n_octaves=4)
+        extractor.detect_and_extract(image)
+        order = np.argsort(-np.abs(extractor.scales))[:n_keypoints]
+        keypoints, descriptors = extractor.keypoints[order], extractor.descriptors[order]
+    elif detector == "harris":
+        keypoints = corner_peaks(
+            corner_harris(image), min_distance=5, num_peaks=n_keypoints, exclude_border=16
+        )
+        extractor = BRIEF()
+        extractor.extract(image, keypoints)
+        keypoints, descriptors = keypoints[extractor.mask], extractor.descriptors
+    else:
+        raise ValueError(f"Unknown detector: {detector}")
+    return np.asarray(keypoints, dtype=float)[:, ::-1], descriptors
+
+
+def descriptor_distances(descriptors1: np.ndarray, descriptors2: np.ndarray):
+    """All pairwise distances of two sets of descriptors as one matrix product. Hamming distance
+    for binary descriptors, Euclidean distance otherwise.
+
+    """
+    if descriptors1.dtype == bool:
+        first, second = descriptors1.astype(np.float32), descriptors2.astype(np.float32)
+        return first @ (1.0 - second).T + (1.0 - first) @ second.T
+    first, second = descriptors1.astype(np.float64), descriptors2.astype(np.float64)
+    squared = (
+        (first**2).sum(axis=1)[:, np.newaxis]
+        + (second**2).sum(axis=1)[np.newaxis, :]
+        - 2.0 * first @ second.T
+    )
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def match_features(
+    descriptors1: np.ndarray,
+    descriptors2: np.ndarray,
+    max_ratio: float = 0.8,
+    cross_check: bool = True,
+):
+    """Match descriptors by their nearest neighbours.
+
+    Parameters
+    ----------
+    descriptors1, descriptors2 : np.ndarray
+        Descriptors of the first and the second image.
+    max_ratio : float, optional
+        Largest ratio of the distances of the nearest and the second nearest neighbour
+        (Lowe's ratio test). The default is 0.8.
+    cross_check : bool, optional
+        If True, only mutual nearest neighbours are matched. The default is True.
+
+    Returns
+    -------
+    matches : np.ndarray
+        Array of shape (M, 2) with indices into the first and the second descriptors.
+
+    """
+    if len(descriptors1) == 0 or len(descriptors2) == 0:
+        return np.empty((0, 2), dtype=int)
+    distances = descriptor_distances(descriptors1, descriptors2)
+    indices1 = np.arange(distances.shape[0])
+    nearest = np.argmin(distances, axis=1)
+    keep = np.ones(distances.shape[0], dtype=bool)
+    if cross_check:
+        keep &= np.argmin(distances, axis=0)[nearest] == indices1
+    if max_ratio < 1.0 and distances.shape[1] > 1:
+        two_nearest = np.partition(distances, 1, axis=1)[:, :2]
+        keep &= two_nearest[:, 0] < max_ratio * two_nearest[:, 1]
+    return np.stack((indices1[keep], nearest[keep]), axis=1)
+
+
+class FeatureAlignments(_AlignmentResults):
+    """Class for the automatic point alignment of ``two images``, without user interaction.
+    Keypoints are detected in both images, matched by their descriptors, and the matched points
+    are used for the estimation of the transformation with the ``ImageTransformer`` class.
+    The matched points can be reviewed and edited in the ``PointAlignments`` class.
+
+    Attributes
+    ----------
+    _image_dict : dict
+        Dictionary containing the reference and moving images.
+    _params : dict
+        Dictionary containing the rebinning factor, detector, number of keypoints, alignment
+        method, robust estimator, inverse bool parameter and the show_result parameter.
+    _trans : ImageTransformer
+        ImageTransformer object. Used for image transformation, contains the moving image,
+        transformation matrices and functions for image transformation.
+    _points : dict
+        Dictionary containing the matched points of the reference and the moving image.
+    _results : dict
+        Dictionary containing the transformation matrix, the transformed image, its lazy
+        ``TransformedView``, the inlier mask, the point residuals and the quality metrics.
+
+    """
+
+    def __init__(
+        self,
+        ref_image: np.ndarray,
+        mov_image: np.ndarray,
+        rebin: int = 1,
+        detector: str = "orb",
+        n_keypoints: int = 500,
+        method: str = "euclidean",
+        robust: str = "ransac",
+        inverse: bool = False,
+        show_result: bool = False,
+    ):
+        """
+        Parameters
+        ----------
+        ref_image : np.ndarray or TransformedView
+            Reference image.
+        mov_image : np.ndarray or TransformedView
+            Moving image.
+        rebin : int, optional
+            Binning factor of the images used for the detection. The default is 1.
+        detector : str, optional
+            Keypoint detector, ``orb``, ``sift`` or ``harris``. The default is ``orb``.
+        n_keypoints : int, optional
+            Maximal number of keypoints per image. The default is 500.
+        method : str, optional
+            Alignment method. The default is ``euclidean``.
+            All options are ``['affine', 'euclidean', 'similarity', 'projective']``.
+        robust : str, optional
+            Outlier rejection, ``ransac``, ``lmeds`` or None for plain least squares.
+            The default is ``ransac``.
+        inverse : bool, optional
+            If True, the contrast of the moving image is inverted before the detection.
+            The default is False.
+        show_result : bool, optional
+            If True, the result of the alignment is shown. The default is False.
+
+        """
+        self._image_dict = {"ref": ref_image, "mov": mov_image}
+        self._params = {
+            "rebin": rebin,
+            "detector": detector,
+            "n_keypoints": n_keypoints,
+            "method": method,
+            "robust": robust,
+            "inverse": inverse,
+            "show_result": show_result,
+        }
+        self._trans = ImageTransformer(self._image_dict["mov"])
+        self._points = {"ref": None, "mov": None}
+        self._results = {
+            "tmat": None,
+            "result_image": None,
+            "result_view": None,
+            "inliers": None,
+            "residuals": None,
+            "metrics": None,
+            "result_future": None,
+            "overlay": None,
+        }
+
+        self._align()
+
+    @property
+    def _rebin(self):
+        return self._params["rebin"]
+
+    @property
+    def _method(self):
+        return self._params["method"]
+
+    @property
+    def tmat(self):
+        return self._results["tmat"]
+
+    @property
+    def ref_points(self):
+        return self._points["ref"]
+
+    @property
+    def mov_points(self):
+        return self._points["mov"]
+
+    @property
+    def inliers(self):
+        """Boolean mask of the matched points used for the transform."""
+        return self._results["inliers"]
+
+    @property
+    def residuals(self):
+        """Distance in pixels of each matched pair from the estimated transform."""
+        return self._results["residuals"]
+
+    def _detect(self, image: np.ndarray, sign: float = 1.0):
+        """Detect features on the binned image, return full resolution positions."""
+        image = bin_image(sign * np.asarray(image), self._rebin)
+        keypoints, descriptors = detect_features(
+            image, self._params["detector"], self._params["n_keypoints"]
+        )
+        return self._rebin * keypoints + (self._rebin - 1) / 2, descriptors
+
+    def _align(self):
+        """Detect and match the features, estimate the transformation."""
+        ref_keypoints, ref_descriptors = self._detect(self._image_dict["ref"])
+        sign = -1.0 if self._params["inverse"] else 1.0
+        mov_keypoints, mov_descriptors = self._detect(self._image_dict["mov"], sign)
+        matches = match_features(ref_descriptors, mov_descriptors)
+        self._points["ref"] = ref_keypoints[matches[:, 0]]
+        self._points["mov"] = mov_keypoints[matches[:, 1]]
+        if self._params["robust"]:
+            _, inliers, residuals = self._trans.estimate_transform_robust(
+                self.ref_points,
+                self.mov_points,
+                method=self._method,
+                robust=self._params["robust"],
+                residual_threshold=max(self._rebin, 2),
+            )
+        else:
+            transform = self._trans.estimate_transform(
+                self.ref_points, self.mov_points, method=self._method
+            )
+            inliers = np.ones(len(self.ref_points), dtype=bool)
+            residuals = np.hypot(*(transform(self.ref_points) - self.mov_points).T)
+        self._results["inliers"] = inliers
+        self._results["residuals"] = residuals
+        self._results["tmat"] = self._trans.get_combined_transform()
+        self._results["result_view"] = self._trans.get_transformed_view()
+        self._results["result_future"] = self.result_view.materialise_async()
+        if self._params["show_result"]:
+            self._results["overlay"] = OverlayPreview(
+                self._image_dict["ref"],
+                self._image_dict["mov"],
+                self.tmat,
+                inverse=self._params["inverse"],
+            )
+            self._results["overlay"].show(title="Result of alignment")
+            plt.show()
+
+    def review(self, rebin: int = 8, inliers_only: bool = True, show_result: bool = True):
+        """Open the ``PointAlignments`` window seeded with the matched points, which can be
+        dragged, deleted or complemented before the transformation is estimated again.
+
+        Parameters
+        ----------
+        rebin : int, optional
+            Rebinning factor of the displayed images. The default is 8.
+        inliers_only : bool, optional
+            If True, only the inliers of the estimation are shown. The default is True.
+        show_result : bool, optional
+            If True, the result of the alignment is shown. The default is True.
+
+        Returns
+        -------
+        point_alignments : PointAlignments
+            The closed point alignment, with its results.
+
+        """
+        keep = self.inliers if inliers_only else np.ones(len(self.ref_points), dtype=bool)
+        return PointAlignments(
+            self._image_dict["ref"],
+            self._image_dict["mov"],
+            rebin,
+            method=self._method,
+            show_result=show_result,
+            points=(self.ref_points[keep], self.mov_points[keep]),
+        )
@@ -8,21 +8,95 @@ import matplotlib.pyplot as plt
 import matplotlib as mpl
 import numpy as np
 from matplotlib.widgets import Slider
-from skimage.transform import rescale
+from skimage.transform import AffineTransform
 from align_panel.image_transformer import ImageTransformer
+from align_panel.align.results import _AlignmentResults
+from align_panel.align.refine import refine_ecc
+from align_panel.align.registration import rescale_matrix
+from align_panel.align.blit import BlitManager
+from align_panel.align.preview import preview
+from align_panel.align.session import AlignmentSession
+from align_panel.align.overlay import OverlayPreview
 
 mpl.rcParams["path.simplify"] = True
 mpl.rcParams["path.simplify_threshold"] = 1.0
 
+# keys changing the transformation and the step size they use
+STEP_KEYS = {
+    "up": "translate",
+    "down": "translate",
+    "left": "translate",
+    "right": "translate",
+    "r": "rotate",
+    "e": "rotate",
+    "-": "scale",
+    "+": "scale",
+    "escape": None,
+    "ctrl+z": None,
+    "ctrl+y": None,
+    "a": None,
+}
 
-class FineAlignments:
+
+def _apply_key(trans: ImageTransformer, key: str, step: float, rebinned: dict, motion: str):
+    """Apply the step of ``key`` to the transformation of the rebinned moving image, the shared
+    part of ``FineAlignments`` and its replay. ``step`` is the step size of the key, see
+    ``STEP_KEYS``, ``rebinned`` holds the rebinned images for the automatic refinement.
+
+    """
+    if key == "up":
+        trans.translate(xshift=0.0, yshift=+step)
+    elif key == "down":
+        trans.translate(xshift=0.0, yshift=-step)
+    elif key == "left":
+        trans.translate(xshift=0.0 + step, yshift=0.0)
+    elif key == "right":
+        trans.translate(xshift=0.0 - step, yshift=0.0)
+    elif key == "r":
+        trans.rotate_about_center(rotation_degrees=-step)
+    elif key == "e":
+        trans.rotate_about_center(rotation_degrees=step)
+    elif key == "-":
+        trans.uniform_scale_centered(scale_factor=1 / step)
+    elif key == "+":
+        trans.uniform_scale_centered(scale_factor=step)
+    elif key == "escape":
+        trans.clear_transforms()
+    elif key == "ctrl+z":
+        trans.undo()
+    elif key == "ctrl+y":
+        trans.redo()
+    elif key == "a":
+        # the refinement is added as a single step, so it can be undone
+        current = trans.get_combined_transform()
+        refined = refine_ecc(rebinned["ref"], rebinned["mov"], current, motion=motion, levels=2)
+        trans.add_transform(np.linalg.inv(current.params) @ refined.params)
+
+
+def _full_resolution(trans: ImageTransformer, rebin: float, mov_image):
+    """Transformation of the rebinned images scaled to the full resolution, with the pixel centres
+    of the block-mean previews, see ``registration.rescale_matrix``, and the ``ImageTransformer``
+    of the full moving image.
+
+    """
+    tmat = AffineTransform(matrix=rescale_matrix(trans.get_combined_transform().params, rebin))
+    full = ImageTransformer(mov_image)
+    full.add_transform(tmat)
+    return tmat, full
+
+
+class FineAlignments(_AlignmentResults):
     """Class for fine alignment of ``two images``. The inputs are two images, of ``numpy ndarray`` 
     type, and the rebinning factor. The rebinning factor is used to speed up the alignment 
     process. the fine alignments are achieved by using the ImageTransformer class. User can 
     use the keyboard to translate, rotate and scale the image.
     For translation, the ``arrow keys`` are used. For rotation, the `r`` (right) and ``e`` (left)
     keys are used. To scale the image, the ``+`` and ``-`` keys are used. The ``enter`` key prints
-    the current transformation matrix. The ``escape`` key clears the transformation matrix.
+    the current transformation matrix and starts computing the full resolution result in the
+    background. The ``escape`` key clears the transformation matrix.
+    ``ctrl+z`` undoes the last step and ``ctrl+y`` redoes it, previously rendered frames are
+    taken from the cache of the ImageTransformer. The ``a`` key refines the current alignment
+    automatically, see ``refine.refine_ecc``.
     Steps can be changed with sliders, which are displayed below the image.
     Results are transformation matrix and the transformed image.
 
@@ -31,7 +105,8 @@ class FineAlignments:
     _image_dict : dict
         Dictionary containing the reference and moving images.
     _params : dict
-        Dictionary containing the rebinning factor and the show_result parameter.
+        Dictionary containing the rebinning factor, the show_result parameter and the motion
+        model of the automatic refinement.
     _steps : dict
         Dictionary containing the steps for translation, rotation and scaling.
     _figure : matplotlib.figure.Figure
@@ -39,12 +114,21 @@ class FineAlignments:
     _axes : matplotlib.axes.Axes
         Axes object.
     _image1 : matplotlib.image.AxesImage
-        Image object.
+        Image object of the moving image, the only artist redrawn on key presses.
+    _blit : BlitManager
+        Redraws the moving image over the cached reference image, axes and sliders, and merges
+        the redraws of repeated key presses.
+    _rebinned : dict
+        Dictionary containing the rebinned reference and moving images.
     _trans : ImageTransformer
         ImageTransformer object. Used for image transformation, contains the moving image, 
         transformation matrices and functions for image transformation.
+    _keys : list
+        Pressed keys which changed the transformation and their step sizes, recorded for the
+        ``session``.
     _results : dict
-        Dictionary containing the transformation matrix and the transformed image.
+        Dictionary containing the transformation matrix, the transformed image, its lazy
+        ``TransformedView`` and the quality metrics of the alignment.
 
     Methods
     -------
@@ -67,27 +151,43 @@ class FineAlignments:
         mov_image: np.ndarray,
         rebin: int = 8,
         show_result: bool = True,
+        refine: str = "affine",
     ):
         """
         Parameters
         ----------
-        ref_image : np.ndarray
+        ref_image : np.ndarray or TransformedView
             Reference image.
-        mov_image : np.ndarray
-            Moving image.
+        mov_image : np.ndarray or TransformedView
+            Moving image. For a ``TransformedView``, the result is resampled once from its
+            source array.
         rebin : int
             Rebinning factor.
         show_result : bool, optional
             If True, the result is displayed in a new window. The default is True.
+        refine : str, optional
+            Motion model of the automatic refinement, ``translation``, ``affine`` or
+            ``projective``. The default is ``affine``.
 
         """
         self._image_dict = {"ref": ref_image, "mov": mov_image}
-        self._params = {"rebin": rebin, "show_result": show_result}
+        self._params = {"rebin": rebin, "show_result": show_result, "refine": refine}
         self._steps = {"translate": 5, "rotate": 2.5, "scale": 0.75}
+        self._cache_bytes = 256 * 2**20
         self._figure, self._axes = None, None
         self._image1 = None
+        self._blit = None
+        self._rebinned = {"ref": None, "mov": None}
         self._trans = None
-        self._results = {"tmat": None, "result_image": None}
+        self._keys = []
+        self._results = {
+            "tmat": None,
+            "result_image": None,
+            "result_view": None,
+            "metrics": None,
+            "result_future": None,
+            "overlay": None,
+        }
 
         self._init_plot()
 
@@ -99,14 +199,61 @@ class FineAlignments:
     def _show_result(self):
         return self._params["show_result"]
 
-    @property
-    def result_image(self):
-        return self._results["result_image"]
-
     @property
     def tmat(self):
         return self._results["tmat"]
 
+    @property
+    def session(self):
+        """Record of the pressed keys, which can be replayed without a figure, see ``replay``."""
+        return AlignmentSession(
+            "fine",
+            {"rebin": self._rebin, "refine": self._params["refine"]},
+            {"keys": self._keys},
+            np.shape(self._image_dict["ref"]),
+        )
+
+    @staticmethod
+    def replay(session: AlignmentSession, ref_image, mov_image):
+        """Repeat the key steps of a recorded session on two images, without a figure. For
+        images of a different resolution, the rebinning factor is chosen for rebinned images of
+        the recorded size and the translations are rescaled. The automatic refinement runs on
+        the new images.
+
+        Parameters
+        ----------
+        session : AlignmentSession
+            Session recorded by ``FineAlignments``.
+        ref_image : np.ndarray or TransformedView
+            Reference image.
+        mov_image : np.ndarray or TransformedView
+            Moving image.
+
+        Returns
+        -------
+        results : dict
+            ``tmat`` transformation matrix and ``result_view`` lazy result.
+
+        """
+        recorded = session.params["rebin"] * session.scale_to(ref_image)
+        rebin = max(1, int(round(recorded)))
+        rebinned = {
+            "ref": preview(ref_image, rebin),
+            "mov": preview(mov_image, rebin).copy(),
+        }
+        trans = ImageTransformer(rebinned["mov"])
+        for key, step in session.inputs["keys"]:
+            if STEP_KEYS.get(key) == "translate":
+                step = step * recorded / rebin
+            _apply_key(trans, key, step, rebinned, session.params["refine"])
+        tmat, full = _full_resolution(trans, rebin, mov_image)
+        return {"tmat": tmat, "result_view": full.get_transformed_view()}
+
+    @property
+    def frame_rate(self):
+        """Frame rate statistics of the redraws, see ``BlitManager.frame_rate``."""
+        return self._blit.frame_rate() if self._blit is not None else None
+
     def _init_plot(self):
         """Initializes the plot. The reference image is displayed in the background. The moving
         image is displayed in the foreground. The moving image is transformed with the
@@ -114,17 +261,18 @@ class FineAlignments:
         image.
 
         """
-        ref_image = rescale(
-            self._image_dict["ref"].copy(), 1 / self._rebin, anti_aliasing=False
-        )
-        mov_image = rescale(
-            self._image_dict["mov"].copy(), 1 / self._rebin, anti_aliasing=False
-        )
+        ref_image = preview(self._image_dict["ref"], self._rebin)
+        # the warp of skimage needs a writeable image, the shared previews are read-only
+        mov_image = preview(self._image_dict["mov"], self._rebin).copy()
+        self._rebinned = {"ref": ref_image, "mov": mov_image}
         self._figure, self._axes = plt.subplots()
-        self._trans = ImageTransformer(mov_image)
-        self._image1 = plt.imshow(mov_image, cmap="gray", interpolation="none")
+        self._trans = ImageTransformer(mov_image, cache_bytes=self._cache_bytes)
+        # the moving image is drawn over the static reference with the complementary alpha,
+        # which gives the same overlay as the reference over the moving image
+        plt.imshow(ref_image, cmap="gray", interpolation="none")
+        self._image1 = plt.imshow(mov_image, cmap="gray", alpha=0.6, interpolation="none")
+        self._blit = BlitManager(self._figure, [self._image1])
         self._figure.canvas.mpl_connect("key_press_event", self._on_press)
-        plt.imshow(ref_image, cmap="gray", alpha=0.4, interpolation="none")
         self._figure.canvas.mpl_connect("close_event", self._on_close)
 
         self._figure.subplots_adjust(bottom=0.3, left=0.2)
@@ -161,33 +309,27 @@ class FineAlignments:
         """Callback function for key press events.
         Translation is done with the arrow keys. Rotation is done with the ``r`` and ``e`` keys.
         Scaling is done with the ``+`` and ``-`` keys. The ``enter`` key prints the current
-        transformation matrix. The ``escape`` key clears the transformation matrix.
+        transformation matrix and confirms it, see ``_confirm``. The ``escape`` key clears the
+        transformation matrix, ``ctrl+z`` and ``ctrl+y`` undo and redo single steps. The ``a``
+        key refines the alignment. The keys changing the transformation are recorded for the
+        ``session``. Only the moving image is redrawn, repeated key presses are merged into one
+        redraw.
 
         """
         sys.stdout.flush()
-        if event.key == "up":
-            self._trans.translate(xshift=0.0, yshift=+self._steps["translate"])
-        elif event.key == "down":
-            self._trans.translate(xshift=0.0, yshift=-self._steps["translate"])
-        elif event.key == "left":
-            self._trans.translate(xshift=0.0 + self._steps["translate"], yshift=0.0)
-        elif event.key == "right":
-            self._trans.translate(xshift=0.0 - self._steps["translate"], yshift=0.0)
-        elif event.key == "r":
-            self._trans.rotate_about_center(rotation_degrees=-self._steps["rotate"])
-        elif event.key == "e":
-            self._trans.rotate_about_center(rotation_degrees=self._steps["rotate"])
-        elif event.key == "-":
-            self._trans.uniform_scale_centered(scale_factor=1 / self._steps["scale"])
-        elif event.key == "+":
-            self._trans.uniform_scale_centered(scale_factor=self._steps["scale"])
+        if event.key in STEP_KEYS:
+            step = self._steps.get(STEP_KEYS[event.key])
+            self._keys.append((event.key, step))
+            _apply_key(self._trans, event.key, step, self._rebinned, self._params["refine"])
         elif event.key == "enter":
             print(self._trans.get_combined_transform())
-        elif event.key == "escape":
-            self._trans.clear_transforms()
+            self._confirm()
 
+        self._blit.request_update(self._show_transformed)
+
+    def _show_transformed(self):
+        """Set the transformed moving image to the image artist."""
         self._image1.set_data(self._trans.get_transformed_image())
-        self._figure.canvas.draw()
 
     def _update_trans(self, val):
         """Callback function for slider events. Updates the translation step size."""
@@ -201,21 +343,33 @@ class FineAlignments:
         """Callback function for slider events. Updates the scaling step size."""
         self._steps["scale"] = val
 
+    def _confirm(self):
+        """Save the transformation matrix and start resampling the full resolution result on a
+        background thread. The transformation is scaled from the rebinned images to the original
+        image, see ``_full_resolution``. Nothing is recomputed if the transformation did not change
+        since the last confirmation.
+
+        """
+        tmat, trans = _full_resolution(self._trans, self._rebin, self._image_dict["mov"])
+        if self.tmat is not None and np.array_equal(tmat.params, self.tmat.params):
+            return
+        self._results["tmat"] = tmat
+        self._results["result_view"] = trans.get_transformed_view()
+        self._results["result_future"] = self.result_view.materialise_async()
+        self._results["result_image"] = None
+        self._results["metrics"] = None
+
     def _on_close(self, event):
         """Callback function for close event. Saves the transformation matrix and the transformed
-        image. The translation is multiplied by the rebin factor, so it can be used on the original
-        image. If ``show_result`` is set to ``True``, the transformed image is displayed.
+        image, if they were not confirmed by the ``enter`` key. If ``show_result`` is set to
+        ``True``, the transformed image is displayed.
 
         """
         del event
-        self._results["tmat"] = self._trans.get_combined_transform()
-        self._results["tmat"].params[0, 2] *= self._rebin
-        self._results["tmat"].params[1, 2] *= self._rebin
-        self._trans = ImageTransformer(self._image_dict["mov"])
-        self._trans.add_transform(self._results["tmat"])
-        self._results["result_image"] = self._trans.get_transformed_image()
+        self._confirm()
         if self._show_result:
-            plt.figure("result")
-            plt.imshow(self._image_dict["ref"], cmap="gray")
-            plt.imshow(self._results["result_image"], cmap="gray", alpha=0.5)
+            self._results["overlay"] = OverlayPreview(
+                self._image_dict["ref"], self._image_dict["mov"], self.tmat
+            )
+            self._results["overlay"].show()
             plt.show()
@@ -0,0 +1,140 @@
+""" Module containing quality metrics of an alignment. The metrics are computed on the region where
+the reference image and the aligned moving image overlap, optionally on a binned pyramid level
+of both images, so they cost a fraction of the registration itself.
+
+"""
+
+import numpy as np
+import scipy.fft
+from skimage import transform as sktransform
+from align_panel.image_transformer import ImageTransformer
+from align_panel.align.registration import bin_image, pyramid_levels, rescale_matrix
+
+
+def ncc(ref_image: np.ndarray, aligned: np.ndarray, mask: np.ndarray = None):
+    """Normalised cross-correlation of two images on the pixels of ``mask``, by default the pixels
+    where both images are finite. Returns NaN for fewer than two pixels or a constant image.
+
+    """
+    if mask is None:
+        mask = np.isfinite(ref_image) & np.isfinite(aligned)
+    if mask.sum() < 2:
+        return np.nan
+    ref_values = ref_image[mask] - ref_image[mask].mean()
+    mov_values = aligned[mask] - aligned[mask].mean()
+    norm = np.sqrt((ref_values**2).sum() * (mov_values**2).sum())
+    return float((ref_values * mov_values).sum() / norm) if norm else np.nan
+
+
+def mutual_information(
+    ref_image: np.ndarray, aligned: np.ndarray, mask: np.ndarray = None, bins: int = 32
+):
+    """Mutual information, in nats, of the joint histogram of two images on the pixels of
+    ``mask``. Unlike the correlation, it also rewards a non-linear relation of the intensities.
+
+    """
+    if mask is None:
+        mask = np.isfinite(ref_image) & np.isfinite(aligned)
+    if mask.sum() < 2:
+        return np.nan
+    indices = []
+    for values in (ref_image[mask], aligned[mask]):
+        low, high = values.min(), values.max()
+        scale = bins / (high - low) if high > low else 0.0
+        indices.append(np.minimum(((values - low) * scale).astype(np.intp), bins - 1))
+    joint = np.bincount(indices[0] * bins + indices[1], minlength=bins * bins)
+    joint = joint.reshape(bins, bins) / indices[0].size
+    marginal = joint.sum(axis=1, keepdims=True) * joint.sum(axis=0, keepdims=True)
+    nonzero = joint > 0
+    return float((joint[nonzero] * np.log(joint[nonzero] / marginal[nonzero])).sum())
+
+
+def peak_sharpness(
+    ref_image: np.ndarray, aligned: np.ndarray, mask: np.ndarray = None, exclude: int = 2
+):
+    """Peak-to-sidelobe ratio of the phase correlation of two images on the pixels of ``mask``,
+    outside of which both images are set to zero. For aligned images the peak sits at zero shift,
+    so the correlation at zero shift is compared to the sidelobe, which excludes a square of
+    ``2 * exclude + 1`` pixels around it. A sharp peak at zero shift gives large values, misaligned
+    images or an ambiguous registration give values of a few units.
+
+    """
+    if mask is None:
+        mask = np.isfinite(ref_image) & np.isfinite(aligned)
+    if mask.sum() < 2:
+        return np.nan
+    spectra = []
+    for image in (ref_image, aligned):
+        centred = np.where(mask, image - image[mask].mean(), 0.0)
+        spectra.append(scipy.fft.rfft2(centred, workers=-1))
+    cross_power = spectra[0] * spectra[1].conj()
+    cross_power /= np.maximum(np.abs(cross_power), np.finfo(cross_power.dtype).tiny)
+    correlation = scipy.fft.irfft2(cross_power, s=mask.shape, workers=-1)
+    sidelobe = np.ones(correlation.shape, dtype=bool)
+    rows = np.arange(-exclude, exclude + 1) % correlation.shape[0]
+    cols = np.arange(-exclude, exclude + 1) % correlation.shape[1]
+    sidelobe[np.ix_(rows, cols)] = False
+    std = correlation[sidelobe].std()
+    if not std:
+        return np.nan
+    # the subpixel remainder of the shift spreads the peak over the neighbouring pixels
+    near = slice(exclude - min(exclude, 1), exclude + min(exclude, 1) + 1)
+    peak = correlation[np.ix_(rows[near], cols[near])]
+    return float((peak.max() - correlation[sidelobe].mean()) / std)
+
+
+def alignment_metrics(
+    ref_image: np.ndarray,
+    mov_image: np.ndarray,
+    transform,
+    level: int = 1,
+    inverse: bool = False,
+    bins: int = 32,
+):
+    """Quality metrics of an alignment, computed on the overlap of the reference image and the
+    moving image aligned with ``transform``.
+
+    Parameters
+    ----------
+    ref_image : np.ndarray or TransformedView
+        Reference image.
+    mov_image : np.ndarray or TransformedView
+        Moving image, before the alignment.
+    transform : sktransform.ProjectiveTransform or np.ndarray
+        Transformation aligning the moving image to the reference image, as returned by
+        ``align_auto`` or ``tmat`` of the aligners.
+    level : int, optional
+        Pyramid level, the images are binned by ``2**level`` before the metrics are computed.
+        The level is reduced for small images. The default is 1.
+    inverse : bool, optional
+        If True, the moving image is inverted, as in ``align_auto``. The default is False.
+    bins : int, optional
+        Number of histogram bins for the mutual information. The default is 32.
+
+    Returns
+    -------
+    metrics : dict
+        ``ncc`` normalised cross-correlation, ``mutual_information`` in nats, ``overlap``
+        fraction of the reference covered by the aligned image and ``peak_sharpness``
+        peak-to-sidelobe ratio of the phase correlation of the overlap.
+
+    """
+    ref_image, mov_image = np.asarray(ref_image), np.asarray(mov_image)
+    matrix = getattr(transform, "params", transform)
+    factor = 2 ** (pyramid_levels(ref_image.shape, level + 1) - 1)
+    if factor > 1:
+        ref_image, mov_image = bin_image(ref_image, factor), bin_image(mov_image, factor)
+        matrix = rescale_matrix(matrix, 1 / factor)
+    if inverse:
+        mov_image = -mov_image
+    trans = ImageTransformer(mov_image)
+    trans.add_transform(sktransform.ProjectiveTransform(matrix=matrix),
+                        output_shape=ref_image.shape)
+    aligned = trans.warp_preserving_dtype()
+    mask = np.isfinite(aligned) & np.isfinite(ref_image)
+    return {
+        "ncc": ncc(ref_image, aligned, mask),
+        "mutual_information": mutual_information(ref_image, aligned, mask, bins),
+        "overlap": float(mask.mean()),
+        "peak_sharpness": peak_sharpness(ref_image, aligned, mask),
+    }
@@ -0,0 +1,214 @@
+""" Module containing the overlay modes for the inspection of an alignment. The reference image
+and the aligned moving image are combined at the display resolution, from the preview pyramid,
+into one RGB frame, each mode in one vectorised pass:
+
+- ``blend`` - mean of the images,
+- ``difference`` - signed difference, red where the reference is brighter, blue where the
+  aligned image is brighter and white where they agree,
+- ``checkerboard`` - alternating squares of the images, a misalignment breaks the features at
+  the borders of the squares,
+- ``red_cyan`` - reference in the red channel and the aligned image in the green and blue
+  channels, aligned features are gray, shifted ones get red and cyan fringes,
+- ``edges`` - edges of the aligned image in green over the reference.
+
+In the result figures of the aligners, the keys ``1`` to ``5`` select a mode and ``m`` cycles
+through them.
+
+"""
+
+import numpy as np
+import matplotlib.pyplot as plt
+from skimage.transform import ProjectiveTransform
+from align_panel.image_transformer import ImageTransformer
+from align_panel.align.registration import rescale_matrix
+from align_panel.align.preview import preview, preview_extent
+
+OVERLAY_MODES = ("blend", "difference", "checkerboard", "red_cyan", "edges")
+# keys selecting the modes in the result figures
+OVERLAY_KEYS = {str(number): mode for number, mode in enumerate(OVERLAY_MODES, start=1)}
+# color of the edges of the aligned image
+EDGE_COLOR = np.array([0.0, 1.0, 0.0])
+
+
+def normalise(image: np.ndarray, limits: tuple = None):
+    """Image scaled to [0, 1] by its 1st and 99th percentile, or by ``limits``, NaN are kept."""
+    image = np.asarray(image, dtype=np.float32)
+    if limits is None:
+        limits = np.nanpercentile(image, (1, 99)) if np.isfinite(image).any() else (0.0, 1.0)
+    low, high = float(limits[0]), float(limits[1])
+    return np.clip((image - low) / (high - low if high > low else 1.0), 0.0, 1.0)
+
+
+def _edges(image: np.ndarray):
+    """Gradient magnitude of an image scaled to [0, 1] by its 99th percentile, 0 outside the
+    image."""
+    valid = np.isfinite(image)
+    filled = np.where(valid, image, np.mean(image[valid]) if valid.any() else 0.0)
+    grad_rows, grad_cols = np.gradient(filled)
+    magnitude = np.where(valid, np.hypot(grad_rows, grad_cols), 0.0)
+    scale = np.percentile(magnitude[valid], 99) if valid.any() else 0.0
+    return np.clip(magnitude / scale, 0.0, 1.0) if scale > 0 else magnitude
+
+
+def compose(ref: np.ndarray, aligned: np.ndarray, mode: str = "blend", square: int = 32):
+    """Combine the reference and the aligned moving image into an RGB frame.
+
+    Parameters
+    ----------
+    ref : np.ndarray
+        Reference image scaled to [0, 1], see ``normalise``, NaN outside of the image.
+    aligned : np.ndarray
+        Aligned moving image of the same shape scaled to [0, 1], NaN outside of the image.
+        Pixels outside of it show the reference.
+    mode : str, optional
+        One of ``OVERLAY_MODES``. The default is ``blend``.
+    square : int, optional
+        Side of the squares of the ``checkerboard`` mode in pixels. The default is 32.
+
+    Returns
+    -------
+    frame : np.ndarray
+        Frame of shape (rows, cols, 3) and type uint8.
+
+    """
+    if mode not in OVERLAY_MODES:
+        raise ValueError(f"Unknown overlay mode: {mode}")
+    if np.shape(ref) != np.shape(aligned):
+        raise ValueError(f"Shapes {np.shape(ref)} and {np.shape(aligned)} do not match")
+    ref = np.where(np.isfinite(ref), ref, 0.0)
+    covered = np.isfinite(aligned)
+    moving = np.where(covered, aligned, ref)
+    if mode == "blend":
+        rgb = np.repeat(((ref + moving) / 2)[..., None], 3, axis=2)
+    elif mode == "difference":
+        difference = ref - moving
+        rgb = np.stack(
+            (
+                1.0 - np.clip(-difference, 0.0, 1.0),
+                1.0 - np.abs(difference),
+                1.0 - np.clip(difference, 0.0, 1.0),
+            ),
+            axis=-1,
+        )
+    elif mode == "checkerboard":
+        rows, cols = np.shape(ref)
+        odd = (np.arange(rows)[:, None] // square + np.arange(cols)[None, :] // square) % 2 == 1
+        rgb = np.repeat(np.where(odd, moving, ref)[..., None], 3, axis=2)
+    elif mode == "red_cyan":
+        rgb = np.stack((ref, moving, moving), axis=-1)
+    else:
+        edges = _edges(aligned)[..., None]
+        rgb = ref[..., None] * (1.0 - edges) + edges * EDGE_COLOR
+    return (255 * rgb + 0.5).astype(np.uint8)
+
+
+class OverlayPreview:
+    """Overlays of the reference image and the moving image aligned by a transformation, at the
+    display resolution. The images are taken from the preview pyramid, the moving image is warped
+    once, and each mode is composed on first use and kept, so switching between the modes only
+    redraws the figure.
+
+    Attributes
+    ----------
+    _layers : dict
+        Normalised reference and aligned moving previews.
+    _factor : int
+        Binning factor of the previews.
+    _extent : list
+        Extent of the previews in full resolution pixels.
+    _frames : dict
+        Composed frame of each used mode.
+    _figure : matplotlib.figure.Figure
+        Figure of ``show``, None before it is shown.
+    _image : matplotlib.image.AxesImage
+        Image of the shown frame.
+
+    """
+
+    def __init__(
+        self,
+        ref_image,
+        mov_image,
+        tmat,
+        inverse: bool = False,
+        max_size: int = 1024,
+        square: int = 32,
+    ):
+        """
+        Parameters
+        ----------
+        ref_image : np.ndarray or TransformedView
+            Reference image.
+        mov_image : np.ndarray or TransformedView
+            Moving image, before the alignment.
+        tmat : sktransform.ProjectiveTransform or np.ndarray
+            Full resolution transformation aligning the moving image, ``tmat`` of the aligners.
+        inverse : bool, optional
+            If True, the moving image is inverted, as in ``align_auto``. The default is False.
+        max_size : int, optional
+            Largest side of the previews, the images are binned by the smallest power of two
+            which fits it. The default is 1024.
+        square : int, optional
+            Side of the squares of the ``checkerboard`` mode in preview pixels. The default
+            is 32.
+
+        """
+        size = max(np.shape(ref_image)[:2])
+        factor = 1
+        while size / factor > max_size:
+            factor *= 2
+        ref = preview(ref_image, factor)
+        trans = ImageTransformer(preview(mov_image, factor))
+        matrix = np.asarray(getattr(tmat, "params", tmat), dtype=float)
+        trans.add_transform(
+            ProjectiveTransform(matrix=rescale_matrix(matrix, 1 / factor)), output_shape=ref.shape
+        )
+        aligned = trans.warp_preserving_dtype()
+        if inverse:
+            aligned = -aligned
+        self._layers = {"ref": normalise(ref), "aligned": normalise(aligned)}
+        self._factor = factor
+        self._extent = preview_extent(ref_image, factor)
+        self._square = square
+        self._frames = {}
+        self._figure, self._image, self._mode = None, None, None
+
+    @property
+    def mode(self):
+        """Mode of the shown frame."""
+        return self._mode
+
+    def frame(self, mode: str = "blend"):
+        """RGB frame of the overlay ``mode``, one of ``OVERLAY_MODES``."""
+        if mode not in self._frames:
+            self._frames[mode] = compose(
+                self._layers["ref"], self._layers["aligned"], mode, self._square
+            )
+        return self._frames[mode]
+
+    def show(self, mode: str = "blend", title: str = "result"):
+        """Show the overlay in a new figure, the keys ``1`` to ``5`` select the mode and ``m``
+        cycles through the modes. ``plt.show`` is left to the caller."""
+        self._figure = plt.figure(title)
+        self._image = self._figure.subplots().imshow(
+            self.frame(mode), extent=self._extent, interpolation="none"
+        )
+        self._figure.canvas.mpl_connect("key_press_event", self._on_key)
+        self.set_mode(mode)
+        return self._figure
+
+    def set_mode(self, mode: str):
+        """Show the overlay ``mode`` in the figure of ``show``."""
+        self._image.set_data(self.frame(mode))
+        self._mode = mode
+        keys = ", ".join(f"{key} {name}" for key, name in OVERLAY_KEYS.items())
+        self._image.axes.set_title(f"Overlay: {mode}\n({keys}, m next)", fontsize="small")
+        self._figure.canvas.draw_idle()
+
+    def _on_key(self, event):
+        """Callback for key press events, selects the overlay mode."""
+        if event.key in OVERLAY_KEYS:
+            self.set_mode(OVERLAY_KEYS[event.key])
+        elif event.key == "m":
+            following = (OVERLAY_MODES.index(self._mode) + 1) % len(OVERLAY_MODES)
+            self.set_mode(OVERLAY_MODES[following])
@@ -3,24 +3,393 @@
 Based on https://github.com/yuma-m/matplotlib-draggable-plot
 """
 
-import math
-
 # import itertools - can be used for different colors of points
 import numpy as np
+import scipy.fft
 import matplotlib.pyplot as plt
 from matplotlib.backend_bases import MouseEvent
-from skimage.transform import rescale
 from align_panel.image_transformer import ImageTransformer
+from skimage.transform import ProjectiveTransform
+from align_panel.align.results import _AlignmentResults
+from align_panel.align.registration import rescale_matrix
+from align_panel.align.blit import BlitManager
+from align_panel.align.preview import preview, preview_extent
+from align_panel.align.session import AlignmentSession
+from align_panel.align.overlay import OverlayPreview
+
+# radius in screen pixels around a point within which a click selects it
+PICK_RADIUS = 10
+
+
+class _PointPairs:
+    """Point pairs of the reference and moving image in growable arrays. Every pair has a stable
+    integer id, the ids increase in the order of addition, so a pair is found by bisection and
+    the nearest point by one vectorised distance computation.
+
+    Attributes
+    ----------
+    _xy : np.ndarray
+        Array of shape (2, capacity, 2), the (x, y) positions of the reference (index 0) and
+        moving (index 1) points.
+    _ids : np.ndarray
+        Ids of the pairs, sorted.
+    _size : int
+        Number of pairs.
+    _next_id : int
+        Id of the next added pair.
+
+    """
+
+    def __init__(self, ref_points=None, mov_points=None, capacity: int = 64):
+        self._xy = np.empty((2, capacity, 2))
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._size = 0
+        self._next_id = 0
+        if ref_points is not None:
+            ref_points = np.asarray(ref_points, dtype=float).reshape(-1, 2)
+            mov_points = np.asarray(mov_points, dtype=float).reshape(-1, 2)
+            for ref_xy, mov_xy in zip(ref_points, mov_points):
+                self.add(ref_xy, mov_xy)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def ids(self):
+        return self._ids[: self._size]
+
+    @property
+    def ref(self):
+        """Array of shape (N, 2) with the reference points, a view of the storage."""
+        return self._xy[0, : self._size]
+
+    @property
+    def mov(self):
+        """Array of shape (N, 2) with the moving points, a view of the storage."""
+        return self._xy[1, : self._size]
+
+    def side(self, index: int):
+        """Points of the reference (0) or moving (1) image."""
+        return self._xy[index, : self._size]
+
+    def add(self, ref_xy, mov_xy):
+        """Append a pair, the storage is doubled when full. Returns the id of the pair."""
+        if self._size == self._ids.size:
+            self._xy = np.concatenate((self._xy, np.empty_like(self._xy)), axis=1)
+            self._ids = np.concatenate((self._ids, np.empty_like(self._ids)))
+        self._xy[:, self._size] = ref_xy, mov_xy
+        self._ids[self._size] = self._next_id
+        self._size += 1
+        self._next_id += 1
+        return self._next_id - 1
+
+    def row(self, point_id: int):
+        """Row of the pair with ``point_id`` in the arrays, None if there is no such pair."""
+        row = int(np.searchsorted(self.ids, point_id))
+        if row < self._size and self._ids[row] == point_id:
+            return row
+        return None
+
+    def remove(self, point_id: int):
+        """Remove the pair with ``point_id``, the order of the other pairs is kept."""
+        row = self.row(point_id)
+        if row is None:
+            return
+        self._xy[:, row : self._size - 1] = self._xy[:, row + 1 : self._size]
+        self._ids[row : self._size - 1] = self._ids[row + 1 : self._size]
+        self._size -= 1
+
+    def move(self, point_id: int, index: int, xy):
+        """Move the point of the pair with ``point_id`` in the reference (0) or moving (1) image."""
+        row = self.row(point_id)
+        if row is not None:
+            self._xy[index, row] = xy
 
+    def nearest(self, index: int, xy, radius: float, transform=None):
+        """Id of the point of the reference (0) or moving (1) image nearest to ``xy``, None if no
+        point is closer than ``radius``. ``transform`` maps the points to the coordinates of
+        ``xy``, e.g. ``Axes.transData.transform`` for screen coordinates.
 
-class PointAlignments:
+        """
+        if not self._size:
+            return None
+        points = self.side(index)
+        if transform is not None:
+            points = transform(points)
+        distances = np.hypot(*(points - np.asarray(xy, dtype=float)).T)
+        row = int(np.argmin(distances))
+        return int(self._ids[row]) if distances[row] < radius else None
+
+
+class _IncrementalFit:
+    """Least-squares fit of a transformation mapping the reference points to the moving points,
+    updated incrementally. Only the normal equations of the point pairs are kept, so adding,
+    removing or moving a pair costs a constant time and the fit a solve of at most 8 unknowns.
+    The coordinates are normalised by the image size, which keeps the normal equations well
+    conditioned.
+
+    The similarity and euclidean fits equal those of ``estimate_transform``, the euclidean fit
+    takes the rotation of the similarity fit, which is the least-squares rotation. The affine and
+    projective fits are ordinary least-squares fits, the projective one of the algebraic error,
+    which differ from the total least-squares fits of ``estimate_transform`` by a small fraction
+    of the residuals.
+
+    Attributes
+    ----------
+    _method : str
+        Transformation type, ``['affine', 'euclidean', 'similarity', 'projective']``.
+    _normalise : np.ndarray
+        Matrix mapping the pixel coordinates to the normalised coordinates.
+    _ata : np.ndarray
+        Normal matrix of the fit.
+    _atb : np.ndarray
+        Right hand side of the normal equations.
+    _count : int
+        Number of point pairs in the fit.
+
+    """
+
+    UNKNOWNS = {"euclidean": 4, "similarity": 4, "affine": 6, "projective": 8}
+    MIN_POINTS = {"euclidean": 2, "similarity": 2, "affine": 3, "projective": 4}
+
+    def __init__(self, method: str, shape: tuple):
+        if method not in self.UNKNOWNS:
+            raise ValueError(f"Unknown transformation type: {method}")
+        self._method = method
+        scale = max(shape)
+        self._normalise = np.array(
+            [[1 / scale, 0, -shape[1] / (2 * scale)], [0, 1 / scale, -shape[0] / (2 * scale)],
+             [0, 0, 1]]
+        )
+        unknowns = self.UNKNOWNS[method]
+        self._ata = np.zeros((unknowns, unknowns))
+        self._atb = np.zeros(unknowns)
+        self._count = 0
+
+    def _design(self, src, dst):
+        """Rows of the linear system of the point pairs, of shape (N, 2, unknowns), and the right
+        hand side, of shape (N, 2).
+
+        """
+        src = np.asarray(src, dtype=float).reshape(-1, 2) @ self._normalise[:2, :2].T
+        dst = np.asarray(dst, dtype=float).reshape(-1, 2) @ self._normalise[:2, :2].T
+        src, dst = src + self._normalise[:2, 2], dst + self._normalise[:2, 2]
+        x, y = src.T
+        zero, one = np.zeros_like(x), np.ones_like(x)
+        if self._method in ("euclidean", "similarity"):
+            rows = [[x, -y, one, zero], [y, x, zero, one]]
+        else:
+            rows = [[x, y, one, zero, zero, zero], [zero, zero, zero, x, y, one]]
+            if self._method == "projective":
+                rows[0] += [-x * dst[:, 0], -y * dst[:, 0]]
+                rows[1] += [-x * dst[:, 1], -y * dst[:, 1]]
+        design = np.moveaxis(np.array(rows), -1, 0)
+        return design, dst
+
+    def add(self, src, dst, sign: int = 1):
+        """Add the point pairs ``src`` -> ``dst``, arrays of (x, y) positions."""
+        design, rhs = self._design(src, dst)
+        self._ata += sign * np.einsum("nik,nil->kl", design, design)
+        self._atb += sign * np.einsum("nik,ni->k", design, rhs)
+        self._count += sign * len(rhs)
+
+    def remove(self, src, dst):
+        """Remove the point pairs ``src`` -> ``dst``, added before."""
+        self.add(src, dst, sign=-1)
+
+    def matrix(self):
+        """Transformation matrix in pixel coordinates, None for too few or degenerate points."""
+        if self._count < self.MIN_POINTS[self._method]:
+            return None
+        try:
+            params = np.linalg.solve(self._ata, self._atb)
+        except np.linalg.LinAlgError:
+            return None
+        if self._method in ("euclidean", "similarity"):
+            cos, sin, shift_x, shift_y = params
+            if self._method == "euclidean":
+                norm = np.hypot(cos, sin)
+                if not norm:
+                    return None
+                cos, sin = cos / norm, sin / norm
+                # centroids of the points, from the sums in the normal equations
+                src_mean = np.array([self._ata[0, 2], -self._ata[1, 2]]) / self._count
+                dst_mean = self._atb[2:] / self._count
+                shift_x, shift_y = dst_mean - [[cos, -sin], [sin, cos]] @ src_mean
+            matrix = np.array([[cos, -sin, shift_x], [sin, cos, shift_y], [0, 0, 1]])
+        else:
+            matrix = np.append(params, [0.0, 0.0, 1.0] if params.size == 6 else 1.0)
+            matrix = matrix.reshape(3, 3)
+        matrix = np.linalg.inv(self._normalise) @ matrix @ self._normalise
+        if self._method != "projective":
+            matrix[2] = 0.0, 0.0, 1.0
+        return matrix / matrix[2, 2]
+
+
+def _patches(image: np.ndarray, centers: np.ndarray, half: int):
+    """Square patches of ``2 * half + 1`` pixels around integer (x, y) ``centers``, stacked in
+    an array of shape (N, size, size) by one fancy indexing of the image.
+
+    """
+    offsets = np.arange(-half, half + 1)
+    rows = centers[:, 1, None] + offsets
+    cols = centers[:, 0, None] + offsets
+    return image[rows[:, :, None], cols[:, None, :]]
+
+
+def _box_sums(windows: np.ndarray, size: int):
+    """Sums of all ``size`` x ``size`` blocks of a stack of windows, from summed-area tables."""
+    table = np.zeros((windows.shape[0], windows.shape[1] + 1, windows.shape[2] + 1))
+    table[:, 1:, 1:] = windows.cumsum(axis=1).cumsum(axis=2)
+    return (
+        table[:, size:, size:] - table[:, :-size, size:]
+        - table[:, size:, :-size] + table[:, :-size, :-size]
+    )
+
+
+def _parabolic_offset(minus, center, plus):
+    """Subpixel offset of the vertex of the parabola through three samples, within +-0.5."""
+    curvature = minus - 2 * center + plus
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = np.where(curvature < 0, 0.5 * (minus - plus) / curvature, 0.0)
+    return np.clip(offset, -0.5, 0.5)
+
+
+def refine_points(
+    ref_image: np.ndarray,
+    mov_image: np.ndarray,
+    ref_points: np.ndarray,
+    mov_points: np.ndarray,
+    patch_size: int = 31,
+    search: int = 8,
+    min_ncc: float = 0.5,
+):
+    """Refine the moving points to subpixel accuracy by matching a patch of the reference image
+    around each reference point within a window of the moving image around the moving point.
+    The normalised cross-correlation of all point pairs is computed in one batch, the numerators
+    by FFT and the local norms of the windows from summed-area tables. The subpixel position is
+    the vertex of a parabola through the peak and its neighbours, along each axis.
+
+    Parameters
+    ----------
+    ref_image : np.ndarray or TransformedView
+        Reference image, at full resolution.
+    mov_image : np.ndarray or TransformedView
+        Moving image, at full resolution.
+    ref_points : np.ndarray
+        Array of shape (N, 2) with the (x, y) positions of the points in the reference image.
+    mov_points : np.ndarray
+        Array of shape (N, 2) with the approximate (x, y) positions in the moving image.
+    patch_size : int, optional
+        Size of the matched patch in pixels, made odd. The default is 31.
+    search : int, optional
+        Maximal displacement of a moving point in pixels. The default is 8.
+    min_ncc : float, optional
+        Points whose correlation peak is lower are not moved. The default is 0.5.
+
+    Returns
+    -------
+    refined : np.ndarray
+        Array of shape (N, 2) with the refined moving points. Points with a weak peak, a peak at
+        the border of the search window or a patch outside of the images are unchanged.
+    scores : np.ndarray
+        Correlation peak of each point pair, NaN for the pairs which could not be matched.
+
+    """
+    ref_image = np.asarray(ref_image, dtype=np.float32)
+    mov_image = np.asarray(mov_image, dtype=np.float32)
+    ref_points = np.asarray(ref_points, dtype=float).reshape(-1, 2)
+    mov_points = np.asarray(mov_points, dtype=float).reshape(-1, 2)
+    refined = mov_points.copy()
+    scores = np.full(len(mov_points), np.nan)
+    half = patch_size // 2
+    size, reach = 2 * half + 1, half + search
+    ref_centers = np.rint(ref_points).astype(np.intp)
+    mov_centers = np.rint(mov_points).astype(np.intp)
+    inside = np.ones(len(mov_points), dtype=bool)
+    for centers, margin, shape in (
+        (ref_centers, half, ref_image.shape),
+        (mov_centers, reach, mov_image.shape),
+    ):
+        inside &= (centers >= margin).all(axis=1)
+        inside &= (centers[:, 0] < shape[1] - margin) & (centers[:, 1] < shape[0] - margin)
+    if not inside.any():
+        return refined, scores
+    templates = _patches(ref_image, ref_centers[inside], half).astype(np.float64)
+    windows = _patches(mov_image, mov_centers[inside], reach).astype(np.float64)
+    templates -= templates.mean(axis=(1, 2), keepdims=True)
+    template_norms = np.sqrt((templates**2).sum(axis=(1, 2)))
+    shape = windows.shape[1:]
+    # correlation[k, dy, dx] = sum of windows[k, dy + i, dx + j] * templates[k, i, j]
+    correlation = scipy.fft.irfft2(
+        scipy.fft.rfft2(windows, s=shape) * scipy.fft.rfft2(templates, s=shape).conj(), s=shape
+    )[:, : 2 * search + 1, : 2 * search + 1]
+    sums = _box_sums(windows, size)
+    variances = np.maximum(_box_sums(windows**2, size) - sums**2 / size**2, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ncc = correlation / (template_norms[:, None, None] * np.sqrt(variances))
+    ncc = np.nan_to_num(ncc, nan=-1.0, posinf=-1.0, neginf=-1.0)
+    index = np.arange(len(ncc))
+    peak_rows, peak_cols = np.unravel_index(
+        ncc.reshape(len(ncc), -1).argmax(axis=1), ncc.shape[1:]
+    )
+    peaks = ncc[index, peak_rows, peak_cols]
+    interior = (
+        (peak_rows > 0) & (peak_rows < 2 * search) & (peak_cols > 0) & (peak_cols < 2 * search)
+    )
+    rows = np.clip(peak_rows, 1, 2 * search - 1)
+    cols = np.clip(peak_cols, 1, 2 * search - 1)
+    center = ncc[index, rows, cols]
+    shift_y = peak_rows - search + _parabolic_offset(
+        ncc[index, rows - 1, cols], center, ncc[index, rows + 1, cols]
+    )
+    shift_x = peak_cols - search + _parabolic_offset(
+        ncc[index, rows, cols - 1], center, ncc[index, rows, cols + 1]
+    )
+    accepted = interior & (peaks >= min_ncc)
+    positions = np.flatnonzero(inside)
+    scores[positions] = peaks
+    moved = positions[accepted]
+    # the patch is centred on the rounded reference point, its remainder moves along
+    remainder = ref_points[moved] - ref_centers[moved]
+    refined[moved] = (
+        mov_centers[moved] + np.stack((shift_x, shift_y), axis=1)[accepted] + remainder
+    )
+    return refined, scores
+
+
+def _estimate(trans: ImageTransformer, ref_points, mov_points, method: str, robust: str, rebin):
+    """Estimate the transformation of the point pairs, replacing the transforms of ``trans``,
+    the shared part of ``PointAlignments`` and its replay. Returns the inlier mask and the point
+    residuals, None without ``robust``.
+
+    """
+    if robust:
+        _, inliers, residuals = trans.estimate_transform_robust(
+            ref_points,
+            mov_points,
+            method=method,
+            robust=robust,
+            residual_threshold=rebin,
+            clear=True,
+        )
+        return inliers, residuals
+    trans.estimate_transform(ref_points, mov_points, method=method, clear=True)
+    return None, None
+
+
+class PointAlignments(_AlignmentResults):
     """Class for the point definition alignment.
     The inputs are ``two images``, of ``numpy ndarray`` type, and the rebinning factor.
     The rebinning factor is used to speed up the alignment process.
     When the class is initialized, two images are shown in two different axes.
     The user can select points in both images by left clicking. The points can be deleted
     by right clicking or dragged by left clicking. The points are later used for alignments
-    with the use of the ``ImageTransformer`` class.
+    with the use of the ``ImageTransformer`` class. The ``enter`` key estimates the
+    transformation and starts computing the full resolution result in the background.
+    In the live mode, the transformation is updated after every change of the points and the
+    aligned moving image is overlaid on the reference image, with the positions predicted for
+    the moving points and their residuals.
 
     Possible alignent techniques are:
            ``['affine', 'euclidean', 'similarity', 'projective']``
@@ -44,14 +413,23 @@ class PointAlignments:
         Line object. Used for 1. axis.
     _line2 : matplotlib.lines.Line2D
         Line object. Used for 2. axis.
-    _dragging_point : int
-        Coordinates of the point that is being dragged.
-    _points : list
-        List of points in the reference image.
-    _mov_points : list
-        List of points in the moving image.
+    _blit : BlitManager
+        Redraws the points over the cached images and merges the redraws of repeated mouse
+        motion events.
+    _dragging_point : tuple
+        Index of the image (0 reference, 1 moving) and id of the point that is being dragged.
+    _pairs : _PointPairs
+        Point pairs of the reference and moving images.
+    _live : dict
+        Live mode state: the incremental fit, the transformer of the moving preview, the overlay,
+        predicted points and residual text artists and the current residuals. Empty if the live
+        mode is off.
+    _confirmed : tuple
+        Arrays of the reference and moving points of the last estimated transformation.
     _results : dict
-        Dictionary containing the transformation matrix and the transformed image.
+        Dictionary containing the transformation matrix, the transformed image, its lazy
+        ``TransformedView``, the quality metrics of the alignment and, for robust estimation, the
+        inlier mask and point residuals.
 
     """
 
@@ -62,14 +440,19 @@ class PointAlignments:
         rebin: int,
         method: str = "euclidean",
         show_result: bool = True,
+        robust: str = None,
+        points: tuple = None,
+        live: bool = False,
+        subpixel: bool = False,
     ):
         """
         Parameters
         ----------
-        ref_image : np.ndarray
+        ref_image : np.ndarray or TransformedView
             Reference image.
-        mov_image : np.ndarray
-            Moving image.
+        mov_image : np.ndarray or TransformedView
+            Moving image. For a ``TransformedView``, the result is resampled once from its
+            source array.
         rebin : int
             Rebinning factor.
         method : str, optional
@@ -77,17 +460,51 @@ class PointAlignments:
             All options are ``['affine', 'euclidean', 'similarity', 'projective']``.
         show_result : bool, optional
             If True, the result of the alignment is shown. The default is True.
+        robust : str, optional
+            Outlier rejection used for the estimation, ``ransac`` or ``lmeds``. Points further
+            than ``rebin`` pixels from the fitted transform are rejected as mis-clicks.
+            The default is None, all points are used.
+        points : tuple, optional
+            Initial points ``(ref_points, mov_points)``, two arrays of shape (N, 2) with (x, y)
+            positions, for example from ``FeatureAlignments``. The default is None.
+        live : bool, optional
+            If True, the transformation is re-estimated after every added, moved or removed
+            point and the aligned moving image is overlaid on the reference image at the
+            preview resolution. The default is False.
+        subpixel : bool, optional
+            If True, the moving points are refined to subpixel accuracy by matching patches of
+            the full resolution images, see ``refine_points``, before the transformation is
+            estimated. The default is False.
 
         """
         self._image_dict = {"ref": ref_image, "mov": mov_image}
         self._trans = ImageTransformer(self._image_dict["mov"])
-        self._params = {"rebin": rebin, "method": method, "show_result": show_result}
+        self._params = {
+            "rebin": rebin,
+            "method": method,
+            "show_result": show_result,
+            "robust": robust,
+            "live": live,
+            "subpixel": subpixel,
+        }
         self._figure, self._axes, self._line, self._line2 = None, None, None, None
+        self._live = {}
+        self._blit = None
         self._dragging_point = None
+        self._confirmed = None
         # self._colors = itertools.cycle(['tab:blue','tab:orange','tab:green','tab:red','tab:purple','tab:brown','tab:pink','tab:gray','tab:olive','tab:cyan'])
-        self._points = []
-        self._mov_points = []
-        self._results = {"tmat": None, "result_image": None}
+        self._pairs = _PointPairs(*(points if points is not None else ()))
+        self._results = {
+            "tmat": None,
+            "result_image": None,
+            "result_view": None,
+            "inliers": None,
+            "residuals": None,
+            "metrics": None,
+            "result_future": None,
+            "match_scores": None,
+            "overlay": None,
+        }
 
         self._init_plot()
 
@@ -103,118 +520,269 @@ class PointAlignments:
     def _show_result(self):
         return self._params["show_result"]
 
-    @property
-    def result_image(self):
-        return self._results["result_image"]
-
     @property
     def tmat(self):
         return self._results["tmat"]
 
+    @property
+    def session(self):
+        """Record of the point pairs, which can be replayed without a figure, see ``replay``.
+        With ``subpixel``, the pairs are refined once the transformation is estimated."""
+        return AlignmentSession(
+            "points",
+            {key: self._params[key] for key in ("rebin", "method", "robust", "subpixel")},
+            {"ref_points": self.ref_points, "mov_points": self.mov_points},
+            np.shape(self._image_dict["ref"]),
+        )
+
+    @staticmethod
+    def replay(session: AlignmentSession, ref_image, mov_image):
+        """Estimate the transformation of two images from the point pairs of a recorded session,
+        without a figure. The points are rescaled to images of a different resolution, with
+        ``subpixel`` they are refined on the new images.
+
+        Parameters
+        ----------
+        session : AlignmentSession
+            Session recorded by ``PointAlignments``.
+        ref_image : np.ndarray or TransformedView
+            Reference image.
+        mov_image : np.ndarray or TransformedView
+            Moving image.
+
+        Returns
+        -------
+        results : dict
+            ``tmat`` transformation matrix, ``result_view`` lazy result, ``inliers`` and
+            ``residuals`` of the robust estimation and the refined ``mov_points``.
+
+        """
+        scale = session.scale_to(ref_image)
+        params = session.params
+        # pixel centres of binned images, as in ``registration.rescale_transform``
+        ref_points, mov_points = (
+            scale * np.asarray(session.inputs[name], dtype=float).reshape(-1, 2) + (scale - 1) / 2
+            for name in ("ref_points", "mov_points")
+        )
+        rebin = params["rebin"] * scale
+        if params.get("subpixel"):
+            mov_points, _ = refine_points(
+                ref_image, mov_image, ref_points, mov_points, search=int(2 * rebin + 2)
+            )
+        trans = ImageTransformer(mov_image)
+        inliers, residuals = _estimate(
+            trans, ref_points, mov_points, params["method"], params.get("robust"), rebin
+        )
+        return {
+            "tmat": trans.get_combined_transform(),
+            "result_view": trans.get_transformed_view(),
+            "inliers": inliers,
+            "residuals": residuals,
+            "mov_points": mov_points,
+        }
+
+    @property
+    def match_scores(self):
+        """Correlation peak of each point pair of the subpixel refinement, NaN for unmatched
+        pairs, None without ``subpixel``."""
+        return self._results["match_scores"]
+
+    @property
+    def live_transform(self):
+        """Transformation of the live mode, None if it is off or there are too few points."""
+        if not self._live or self._live["matrix"] is None:
+            return None
+        return ProjectiveTransform(matrix=self._live["matrix"])
+
+    @property
+    def live_residuals(self):
+        """Distance in pixels of each point pair from the live transformation."""
+        return self._live.get("residuals")
+
+    @property
+    def ref_points(self):
+        """Array of shape (N, 2) with the (x, y) positions of the points in the reference image."""
+        return self._pairs.ref.copy()
+
+    @property
+    def mov_points(self):
+        """Array of shape (N, 2) with the (x, y) positions of the points in the moving image."""
+        return self._pairs.mov.copy()
+
+    @property
+    def inliers(self):
+        """Boolean mask of the point pairs used for the transform, None without ``robust``."""
+        return self._results["inliers"]
+
+    @property
+    def residuals(self):
+        """Distance in pixels of each point pair from the estimated transform."""
+        return self._results["residuals"]
+
     def _init_plot(self):
         """Initialize plot for point selection, connect events to callbacks."""
-        original_shape = self._image_dict["ref"].shape
         names = ["Reference image", "Moving image"]
-        resized_images = list(
-            map(
-                lambda image: rescale(
-                    image.copy(), 1 / self._rebin, anti_aliasing=False
-                ),
-                self._image_dict.values(),
-            )
-        )
         self._figure, self._axes = plt.subplots(1, 2)
-        for axis, image, name in zip(self._axes, resized_images, names):
+        for axis, image, name in zip(self._axes, self._image_dict.values(), names):
             axis.imshow(
-                image, cmap="gray", extent=[0, original_shape[1], original_shape[0], 0]
+                preview(image, self._rebin),
+                cmap="gray",
+                extent=preview_extent(image, self._rebin),
             )
             axis.set_title(name)
-        #self._figure.canvas.blit(self._figure.bbox)  # maybe increase performance
+        (self._line,) = self._axes[0].plot([], [], ".", markersize=13, color="tab:orange")
+        (self._line2,) = self._axes[1].plot([], [], ".", markersize=13, color="tab:orange")
+        self._blit = BlitManager(self._figure, [self._line, self._line2])
+        if self._params["live"]:
+            self._init_live()
         self._figure.canvas.mpl_connect("button_press_event", self._on_click)
         self._figure.canvas.mpl_connect("button_press_event", self._on_click_2)
         self._figure.canvas.mpl_connect("button_release_event", self._on_release)
         self._figure.canvas.mpl_connect("button_release_event", self._on_release_2)
         self._figure.canvas.mpl_connect("motion_notify_event", self._on_motion)
         self._figure.canvas.mpl_connect("motion_notify_event", self._on_motion_2)
+        self._figure.canvas.mpl_connect("key_press_event", self._on_key)
         self._figure.canvas.mpl_connect("close_event", self._on_close)
+        if len(self._pairs):
+            self._update_plot()
+            self._update_plot2()
         plt.show()
 
+    def _init_live(self):
+        """Create the live fit and the animated artists of the live mode."""
+        ref_preview = preview(self._image_dict["ref"], self._rebin)
+        mov_preview = preview(self._image_dict["mov"], self._rebin)
+        fit = _IncrementalFit(self._method, np.shape(self._image_dict["ref"]))
+        if len(self._pairs):
+            fit.add(self._pairs.ref, self._pairs.mov)
+        overlay = self._axes[0].imshow(
+            np.full(ref_preview.shape, np.nan, dtype=np.float32),
+            cmap="gray",
+            alpha=0.5,
+            extent=preview_extent(self._image_dict["ref"], self._rebin),
+            vmin=np.nanmin(mov_preview),
+            vmax=np.nanmax(mov_preview),
+        )
+        (predicted,) = self._axes[1].plot([], [], "+", markersize=13, color="tab:red")
+        text = self._figure.text(0.5, 0.02, "", ha="center")
+        self._live = {
+            "fit": fit,
+            "trans": ImageTransformer(mov_preview),
+            "shape": ref_preview.shape,
+            "matrix": None,
+            "residuals": None,
+            "overlay": overlay,
+            "predicted": predicted,
+            "text": text,
+        }
+        for artist in (overlay, predicted, text):
+            self._blit.add_artist(artist)
+        self._blit.request_update(self._show_live)
+
+    def _show_live(self):
+        """Solve the live fit and update the overlay, the predicted points and the residuals.
+        Runs once per redraw, so the work of coalesced mouse events is skipped.
+
+        """
+        live = self._live
+        matrix = live["matrix"] = live["fit"].matrix()
+        if matrix is None:
+            live["residuals"] = None
+            live["overlay"].set_visible(False)
+            live["predicted"].set_data([], [])
+            needed = _IncrementalFit.MIN_POINTS[self._method]
+            live["text"].set_text(f"Live preview needs {needed} point pairs.")
+            return
+        predicted = ProjectiveTransform(matrix=matrix)(self._pairs.ref)
+        residuals = live["residuals"] = np.hypot(*(predicted - self._pairs.mov).T)
+        live["predicted"].set_data(*predicted.T)
+        worst = int(np.argmax(residuals))
+        live["text"].set_text(
+            f"Residuals: RMS {np.sqrt(np.mean(residuals**2)):.2f} px, "
+            f"max {residuals[worst]:.2f} px (pair {self._pairs.ids[worst]})"
+        )
+        trans = live["trans"]
+        trans.clear_transforms()
+        trans.add_transform(
+            ProjectiveTransform(matrix=rescale_matrix(matrix, 1 / self._rebin)),
+            output_shape=live["shape"],
+        )
+        live["overlay"].set_data(trans.warp_preserving_dtype())
+        live["overlay"].set_visible(True)
+
     def _update_plot(self):
         """Function called in ``_on_click`` to update the plot with the new points.
         Updates the plot in axis 1.
 
         """
-        if not self._points:
-            self._line.set_data([], [])
-        else:
-            x, y = zip(*(self._points))
-            # Add new plot
-            if not self._line:
-                (self._line,) = self._axes[0].plot(
-                    x, y, ".", markersize=13, color="tab:orange"
-                )
-            # Update current plot
-            else:
-                self._line.set_data(x, y)
-        plt.draw()
+        self._line.set_data(*self._pairs.ref.T)
+        self._blit.request_update(*([self._show_live] if self._live else []))
 
     def _update_plot2(self):
         """Function called in ``_on_click_2`` to update the plot with the new points.
         Updates the plot in axis 2.
 
         """
-        if not self._mov_points:
-            self._line2.set_data([], [])
-        else:
-            x, y = zip(*(self._mov_points))
-            # Add new plot
-            if not self._line2:
-                (self._line2,) = self._axes[1].plot(
-                    x, y, ".", markersize=13, color="tab:orange"
-                )
-            # Update current plot
-            else:
-                self._line2.set_data(x, y)
-        plt.draw()
+        self._line2.set_data(*self._pairs.mov.T)
+        self._blit.request_update(*([self._show_live] if self._live else []))
 
-    def _add_point(self, points: dict, x, y=None):
+    def _add_point(self, x, y=None):
+        """Add a point pair at the same position in both images. Returns the id of the pair."""
         if isinstance(x, MouseEvent):
             x, y = int(x.xdata), int(x.ydata)
-        points.append((x, y))
-        return x, y
-
-    def _remove_point_1(self, x, _):
-        """Remove point from list of points. Called when right clicking on a point in axis 1."""
-        for i in range(len(self._points)):
-            if self._points[i][0] == x:
-                self._points.pop(i)
-                self._mov_points.pop(i)
-                break
-
-    def _remove_point_2(self, x, _):
-        """Remove point from list of points. Called when right clicking on a point in axis 2."""
-        for i in range(len(self._mov_points)):
-            if self._mov_points[i][0] == x:
-                self._points.pop(i)
-                self._mov_points.pop(i)
-                break
-
-    def _find_neighbor_point(self, points: dict, event):
-        """Find point around mouse position.
-        If found, return the point (x, y), otherwise return None.
+        if self._live:
+            self._live["fit"].add((x, y), (x, y))
+        return self._pairs.add((x, y), (x, y))
+
+    def _remove_pair(self, point_id: int):
+        """Remove the point pair with ``point_id``."""
+        row = self._pairs.row(point_id)
+        if self._live and row is not None:
+            self._live["fit"].remove(self._pairs.ref[row], self._pairs.mov[row])
+        self._pairs.remove(point_id)
+
+    def _move_point(self, point_id: int, index: int, xy):
+        """Move the point of the pair with ``point_id`` in the reference (0) or moving (1) image.
+        In the live mode, the pair is replaced in the fit.
 
         """
-        distance_threshold = 100
-        nearest_point = None
-        min_distance = math.sqrt(2 * (100**2))
-        for x, y in points:
-            distance = math.hypot(event.xdata - x, event.ydata - y)
-            if distance < min_distance:
-                min_distance = distance
-                nearest_point = (x, y)
-        if min_distance < distance_threshold:
-            return nearest_point
-        return None
+        row = self._pairs.row(point_id)
+        if self._live and row is not None:
+            self._live["fit"].remove(self._pairs.ref[row], self._pairs.mov[row])
+        self._pairs.move(point_id, index, xy)
+        if self._live and row is not None:
+            self._live["fit"].add(self._pairs.ref[row], self._pairs.mov[row])
+
+    def _find_neighbor_point(self, index: int, event):
+        """Find the point of the reference (0) or moving (1) image within ``PICK_RADIUS`` screen
+        pixels of the mouse position. If found, return the id of its pair, otherwise return None.
+
+        """
+        return self._pairs.nearest(
+            index, (event.x, event.y), PICK_RADIUS, self._axes[index].transData.transform
+        )
+
+    def _click(self, event, index: int):
+        """Add a point pair if left click, remove the pair if right click on a point. If left
+        click on a point, start dragging it. ``index`` is the axis, 0 reference, 1 moving image.
+
+        """
+        if event.inaxes is not self._axes[index]:
+            return
+        point_id = self._find_neighbor_point(index, event)
+        # left click
+        if event.button == 1:
+            if point_id is not None:
+                self._dragging_point = (index, point_id)
+            else:
+                self._add_point(event)
+        # right click
+        elif event.button == 3 and point_id is not None:
+            self._remove_pair(point_id)
+        else:
+            return
+        self._update_plot()
+        self._update_plot2()
 
     def _on_click(self, event):
         """Callback method for mouse click event. Add point if left click, remove point if right
@@ -225,24 +793,7 @@ class PointAlignments:
         event : matplotlib.backend_bases.MouseEvent
 
         """
-        # left click
-        if event.button == 1 and event.inaxes in [self._axes[0]]:
-            point = self._find_neighbor_point(self._points, event)
-            if point:
-                self._dragging_point = point
-            else:
-                self._add_point(self._points, event)
-                self._add_point(self._mov_points, event)
-            self._update_plot()
-            self._update_plot2()
-
-        # right click
-        elif event.button == 3 and event.inaxes in [self._axes[0]]:
-            point = self._find_neighbor_point(self._points, event)
-            if point:
-                self._remove_point_1(*point)
-                self._update_plot()
-                self._update_plot2()
+        self._click(event, 0)
 
     def _on_click_2(self, event):
         """Callback method for mouse click event. Add point if left click, remove point if right
@@ -253,24 +804,17 @@ class PointAlignments:
         event : matplotlib.backend_bases.MouseEvent
 
         """
-        # left click
-        if event.button == 1 and event.inaxes in [self._axes[1]]:
-            point = self._find_neighbor_point(self._mov_points, event)
-            if point:
-                self._dragging_point = point
-            else:
-                self._add_point(self._points, event)
-                self._add_point(self._mov_points, event)
-            self._update_plot()
-            self._update_plot2()
+        self._click(event, 1)
 
-        # right click
-        elif event.button == 3 and event.inaxes in [self._axes[1]]:
-            point = self._find_neighbor_point(self._mov_points, event)
-            if point:
-                self._remove_point_2(*point)
-                self._update_plot()
-                self._update_plot2()
+    def _release(self, event, index: int):
+        """Stop dragging the point of axis ``index`` if left button is released."""
+        if (
+            event.button == 1
+            and self._dragging_point is not None
+            and self._dragging_point[0] == index
+        ):
+            self._dragging_point = None
+            (self._update_plot, self._update_plot2)[index]()
 
     def _on_release(self, event):
         """Callback method for mouse release event. Stop dragging point if left click. Function
@@ -281,30 +825,27 @@ class PointAlignments:
         event : matplotlib.backend_bases.MouseEvent
 
         """
-        if (
-            event.button == 1
-            and event.inaxes in [self._axes[0]]
-            and self._dragging_point
-        ):
-            self._dragging_point = None
-            self._update_plot()
+        self._release(event, 0)
 
     def _on_release_2(self, event):
         """Callback method for mouse release event. Stop dragging point if left click. Function
-        working with axis 1.
+        working with axis 2.
 
         Parameters
         ----------
         event : matplotlib.backend_bases.MouseEvent
 
         """
-        if (
-            event.button == 1
-            and event.inaxes in [self._axes[1]]
-            and self._dragging_point
-        ):
-            self._dragging_point = None
-            self._update_plot2()
+        self._release(event, 1)
+
+    def _motion(self, event, index: int):
+        """Move the dragged point of axis ``index`` to the mouse position."""
+        if self._dragging_point is None or self._dragging_point[0] != index:
+            return
+        if event.inaxes is not self._axes[index] or event.xdata is None or event.ydata is None:
+            return
+        self._move_point(self._dragging_point[1], index, (int(event.xdata), int(event.ydata)))
+        (self._update_plot, self._update_plot2)[index]()
 
     def _on_motion(self, event):
         """Callback method for mouse motion event. If dragging point, update its position. Function
@@ -315,17 +856,7 @@ class PointAlignments:
         event : matplotlib.backend_bases.MouseEvent
 
         """
-        if not self._dragging_point:
-            return
-        if not event.xdata or not event.ydata:
-            return
-        if event.inaxes in [self._axes[0]]:
-            for i in range(len(self._points)):
-                if self._points[i] == self._dragging_point:
-                    self._points[i] = (int(event.xdata), int(event.ydata))
-                    self._dragging_point = (int(event.xdata), int(event.ydata))
-                    break
-            self._update_plot()
+        self._motion(event, 0)
 
     def _on_motion_2(self, event):
         """Callback method for mouse motion event. If dragging point, update its position. Function
@@ -336,36 +867,82 @@ class PointAlignments:
         event : matplotlib.backend_bases.MouseEvent
 
         """
-        if not self._dragging_point:
-            return
-        if not event.xdata or not event.ydata:
+        self._motion(event, 1)
+
+    def _refine_points(self):
+        """Refine all moving points to subpixel accuracy in one batch, the search reaches twice
+        the rebinning factor, the accuracy of the clicks on the rebinned images.
+
+        """
+        refined, scores = refine_points(
+            self._image_dict["ref"],
+            self._image_dict["mov"],
+            self._pairs.ref,
+            self._pairs.mov,
+            search=2 * self._rebin + 2,
+        )
+        for point_id, old, new in zip(self._pairs.ids.copy(), self._pairs.mov.copy(), refined):
+            if not np.array_equal(old, new):
+                self._move_point(point_id, 1, new)
+        self._results["match_scores"] = scores
+        self._update_plot2()
+
+    def _on_key(self, event):
+        """Callback method for key press events. The ``enter`` key estimates the transformation
+        from the current points, see ``_confirm``.
+
+        """
+        if event.key == "enter":
+            if not len(self._pairs):
+                print("Select points in the images first.")
+                return
+            self._confirm()
+            print("Transformation estimated, the result is computed in the background.")
+
+    def _confirm(self):
+        """Estimate the transformation from the current points and start resampling the full
+        resolution result on a background thread. With ``subpixel``, the moving points are
+        refined first. Nothing is recomputed if the points did not change since the last
+        confirmation.
+        Possible alignent techniques are:
+            ``['affine', 'euclidean', 'similarity', 'projective']``
+        By default, ``euclidean`` is used.
+
+        """
+        points, mov_points = self.ref_points, self.mov_points
+        if self._confirmed is not None and all(
+            np.array_equal(new, old) for new, old in zip((points, mov_points), self._confirmed)
+        ):
             return
-        if event.inaxes in [self._axes[1]]:
-            for i in range(len(self._mov_points)):
-                if self._mov_points[i] == self._dragging_point:
-                    self._mov_points[i] = (int(event.xdata), int(event.ydata))
-                    self._dragging_point = (int(event.xdata), int(event.ydata))
-                    break
-            self._update_plot2()
+        if self._params["subpixel"]:
+            self._refine_points()
+            mov_points = self.mov_points
+        self._confirmed = (points, mov_points)
+        inliers, residuals = _estimate(
+            self._trans, points, mov_points, self._method, self._params["robust"], self._rebin
+        )
+        if inliers is not None:
+            self._results["inliers"] = inliers
+            self._results["residuals"] = residuals
+            if not inliers.all():
+                print(f"Rejected point pairs: {np.flatnonzero(~inliers).tolist()}")
+        self._results["result_view"] = self._trans.get_transformed_view()
+        self._results["tmat"] = self._trans.get_combined_transform()
+        self._results["result_future"] = self.result_view.materialise_async()
+        self._results["result_image"] = None
+        self._results["metrics"] = None
 
     def _on_close(self, event):
         """Callback method for closing the figure.
-        Points are transformed to numpy ndarray and saved to ``self._points`` and
-        ``self._mov_points``. Alignments from ``ImageTransformer`` are saved to self._tmat.
+        The transformation is estimated, unless the points were confirmed by the ``enter`` key.
         If ``show_result`` is True, the result image is shown.
-        Possible alignent techniques are:
-            ``['affine', 'euclidean', 'similarity', 'projective']``
-        By default, ``euclidean`` is used.
 
         """
         del event
-        self._points = np.array(self._points).reshape(-1, 2)
-        self._mov_points = np.array(self._mov_points).reshape(-1, 2)
-        self._trans.estimate_transform(self._points, self._mov_points, method=self._method)
-        self._results["result_image"] = self._trans.get_transformed_image()
-        self._results["tmat"] = self._trans.get_combined_transform()
+        self._confirm()
         if self._show_result:
-            plt.figure("Result of alignment")
-            plt.imshow(self._image_dict["ref"], cmap="gray")
-            plt.imshow(self.result_image, cmap="gray", alpha=0.5)
+            self._results["overlay"] = OverlayPreview(
+                self._image_dict["ref"], self._image_dict["mov"], self.tmat
+            )
+            self._results["overlay"].show(title="Result of alignment")
             plt.show()
@@ -0,0 +1,102 @@
+""" Module containing the rebinned previews of the images displayed by the interactive aligners.
+Previews are binned by integer block means and memoised per image object and rebinning factor,
+so an image opened in several aligners, e.g. a crop, point and fine alignment of the same pair,
+is binned only once.
+
+"""
+
+import hashlib
+import threading
+import weakref
+import numpy as np
+from align_panel.image_transformer import _FrameCache
+from align_panel.align.registration import bin_image
+
+# previews of the recently displayed images, the least recently used are evicted first
+_PREVIEWS = _FrameCache(max_bytes=512 * 2**20)
+_PREVIEWS_LOCK = threading.RLock()
+# ids of the images with a finalizer evicting their previews
+_WATCHED = set()
+# number of pixels sampled for the fingerprint of an image
+_FINGERPRINT_SIZE = 4096
+
+
+def _fingerprint(image: np.ndarray):
+    """Hash of the shape, dtype and a regular sample of the pixels of an image. It detects an image
+    which was modified in place, or a new image reusing the id of a collected one, at a cost
+    independent of the image size.
+
+    """
+    step = max(1, int(np.sqrt(image.size / _FINGERPRINT_SIZE)))
+    sample = np.ascontiguousarray(image[::step, ::step])
+    digest = hashlib.blake2b(sample.tobytes(), digest_size=16)
+    digest.update(repr((image.shape, image.dtype.str)).encode())
+    return digest.digest()
+
+
+def _forget(source_id: int):
+    """Evict the previews of a collected image."""
+    with _PREVIEWS_LOCK:
+        _WATCHED.discard(source_id)
+        _PREVIEWS.evict(lambda key: key[0] == source_id)
+
+
+def preview(image, factor: int):
+    """Rebinned preview of an image for display. The image is binned by the mean of blocks of
+    ``factor`` x ``factor`` pixels, rows and columns which do not fill a whole block are dropped.
+    Previews are shared between the calls with the same image object and factor, they are
+    read-only. Arrays are recognised by their identity and a fingerprint of their pixels, other
+    images, e.g. a ``TransformedView``, only by their identity.
+
+    Parameters
+    ----------
+    image : np.ndarray or TransformedView
+        Image to be previewed.
+    factor : int
+        Rebinning factor.
+
+    Returns
+    -------
+    preview : np.ndarray
+        Binned image, a read-only view of the image for the factor 1.
+
+    """
+    factor = int(factor)
+    if factor < 1:
+        raise ValueError(f"Rebinning factor must be a positive integer, got {factor}")
+    if factor == 1:
+        view = np.asarray(image).view()
+        view.flags.writeable = False
+        return view
+    is_array = isinstance(image, np.ndarray)
+    key = (id(image), factor, _fingerprint(image) if is_array else None)
+    with _PREVIEWS_LOCK:
+        binned = _PREVIEWS.get(key)
+    if binned is not None:
+        return binned
+    binned = bin_image(image if is_array else np.asarray(image), factor)
+    with _PREVIEWS_LOCK:
+        if id(image) not in _WATCHED:
+            try:
+                weakref.finalize(image, _forget, id(image))
+            except TypeError:
+                # objects without weak references, e.g. lists, are binned on every call
+                return binned
+            _WATCHED.add(id(image))
+        _PREVIEWS.put(key, binned)
+    return binned
+
+
+def preview_extent(image, factor: int):
+    """Extent of the preview of ``image`` in the pixel coordinates of the full image, for
+    ``matplotlib.pyplot.imshow``. The rows and columns dropped by the binning are excluded.
+
+    """
+    rows, cols = np.shape(image)[:2]
+    return [0, cols // factor * factor, rows // factor * factor, 0]
+
+
+def clear_previews():
+    """Evict all memoised previews."""
+    with _PREVIEWS_LOCK:
+        _PREVIEWS.clear()
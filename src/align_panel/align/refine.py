@@ -0,0 +1,185 @@
+""" Module containing the iterative intensity-based refinement of an alignment. Starting from an
+approximate transformation, e.g. from a cross correlation, the enhanced correlation coefficient
+(ECC) of the reference image and the warped moving image is maximised by Gauss-Newton iterations
+of the Lucas-Kanade type, coarse to fine on an image pyramid.
+
+Reference: G. D. Evangelidis, E. Z. Psarakis, Parametric Image Alignment Using Enhanced
+Correlation Coefficient Maximization, IEEE TPAMI 30 (2008) 1858.
+
+"""
+
+import numpy as np
+from scipy import ndimage as ndi
+from skimage import transform as sktransform
+from align_panel.align.registration import build_pyramid, pyramid_levels, rescale_matrix
+
+# number of parameters of the motion models
+MOTIONS = {"translation": 2, "affine": 6, "projective": 8}
+
+
+def _to_matrix(params: np.ndarray, motion: str):
+    """Transformation matrix of the motion parameters, the identity for zero parameters."""
+    matrix = np.eye(3)
+    if motion == "translation":
+        matrix[:2, 2] += params
+    else:
+        matrix[:2] += params[:6].reshape(2, 3)
+        if motion == "projective":
+            matrix[2, :2] += params[6:]
+    return matrix
+
+
+def _to_params(matrix: np.ndarray, motion: str):
+    """Motion parameters of a transformation matrix, normalised so that ``matrix[2, 2]`` is 1."""
+    matrix = matrix / matrix[2, 2]
+    if motion == "translation":
+        return matrix[:2, 2].copy()
+    params = (matrix - np.eye(3))[:2].ravel()
+    if motion == "projective":
+        params = np.concatenate((params, matrix[2, :2]))
+    return params
+
+
+def _jacobian(grad_x, grad_y, x, y, mapped_x, mapped_y, weight, motion: str):
+    """Steepest descent images, the image gradient times the derivative of the warp by the motion
+    parameters, one column per parameter.
+
+    """
+    if motion == "translation":
+        return np.stack((grad_x, grad_y), axis=1)
+    grad_x, grad_y = grad_x * weight, grad_y * weight
+    columns = [grad_x * x, grad_x * y, grad_x, grad_y * x, grad_y * y, grad_y]
+    if motion == "projective":
+        dot = grad_x * mapped_x + grad_y * mapped_y
+        columns += [-dot * x, -dot * y]
+    return np.stack(columns, axis=1)
+
+
+def _ecc_level(ref_image, mov_image, matrix, motion, max_iter, tol):
+    """ECC iterations on one pyramid level. The parameters are estimated in coordinates centred on
+    the reference image, which keeps the normal equations well conditioned.
+
+    """
+    center = (np.array(ref_image.shape[::-1], dtype=float) - 1) / 2
+    to_centre = np.array([[1.0, 0.0, center[0]], [0.0, 1.0, center[1]], [0.0, 0.0, 1.0]])
+    from_centre = np.linalg.inv(to_centre)
+    rows, cols = np.indices(ref_image.shape, dtype=np.float64)
+    x, y = cols.ravel() - center[0], rows.ravel() - center[1]
+    template = ref_image.ravel().astype(np.float64)
+    grad_rows, grad_cols = np.gradient(mov_image.astype(np.float64))
+    corners = np.array([[-1, -1], [1, -1], [-1, 1], [1, 1]], dtype=float) * center
+    params = _to_params(from_centre @ matrix @ to_centre, motion)
+    rho = -np.inf
+    for _ in range(max_iter):
+        centred = _to_matrix(params, motion)
+        homogeneous = centred @ np.stack((x, y, np.ones_like(x)))
+        weight = 1.0 / homogeneous[2]
+        mapped_x, mapped_y = homogeneous[0] * weight, homogeneous[1] * weight
+        coords = np.stack((mapped_y + center[1], mapped_x + center[0]))
+        valid = (
+            (coords[0] >= 0) & (coords[0] <= mov_image.shape[0] - 1)
+            & (coords[1] >= 0) & (coords[1] <= mov_image.shape[1] - 1)
+        )
+        if valid.sum() <= 2 * MOTIONS[motion]:
+            break
+        coords = coords[:, valid]
+        warped = ndi.map_coordinates(mov_image, coords, order=1).astype(np.float64)
+        grad_x = ndi.map_coordinates(grad_cols, coords, order=1)
+        grad_y = ndi.map_coordinates(grad_rows, coords, order=1)
+        jacobian = _jacobian(grad_x, grad_y, x[valid], y[valid], mapped_x[valid],
+                             mapped_y[valid], weight[valid], motion)
+        target = template[valid] - template[valid].mean()
+        warped -= warped.mean()
+        jacobian -= jacobian.mean(axis=0)
+        hessian = jacobian.T @ jacobian
+        try:
+            hessian_inv = np.linalg.inv(hessian)
+        except np.linalg.LinAlgError:
+            break
+        warped_proj = jacobian.T @ warped
+        target_proj = jacobian.T @ target
+        norms = np.linalg.norm(target) * np.linalg.norm(warped)
+        if not norms:
+            break
+        rho = float(target @ warped / norms)
+        numerator = warped @ warped - warped_proj @ hessian_inv @ warped_proj
+        denominator = target @ warped - target_proj @ hessian_inv @ warped_proj
+        if denominator <= 0:
+            break
+        error = numerator / denominator * target - warped
+        delta = hessian_inv @ (jacobian.T @ error)
+        updated = _to_matrix(params + delta, motion)
+        params = params + delta
+        moved = updated @ np.vstack((corners.T, np.ones(4)))
+        moved = moved[:2] / moved[2]
+        previous = centred @ np.vstack((corners.T, np.ones(4)))
+        previous = previous[:2] / previous[2]
+        if np.abs(moved - previous).max() < tol:
+            break
+    return to_centre @ _to_matrix(params, motion) @ from_centre, rho
+
+
+def refine_ecc(
+    ref_image: np.ndarray,
+    mov_image: np.ndarray,
+    initial=None,
+    motion: str = "affine",
+    levels: int = 3,
+    downscale: int = 2,
+    max_iter: int = 50,
+    tol: float = 1e-3,
+    sigma: float = 1.0,
+):
+    """Refine a transformation by maximising the enhanced correlation coefficient of the reference
+    image and the warped moving image, coarse to fine.
+
+    Parameters
+    ----------
+    ref_image : np.ndarray
+        Reference image.
+    mov_image : np.ndarray
+        Image to be aligned.
+    initial : sktransform.ProjectiveTransform or np.ndarray, optional
+        Initial transformation, in the convention of ``align_auto``. It has to be within a few
+        pixels of the solution at the coarsest level. The default is None, the identity.
+    motion : str, optional
+        Motion model, ``translation``, ``affine`` or ``projective``. The default is ``affine``.
+    levels : int, optional
+        Number of pyramid levels, reduced for small images. The default is 3.
+    downscale : int, optional
+        Downscale factor between the levels. The default is 2.
+    max_iter : int, optional
+        Maximal number of iterations per level. The default is 50.
+    tol : float, optional
+        Iterations on a level stop when an update moves no corner by more than ``tol`` pixels of
+        that level. The default is 1e-3.
+    sigma : float, optional
+        Standard deviation of the Gaussian smoothing of both images, which widens the basin of
+        convergence. The default is 1, 0 disables the smoothing.
+
+    Returns
+    -------
+    transform : sktransform.AffineTransform or sktransform.ProjectiveTransform
+        Refined transformation, projective for the ``projective`` motion.
+
+    """
+    if motion not in MOTIONS:
+        raise ValueError(f"Unknown motion model: {motion}")
+    ref_image = np.asarray(ref_image, dtype=np.float32)
+    mov_image = np.asarray(mov_image, dtype=np.float32)
+    if sigma:
+        ref_image = ndi.gaussian_filter(ref_image, sigma)
+        mov_image = ndi.gaussian_filter(mov_image, sigma)
+    matrix = np.eye(3) if initial is None else np.array(getattr(initial, "params", initial))
+    levels = pyramid_levels(ref_image.shape, levels, downscale)
+    ref_pyramid = build_pyramid(ref_image, levels, downscale)
+    mov_pyramid = build_pyramid(mov_image, levels, downscale)
+    for level in reversed(range(levels)):
+        level_matrix = rescale_matrix(matrix, 1 / downscale**level)
+        level_matrix, _ = _ecc_level(
+            ref_pyramid[level], mov_pyramid[level], level_matrix, motion, max_iter, tol
+        )
+        matrix = rescale_matrix(level_matrix, downscale**level)
+    if motion == "projective":
+        return sktransform.ProjectiveTransform(matrix=matrix / matrix[2, 2])
+    return sktransform.AffineTransform(matrix=matrix)
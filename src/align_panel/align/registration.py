@@ -0,0 +1,594 @@
+""" Module containing registration building blocks used by the automatic alignments.
+The functions work on ``numpy`` arrays and return ``skimage`` transforms in the convention of the
+ImageTransformer class, i.e. mapping the pixels of the aligned image to the moving image.
+
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy import fft
+from scipy import ndimage as ndi
+from skimage import transform as sktransform
+from skimage.filters import window as get_window
+from skimage.transform import pyramid_reduce, warp_polar
+from align_panel.image_transformer import ImageTransformer, _FrameCache
+
+# coordinate maps of the rotation scan, shared by repeated scans of images of the same shape
+_ROTATION_MAPS = _FrameCache(max_bytes=256 * 2**20)
+_ROTATION_MAPS_LOCK = threading.Lock()
+
+
+def bin_image(image: np.ndarray, factor: int):
+    """Integer block-mean binning of an image. Rows and columns which do not fill a whole block
+    are dropped.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to be binned.
+    factor : int
+        Binning factor.
+
+    Returns
+    -------
+    binned : np.ndarray
+        Binned image, floating point images keep their dtype.
+
+    """
+    if factor == 1:
+        return image
+    rows, cols = image.shape[0] // factor, image.shape[1] // factor
+    blocks = image[: rows * factor, : cols * factor].reshape(rows, factor, cols, factor)
+    dtype = image.dtype if np.issubdtype(image.dtype, np.floating) else np.float64
+    return blocks.mean(axis=(1, 3), dtype=dtype)
+
+
+def build_pyramid(image: np.ndarray, levels: int, downscale: int = 2, mode: str = "binned"):
+    """Build an image pyramid, finest level first.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image at full resolution.
+    levels : int
+        Number of levels, including the full resolution image.
+    downscale : int, optional
+        Downscale factor between the levels. The default is 2.
+    mode : str, optional
+        ``binned`` for block-mean binning or ``gaussian`` for Gaussian smoothing and resampling.
+        The default is ``binned``.
+
+    Returns
+    -------
+    pyramid : list
+        List of images, the first one is the input image.
+
+    """
+    pyramid = [image]
+    for _ in range(levels - 1):
+        if mode == "binned":
+            pyramid.append(bin_image(pyramid[-1], downscale))
+        elif mode == "gaussian":
+            pyramid.append(pyramid_reduce(pyramid[-1], downscale=downscale, preserve_range=True))
+        else:
+            raise ValueError(f"Unknown pyramid mode: {mode}")
+    return pyramid
+
+
+def pyramid_levels(shape: tuple, levels: int, downscale: int = 2, min_size: int = 32):
+    """Limit the number of pyramid levels so the coarsest level keeps at least ``min_size``
+    pixels along both axes.
+
+    """
+    levels = max(int(levels), 1)
+    while levels > 1 and min(shape) // downscale ** (levels - 1) < min_size:
+        levels -= 1
+    return levels
+
+
+def rescale_matrix(matrix: np.ndarray, factor: float):
+    """Convert a transformation matrix of images binned by ``factor`` to the images ``factor``
+    times larger. Pixel centres of a bin of size ``factor`` sit at ``factor * p + (factor - 1) / 2``
+    of the finer image. ``1 / factor`` converts a full resolution matrix to the binned images.
+
+    """
+    offset = (factor - 1) / 2
+    scale = np.array([[factor, 0.0, offset], [0.0, factor, offset], [0.0, 0.0, 1.0]])
+    return scale @ np.asarray(matrix, dtype=float) @ np.linalg.inv(scale)
+
+
+def rescale_transform(transform, factor: float):
+    """Convert a transform estimated on an image binned by ``factor`` to the image ``factor``
+    times larger, see ``rescale_matrix``.
+
+    """
+    return sktransform.AffineTransform(matrix=rescale_matrix(transform.params, factor))
+
+
+def warp_to(image: np.ndarray, transform, output_shape: tuple = None):
+    """Warp ``image`` with ``transform``, samples outside of the image are set to its mean, so the
+    result can be passed to the registration methods, which do not accept NaN values.
+
+    """
+    trans = ImageTransformer(image)
+    trans.add_transform(transform, output_shape=output_shape)
+    return trans.warp_preserving_dtype(cval=float(np.mean(image)))
+
+
+def register_pyramid(
+    ref_image: np.ndarray,
+    mov_image: np.ndarray,
+    register,
+    levels: int = 3,
+    downscale: int = 2,
+    mode: str = "binned",
+    max_iter: int = 3,
+    tol: float = 0.5,
+):
+    """Coarse-to-fine registration. ``register`` is run on the coarsest level of a pyramid of both
+    images. The result is propagated to the finer levels, where only the residual is registered,
+    on a centred window of the size of the coarsest level, at most ``max_iter`` times per level.
+    Every level therefore costs about the same as the coarsest one.
+
+    Parameters
+    ----------
+    ref_image : np.ndarray
+        Reference image.
+    mov_image : np.ndarray
+        Image to be aligned.
+    register : callable
+        Function ``register(ref_image, mov_image)`` returning a ``skimage`` transform.
+    levels : int, optional
+        Number of pyramid levels, reduced for small images. The default is 3.
+    downscale : int, optional
+        Downscale factor between the levels. The default is 2.
+    mode : str, optional
+        Pyramid type, ``binned`` or ``gaussian``. The default is ``binned``.
+    max_iter : int, optional
+        Maximal number of registrations per level. The default is 3.
+    tol : float, optional
+        Iterations on a level stop when the residual moves no corner of the window by more than
+        ``tol`` pixels of that level. The default is 0.5.
+
+    Returns
+    -------
+    transform : sktransform.AffineTransform
+        Transformation for the full resolution images.
+
+    """
+    levels = pyramid_levels(ref_image.shape, levels, downscale)
+    ref_pyramid = build_pyramid(ref_image, levels, downscale, mode)
+    mov_pyramid = build_pyramid(mov_image, levels, downscale, mode)
+    window_shape = ref_pyramid[-1].shape
+    current = sktransform.AffineTransform()
+    for level in reversed(range(levels)):
+        ref_level = ref_pyramid[level]
+        if level < levels - 1:
+            current = rescale_transform(current, downscale)
+        offset = (np.array(ref_level.shape) - window_shape) // 2
+        to_window = sktransform.EuclideanTransform(translation=offset[::-1]).params
+        ref_window = ref_level[
+            offset[0] : offset[0] + window_shape[0], offset[1] : offset[1] + window_shape[1]
+        ]
+        corners = np.array(
+            [[0, 0], [window_shape[1], 0], [0, window_shape[0]], window_shape[::-1]], dtype=float
+        )
+        for _ in range(max_iter):
+            window_transform = current.params @ to_window
+            if np.allclose(window_transform, np.eye(3)):
+                warped = mov_pyramid[level][: window_shape[0], : window_shape[1]]
+            else:
+                warped = warp_to(mov_pyramid[level], window_transform, output_shape=window_shape)
+            residual = register(ref_window, warped)
+            current = sktransform.AffineTransform(
+                matrix=window_transform @ residual.params @ np.linalg.inv(to_window)
+            )
+            if np.abs(residual(corners) - corners).max() <= tol:
+                break
+    return current
+
+
+def _upsampled_dft(half_spectrum: np.ndarray, shape: tuple, region_size: int,
+                   upsample_factor: int, offsets):
+    """Unnormalised inverse DFT of a real image, given by its ``rfft2`` half spectrum, evaluated
+    only on a ``region_size`` square region of the grid upsampled by ``upsample_factor``, starting
+    at ``offsets``. Matrix multiplication form of Guizar-Sicairos et al., Opt. Lett. 33, 156 (2008).
+    The missing half of the spectrum is accounted for by the Hermitian symmetry.
+
+    """
+    n_rows, n_cols = shape
+    weights = np.full(half_spectrum.shape[1], 2.0)
+    weights[0] = 1.0
+    if n_cols % 2 == 0:
+        weights[-1] = 1.0
+    col_kernel = (np.arange(region_size) - offsets[1])[:, np.newaxis] * np.fft.rfftfreq(
+        n_cols, upsample_factor
+    )
+    row_kernel = (np.arange(region_size) - offsets[0])[:, np.newaxis] * np.fft.fftfreq(
+        n_rows, upsample_factor
+    )
+    data = (np.exp(2j * np.pi * col_kernel) * weights) @ half_spectrum.T
+    return (np.exp(2j * np.pi * row_kernel) @ data.T).real
+
+
+class RegistrationTarget:
+    """Reference image prepared for repeated cross-correlation. The windowed spectrum of the
+    reference, its conjugate and its norm are computed once, registering a moving image then
+    costs one forward FFT, one inverse FFT and a local upsampled DFT around the peak.
+
+    Attributes
+    ----------
+    ref_image : np.ndarray
+        Reference image.
+    _params : dict
+        Dictionary containing the upsample factor, the window bool parameter and the
+        normalization.
+    _window : np.ndarray
+        Hann window applied to both images, or None.
+    _ref_fft : np.ndarray
+        Half spectrum (``rfft2``) of the windowed reference image.
+    _ref_norm : float
+        Norm of the windowed reference image.
+
+    """
+
+    def __init__(
+        self,
+        ref_image: np.ndarray,
+        upsample_factor: int = 2,
+        window: bool = True,
+        normalization: str = None,
+    ):
+        """
+        Parameters
+        ----------
+        ref_image : np.ndarray
+            Reference image.
+        upsample_factor : int, optional
+            Subpixel precision of the shift is ``1 / upsample_factor``. The default is 2.
+        window : bool, optional
+            If True, a Hann window is applied to the images to suppress the edges.
+            The default is True.
+        normalization : str, optional
+            ``phase`` for phase correlation, None for cross-correlation. The default is None.
+
+        """
+        self.ref_image = np.asarray(ref_image)
+        self._params = {
+            "upsample_factor": upsample_factor,
+            "window": window,
+            "normalization": normalization,
+        }
+        self._window = get_window("hann", self.ref_image.shape) if window else None
+        prepared = self._prepare(self.ref_image)
+        self._ref_fft = fft.rfft2(prepared, workers=-1)
+        self._ref_norm = float(np.sqrt((prepared**2).sum()))
+
+    @property
+    def shape(self):
+        return self.ref_image.shape
+
+    @property
+    def ref_conj(self):
+        """Complex conjugate of the spectrum of the windowed reference image."""
+        return np.conj(self._ref_fft)
+
+    def _prepare(self, image: np.ndarray):
+        # float32 images stay float32, the FFTs are then computed in single precision
+        dtype = image.dtype if image.dtype == np.float32 else np.float64
+        image = image - image.mean(dtype=dtype)
+        if self._window is not None:
+            image *= self._window.astype(dtype, copy=False)
+        return image
+
+    def register(self, mov_image: np.ndarray):
+        """Find the shift registering ``mov_image`` with the reference.
+
+        Parameters
+        ----------
+        mov_image : np.ndarray
+            Image to be aligned, of the shape of the reference.
+
+        Returns
+        -------
+        shifts : np.ndarray
+            Shift (row, column) registering the moving image with the reference, in the
+            convention of ``skimage.registration.phase_cross_correlation``.
+        peak : float
+            Height of the correlation peak normalised by the norms of both images, 1 for
+            identical images. Only meaningful without phase normalisation.
+
+        """
+        mov_image = np.asarray(mov_image)
+        if mov_image.shape != self.shape:
+            raise ValueError("The moving image must have the shape of the reference image")
+        prepared = self._prepare(mov_image)
+        mov_norm = float(np.sqrt((prepared**2).sum()))
+        product = fft.rfft2(prepared, workers=-1)
+        np.conj(product, out=product)
+        product *= self._ref_fft
+        if self._params["normalization"] == "phase":
+            product /= np.maximum(np.abs(product), 100 * np.finfo(product.dtype).eps)
+        correlation = fft.irfft2(product, s=self.shape, workers=-1)
+        maxima = np.array(np.unravel_index(np.argmax(np.abs(correlation)), correlation.shape))
+        midpoints = np.array(self.shape) // 2
+        shifts = maxima.astype(float)
+        shifts[shifts > midpoints] -= np.array(self.shape)[shifts > midpoints]
+        peak = np.abs(correlation[tuple(maxima)])
+
+        upsample_factor = self._params["upsample_factor"]
+        if upsample_factor > 1:
+            shifts = np.round(shifts * upsample_factor) / upsample_factor
+            region_size = int(np.ceil(upsample_factor * 1.5))
+            dftshift = np.fix(region_size / 2.0)
+            region = _upsampled_dft(
+                product,
+                self.shape,
+                region_size,
+                upsample_factor,
+                dftshift - shifts * upsample_factor,
+            )
+            local = np.array(np.unravel_index(np.argmax(np.abs(region)), region.shape))
+            shifts = shifts + (local - dftshift) / upsample_factor
+            peak = np.abs(region[tuple(local)]) / correlation.size
+        norm = self._ref_norm * mov_norm
+        return shifts, float(peak / norm) if norm else np.nan
+
+    def transform(self, mov_image: np.ndarray):
+        """Transformation aligning ``mov_image`` to the reference, in the convention of
+        ``align_auto``.
+
+        """
+        shifts, _ = self.register(mov_image)
+        return sktransform.EuclideanTransform(translation=-shifts[::-1])
+
+
+def _central_square(image: np.ndarray):
+    side = min(image.shape)
+    row, col = (image.shape[0] - side) // 2, (image.shape[1] - side) // 2
+    return image[row : row + side, col : col + side]
+
+
+def log_polar_spectrum(image: np.ndarray, radius: int, n_angles: int = 720):
+    """Magnitude spectrum of the central square of an image resampled to log-polar coordinates.
+    The spectrum is high-pass filtered (Reddy and Chatterji, IEEE Trans. Image Process. 5, 1266
+    (1996)) and only the half of the angles is returned, the other half being symmetric.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Input image.
+    radius : int
+        Largest radius of the spectrum in pixels.
+    n_angles : int, optional
+        Number of angles of the full circle. The default is 720.
+
+    Returns
+    -------
+    spectrum : np.ndarray
+        Array of shape (n_angles // 2, 2 * radius), rows are angles, columns log-radii.
+
+    """
+    square = _central_square(np.asarray(image, dtype=float))
+    square = (square - square.mean()) * get_window("hann", square.shape)
+    magnitude = np.abs(fft.fftshift(fft.fft2(square, workers=-1)))
+    freqs = fft.fftshift(fft.fftfreq(square.shape[0]))
+    cosines = np.cos(np.pi * freqs)
+    highpass = np.outer(cosines, cosines)
+    magnitude *= (1.0 - highpass) * (2.0 - highpass)
+    log_polar = warp_polar(
+        magnitude, radius=radius, output_shape=(n_angles, 2 * radius), scaling="log", order=1
+    )
+    return log_polar[: n_angles // 2]
+
+
+def fourier_mellin(
+    ref_image: np.ndarray,
+    mov_image: np.ndarray,
+    upsample_factor: int = 20,
+    n_angles: int = 720,
+):
+    """Recover rotation, uniform scale and translation between two images. Rotation and scale
+    become shifts of the log-polar magnitude spectra, which are found by cross-correlation, and the
+    translation is found by cross-correlation of the rotated and scaled moving image. The 180 degree
+    ambiguity of the spectrum is resolved by the higher correlation peak.
+
+    Parameters
+    ----------
+    ref_image : np.ndarray
+        Reference image.
+    mov_image : np.ndarray
+        Image to be aligned, of the shape of the reference.
+    upsample_factor : int, optional
+        Subpixel factor of the cross-correlations. The default is 20.
+    n_angles : int, optional
+        Angular sampling of the log-polar spectra over the full circle. The default is 720.
+
+    Returns
+    -------
+    transform : sktransform.AffineTransform
+        Composed transformation aligning the moving image to the reference, in the convention
+        of ``align_auto``.
+
+    """
+    ref_image, mov_image = np.asarray(ref_image), np.asarray(mov_image)
+    radius = min(ref_image.shape) // 4
+    spectrum_target = RegistrationTarget(
+        log_polar_spectrum(ref_image, radius, n_angles),
+        upsample_factor=upsample_factor,
+        window=False,
+    )
+    shifts, _ = spectrum_target.register(log_polar_spectrum(mov_image, radius, n_angles))
+    angle = -np.deg2rad(shifts[0] * 360.0 / n_angles)
+    scale = np.exp(shifts[1] * np.log(radius) / (2 * radius))
+
+    center = np.array(ref_image.shape[::-1]) / 2.0 - 0.5
+    to_center = sktransform.EuclideanTransform(translation=center).params
+    from_center = sktransform.EuclideanTransform(translation=-center).params
+    target = RegistrationTarget(ref_image, upsample_factor=upsample_factor)
+    best_peak, best_matrix = -np.inf, None
+    for candidate in (angle, angle + np.pi):
+        similarity = sktransform.SimilarityTransform(rotation=candidate, scale=scale).params
+        matrix = to_center @ similarity @ from_center
+        warped = warp_to(mov_image, sktransform.AffineTransform(matrix=matrix), ref_image.shape)
+        shifts, peak = target.register(warped)
+        if peak > best_peak:
+            translation = sktransform.EuclideanTransform(translation=-shifts[::-1])
+            best_peak, best_matrix = peak, matrix @ translation.params
+    return sktransform.AffineTransform(matrix=best_matrix)
+
+
+def _rotation_maps(shape: tuple, angles: np.ndarray):
+    """Coordinate maps (row, col) of the rotations of an image about its centre by ``angles`` in
+    radians, array of shape (len(angles), 2) + shape. Maps are cached for repeated scans.
+
+    """
+    key = ("rotation", tuple(shape), np.round(angles, 12).tobytes())
+    with _ROTATION_MAPS_LOCK:
+        maps = _ROTATION_MAPS.get(key)
+    if maps is not None:
+        return maps
+    center = np.array(shape[::-1]) / 2.0 - 0.5
+    rows, cols = np.indices(shape, dtype=np.float32)
+    x, y = cols - np.float32(center[0]), rows - np.float32(center[1])
+    cosines = np.cos(angles).astype(np.float32)[:, None, None]
+    sines = np.sin(angles).astype(np.float32)[:, None, None]
+    maps = np.stack(
+        (sines * x + cosines * y + np.float32(center[1]),
+         cosines * x - sines * y + np.float32(center[0])),
+        axis=1,
+    )
+    with _ROTATION_MAPS_LOCK:
+        _ROTATION_MAPS.put(key, maps)
+    return maps
+
+
+def _rotation_peaks(target: RegistrationTarget, mov_image: np.ndarray, angles: np.ndarray):
+    """Normalised cross-correlation peaks of the reference of ``target`` and the moving image
+    rotated by each of ``angles``, computed as one batched FFT.
+
+    """
+    maps = _rotation_maps(target.shape, angles)
+    cval = float(mov_image.mean())
+    stack = np.empty((len(angles),) + target.shape, dtype=np.float32)
+    for index, coords in enumerate(maps):
+        ndi.map_coordinates(mov_image, coords, output=stack[index], order=1, cval=cval)
+    stack -= stack.mean(axis=(1, 2), keepdims=True)
+    if target._window is not None:
+        stack *= target._window.astype(np.float32)
+    norms = np.sqrt((stack**2).sum(axis=(1, 2)))
+    spectra = fft.rfft2(stack, axes=(1, 2), workers=1)
+    np.conj(spectra, out=spectra)
+    spectra *= target._ref_fft
+    correlation = fft.irfft2(spectra, s=target.shape, axes=(1, 2), workers=1)
+    peaks = np.abs(correlation).reshape(len(angles), -1).max(axis=1)
+    return peaks / np.maximum(norms * target._ref_norm, np.finfo(np.float32).tiny)
+
+
+def _scan(target, mov_image, angles, batch_size, workers):
+    """Correlation peaks of all angles, batches of angles are processed on a thread pool."""
+    batches = [angles[start : start + batch_size] for start in range(0, len(angles), batch_size)]
+    if workers == 1 or len(batches) == 1:
+        return np.concatenate([_rotation_peaks(target, mov_image, batch) for batch in batches])
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return np.concatenate(
+            list(executor.map(lambda batch: _rotation_peaks(target, mov_image, batch), batches))
+        )
+
+
+def _parabolic_peak(angles: np.ndarray, peaks: np.ndarray):
+    """Angle of the vertex of the parabola through the highest peak and its neighbours."""
+    index = int(np.argmax(peaks))
+    if index == 0 or index == len(angles) - 1:
+        return angles[index]
+    left, center, right = peaks[index - 1 : index + 2]
+    curvature = left - 2 * center + right
+    if curvature >= 0:
+        return angles[index]
+    step = angles[index + 1] - angles[index]
+    return angles[index] + 0.5 * step * (left - right) / curvature
+
+
+def rotation_scan(
+    ref_image: np.ndarray,
+    mov_image: np.ndarray,
+    max_angle: float = 180.0,
+    step: float = 1.0,
+    refine: bool = True,
+    upsample_factor: int = 20,
+    scan_size: int = 128,
+    batch_size: int = 16,
+    workers: int = None,
+):
+    """Brute-force search of the rotation between two images. The moving image is rotated about
+    its centre over a grid of angles and correlated with the reference, batches of angles are
+    correlated as one FFT stack on a thread pool. The scan runs on images binned to about
+    ``scan_size`` pixels, the best angle is refined at full resolution by a finer scan around it and
+    a parabolic fit of the correlation peaks, the translation is then found by the upsampled
+    cross-correlation. Unlike ``fourier_mellin``, the search does not need strong spectral
+    features, only an overall correlation of the images.
+
+    Parameters
+    ----------
+    ref_image : np.ndarray
+        Reference image.
+    mov_image : np.ndarray
+        Image to be aligned, of the shape of the reference.
+    max_angle : float, optional
+        Angles from ``-max_angle`` to ``max_angle`` degrees are scanned. The default is 180.
+    step : float, optional
+        Step of the scan in degrees. The default is 1.
+    refine : bool, optional
+        If True, the best angle is refined. The default is True.
+    upsample_factor : int, optional
+        Subpixel factor of the translation. The default is 20.
+    scan_size : int, optional
+        Smaller side of the binned images of the scan. The default is 128.
+    batch_size : int, optional
+        Number of angles correlated as one FFT stack. The default is 16.
+    workers : int, optional
+        Number of threads. The default is None, the number of CPUs.
+
+    Returns
+    -------
+    transform : sktransform.AffineTransform
+        Transformation aligning the moving image to the reference, in the convention of
+        ``align_auto``.
+    profile : tuple
+        Scanned angles in degrees and the normalised correlation peak of each angle.
+
+    """
+    ref_image = np.asarray(ref_image)
+    mov_image = np.asarray(mov_image, dtype=np.float32)
+    if mov_image.shape != ref_image.shape:
+        raise ValueError("The moving image must have the shape of the reference image")
+    target = RegistrationTarget(ref_image.astype(np.float32), upsample_factor=upsample_factor)
+    factor = max(1, min(ref_image.shape) // scan_size)
+    if factor > 1:
+        scan_target = RegistrationTarget(bin_image(target.ref_image, factor))
+        scan_image = bin_image(mov_image, factor)
+    else:
+        scan_target, scan_image = target, mov_image
+    n_steps = int(np.floor(max_angle / step))
+    angles = step * np.arange(-n_steps, n_steps + 1)
+    if max_angle >= 180.0:
+        # -180 and 180 degrees are the same rotation
+        angles = angles[angles > -180.0]
+    peaks = _scan(scan_target, scan_image, np.deg2rad(angles), batch_size, workers)
+    best = angles[np.argmax(peaks)]
+    if refine:
+        fine_angles = best + np.linspace(-step, step, 11)
+        fine_peaks = _scan(target, mov_image, np.deg2rad(fine_angles), batch_size, workers)
+        best = _parabolic_peak(fine_angles, fine_peaks)
+
+    center = np.array(ref_image.shape[::-1]) / 2.0 - 0.5
+    rotation = (
+        sktransform.EuclideanTransform(translation=center).params
+        @ sktransform.EuclideanTransform(rotation=np.deg2rad(best)).params
+        @ sktransform.EuclideanTransform(translation=-center).params
+    )
+    warped = warp_to(mov_image, sktransform.AffineTransform(matrix=rotation), ref_image.shape)
+    shifts, _ = target.register(warped)
+    translation = sktransform.EuclideanTransform(translation=-shifts[::-1]).params
+    return sktransform.AffineTransform(matrix=rotation @ translation), (angles, peaks)
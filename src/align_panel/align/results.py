@@ -0,0 +1,51 @@
+""" Module containing the result properties shared by the aligners. An aligner stores the
+confirmed transformation and its results in the ``_results`` dictionary, under the keys
+``tmat``, ``result_view``, ``result_future``, ``result_image``, ``metrics`` and optionally
+``overlay``, and its images in ``_image_dict``.
+
+"""
+
+from align_panel.align.metrics import alignment_metrics
+
+
+class _AlignmentResults:
+    """Mixin of the aligners exposing the entries of ``_results``."""
+
+    @property
+    def result_image(self):
+        """Full resolution result. It is resampled on a background thread once the alignment is
+        confirmed, reading it waits only until the resampling is finished."""
+        if self._results["result_image"] is None and self.result_future is not None:
+            self._results["result_image"] = self.result_future.result()
+        return self._results["result_image"]
+
+    @property
+    def result_future(self):
+        """``concurrent.futures.Future`` of the full resolution result."""
+        return self._results["result_future"]
+
+    @property
+    def result_view(self):
+        """Lazy ``TransformedView`` of the result, can be passed to another aligner."""
+        return self._results["result_view"]
+
+    @property
+    def overlay(self):
+        """``OverlayPreview`` of the result shown by ``show_result``, see ``overlay``. None if no
+        result was shown."""
+        return self._results.get("overlay")
+
+    @property
+    def metrics(self):
+        """Quality metrics of the alignment on the overlap of the images, computed on first access,
+        see ``metrics.alignment_metrics``."""
+        if self._results["metrics"] is None and self.tmat is not None:
+            ref_image, mov_image = self._result_images()
+            self._results["metrics"] = alignment_metrics(
+                ref_image, mov_image, self.tmat, inverse=self._params.get("inverse", False)
+            )
+        return self._results["metrics"]
+
+    def _result_images(self):
+        """Reference and moving image of the metrics."""
+        return self._image_dict["ref"], self._image_dict["mov"]
@@ -0,0 +1,122 @@
+""" Module containing the record of an interactive alignment session. The aligners record the
+inputs of the user, the crop extents of ``CropAlignments``, the point pairs of
+``PointAlignments`` and the key steps of ``FineAlignments``, together with their parameters and
+the shape of the images. A session is serialised to JSON, e.g. into the ``alignments`` group of
+a NeXus file, and replayed without a figure by ``batch.replay_sessions``, also on new images or
+the images at a different resolution.
+
+"""
+
+import json
+import numpy as np
+
+# version of the serialised format
+SESSION_VERSION = 1
+
+
+def _to_builtin(value):
+    """Convert numpy arrays and scalars in nested containers to lists and numbers for JSON."""
+    if isinstance(value, dict):
+        return {key: _to_builtin(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_builtin(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class AlignmentSession:
+    """Serialisable record of the user inputs of an interactive alignment.
+
+    Attributes
+    ----------
+    aligner : str
+        Aligner which recorded the session, ``crop``, ``points`` or ``fine``.
+    params : dict
+        Parameters of the aligner, e.g. the rebinning factor and the alignment method.
+    inputs : dict
+        User inputs, the crop extents and centers, the point pairs or the key steps.
+    shape : tuple
+        Shape of the reference image the inputs refer to.
+
+    """
+
+    ALIGNERS = ("crop", "points", "fine")
+
+    def __init__(self, aligner: str, params: dict, inputs: dict, shape: tuple):
+        """
+        Parameters
+        ----------
+        aligner : str
+            Aligner which recorded the session, ``crop``, ``points`` or ``fine``.
+        params : dict
+            Parameters of the aligner.
+        inputs : dict
+            User inputs.
+        shape : tuple
+            Shape of the reference image.
+
+        """
+        if aligner not in self.ALIGNERS:
+            raise ValueError(f"Unknown aligner: {aligner}")
+        self.aligner = aligner
+        # converted copies, later changes of the aligner do not change the record
+        self.params = _to_builtin(dict(params))
+        self.inputs = _to_builtin(dict(inputs))
+        self.shape = tuple(int(size) for size in shape[:2])
+
+    def __repr__(self):
+        return f"<AlignmentSession {self.aligner}, shape {self.shape}, inputs {list(self.inputs)}>"
+
+    def scale_to(self, image):
+        """Ratio of the size of ``image`` to the recorded shape, e.g. 4 for a session recorded on
+        images binned by 4 and replayed at full resolution.
+
+        """
+        ratios = np.array(np.shape(image)[:2], dtype=float) / self.shape
+        if abs(ratios[0] - ratios[1]) > 0.01 * ratios.max():
+            raise ValueError(
+                f"Image of shape {np.shape(image)[:2]} is not a rescaled image of shape "
+                f"{self.shape}"
+            )
+        return float(ratios.mean())
+
+    def to_dict(self):
+        """Session as a dictionary of JSON types."""
+        return {
+            "version": SESSION_VERSION,
+            "aligner": self.aligner,
+            "params": _to_builtin(self.params),
+            "inputs": _to_builtin(self.inputs),
+            "shape": list(self.shape),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Session from a dictionary written by ``to_dict``."""
+        if data.get("version", SESSION_VERSION) > SESSION_VERSION:
+            raise ValueError(f"Unsupported session version: {data['version']}")
+        return cls(data["aligner"], data["params"], data["inputs"], data["shape"])
+
+    def to_json(self):
+        """Session serialised to a JSON string."""
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_json(cls, text: str):
+        """Session from a JSON string, or bytes as read from a NeXus file, written by
+        ``to_json``."""
+        return cls.from_dict(json.loads(text))
+
+    def save(self, path: str):
+        """Save the session to a JSON file."""
+        with open(path, "w", encoding="UTF-8") as file:
+            file.write(self.to_json())
+
+    @classmethod
+    def load(cls, path: str):
+        """Load a session from a JSON file written by ``save``."""
+        with open(path, "r", encoding="UTF-8") as file:
+            return cls.from_json(file.read())
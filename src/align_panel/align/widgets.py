@@ -0,0 +1,895 @@
+""" Module containing the notebook versions of the crop, point and fine aligners, built from
+``ipywidgets``. They do not block the kernel, so neither the ``TkAgg`` backend nor
+``notebook_helpers.stop_nb`` is needed, the results are read once the alignment is confirmed.
+
+The images are rendered on the kernel side. A viewport is assembled from tiles of the preview
+pyramid at the level closest to the display resolution, and only the visible viewport, at the
+size of the display, is sent to the browser when it changes. Remote sessions on large images
+therefore transfer a few hundred kilobytes per change, independent of the image size.
+
+``ipywidgets`` is an optional dependency, it is imported when a widget is displayed.
+
+"""
+
+from abc import ABC, abstractmethod
+import hashlib
+import io
+import math
+import numpy as np
+import matplotlib.pyplot as plt
+from skimage.transform import ProjectiveTransform
+from align_panel.image_transformer import ImageTransformer, _FrameCache
+from align_panel.align.crop import _align_crops, normal_round
+from align_panel.align.fine import STEP_KEYS, _apply_key, _full_resolution
+from align_panel.align.results import _AlignmentResults
+from align_panel.align.registration import rescale_matrix
+from align_panel.align.overlay import OVERLAY_MODES, compose
+from align_panel.align.points import _PointPairs, _estimate
+from align_panel.align.preview import preview
+from align_panel.align.session import AlignmentSession
+
+# side of the square tiles in preview pixels
+TILE_SIZE = 256
+# (rows, cols) of the displayed viewports in screen pixels
+DISPLAY_SIZE = (480, 480)
+# labels of the buttons of the fine alignment keys
+KEY_LABELS = {
+    "left": "←",
+    "right": "→",
+    "up": "↑",
+    "down": "↓",
+    "e": "⟲",
+    "r": "⟳",
+    "+": "+",
+    "-": "−",
+    "ctrl+z": "Undo",
+    "ctrl+y": "Redo",
+    "escape": "Reset",
+    "a": "Auto",
+}
+# colors of the annotations of the frames
+COLORS = {"crop": (255, 165, 0), "point": (255, 165, 0), "cursor": (0, 200, 255)}
+
+
+def _ipywidgets():
+    """Delayed import of ``ipywidgets``, it is needed only to display the widgets."""
+    try:
+        import ipywidgets  # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise ImportError(
+            "The notebook aligners need ipywidgets, install it by `pip install ipywidgets`."
+        ) from error
+    return ipywidgets
+
+
+def _encode_png(frame: np.ndarray):
+    """PNG bytes of an RGB frame of type uint8."""
+    buffer = io.BytesIO()
+    plt.imsave(buffer, frame, format="png")
+    return buffer.getvalue()
+
+
+class TileRenderer:
+    """Rendering of viewports of a reference image and a moving image, warped by a transformation,
+    from tiles of the preview pyramid. A viewport is rendered from the largest power of two binning
+    which keeps at least one preview pixel per display pixel, only the tiles overlapping the
+    viewport are computed and they are cached, so panning and zooming compute only the newly
+    visible tiles. Tiles of the moving image are cached per transformation, tiles of a
+    transformation seen before, e.g. after an undo, are taken from the cache.
+
+    Attributes
+    ----------
+    _images : dict
+        Dictionary containing the reference and moving images.
+    _tmat : np.ndarray
+        Full resolution transformation of the moving image, None for the untransformed image.
+    _tile : int
+        Side of the tiles in preview pixels.
+    _tiles : _FrameCache
+        Cache of the tiles, the least recently used are evicted first.
+    _limits : dict
+        Display intensity range of the images.
+    _stats : dict
+        Numbers of the ``computed`` and ``cached`` tiles.
+
+    """
+
+    def __init__(self, ref_image, mov_image=None, tile: int = TILE_SIZE, cache_bytes: int = 2**27):
+        """
+        Parameters
+        ----------
+        ref_image : np.ndarray or TransformedView
+            Reference image.
+        mov_image : np.ndarray or TransformedView, optional
+            Moving image. The default is None, only the reference image is rendered.
+        tile : int, optional
+            Side of the tiles in preview pixels. The default is ``TILE_SIZE``.
+        cache_bytes : int, optional
+            Memory limit of the tile cache in bytes. The default is 128 MiB.
+
+        """
+        self._images = {"ref": ref_image, "mov": mov_image}
+        self._tmat = None
+        self._tile = tile
+        self._tiles = _FrameCache(max_bytes=cache_bytes)
+        self._limits = {}
+        self._stats = {"computed": 0, "cached": 0}
+
+    @property
+    def shape(self):
+        return np.shape(self._images["ref"])[:2]
+
+    @property
+    def stats(self):
+        return dict(self._stats)
+
+    def set_transform(self, tmat):
+        """Set the full resolution transformation of the moving image, None for no warp."""
+        self._tmat = None if tmat is None else np.array(getattr(tmat, "params", tmat), float)
+
+    def factor(self, viewport: tuple, size: tuple):
+        """Binning factor of the preview level rendering ``viewport``, (x0, y0, x1, y1) in full
+        resolution pixels, on a display of ``size`` (rows, cols)."""
+        ratio = min((viewport[2] - viewport[0]) / size[1], (viewport[3] - viewport[1]) / size[0])
+        return 2 ** int(math.floor(math.log2(max(ratio, 1.0))))
+
+    def limits(self, name: str):
+        """Display intensity range, the 1st and 99th percentile of a coarse preview."""
+        if name not in self._limits:
+            coarse = 2 ** max(0, int(math.log2(max(self.shape) / 512)))
+            image = preview(self._images[name], coarse)
+            low, high = np.nanpercentile(image, (1, 99))
+            self._limits[name] = (float(low), float(high) if high > low else float(low) + 1.0)
+        return self._limits[name]
+
+    def _compute_tile(self, name: str, factor: int, row: int, col: int):
+        """Tile of the preview binned by ``factor``, NaN outside of the image."""
+        size = self._tile
+        level = preview(self._images[name], factor)
+        if name == "mov" and self._tmat is not None:
+            # output pixels of the tile to the preview pixels of the moving image
+            offset = np.array([[1.0, 0.0, col * size], [0.0, 1.0, row * size], [0.0, 0.0, 1.0]])
+            trans = ImageTransformer(level)
+            trans.add_transform(
+                ProjectiveTransform(matrix=rescale_matrix(self._tmat, 1 / factor) @ offset),
+                output_shape=(size, size),
+            )
+            return trans.warp_preserving_dtype().astype(np.float32, copy=False)
+        tile = np.full((size, size), np.nan, dtype=np.float32)
+        part = level[row * size : (row + 1) * size, col * size : (col + 1) * size]
+        tile[: part.shape[0], : part.shape[1]] = part
+        return tile
+
+    def _get_tile(self, name: str, factor: int, row: int, col: int):
+        warped = name == "mov" and self._tmat is not None
+        rows, cols = np.shape(self._images[name])[:2]
+        inside = 0 <= row * self._tile < rows // factor and 0 <= col * self._tile < cols // factor
+        if not warped and not inside:
+            return None
+        key = (name, factor, row, col, self._tmat.tobytes() if warped else None)
+        tile = self._tiles.get(key)
+        if tile is None:
+            tile = self._compute_tile(name, factor, row, col)
+            self._tiles.put(key, tile)
+            self._stats["computed"] += 1
+        else:
+            self._stats["cached"] += 1
+        return tile
+
+    def layer(self, name: str, viewport: tuple, size: tuple = DISPLAY_SIZE):
+        """Viewport of the image ``name``, ``ref`` or ``mov``, sampled at the display pixels.
+
+        Parameters
+        ----------
+        name : str
+            Image, ``ref`` or ``mov``, which is warped by the transformation.
+        viewport : tuple
+            (x0, y0, x1, y1) of the viewport in full resolution pixels.
+        size : tuple, optional
+            (rows, cols) of the display. The default is ``DISPLAY_SIZE``.
+
+        Returns
+        -------
+        layer : np.ndarray
+            Float32 image of shape ``size``, NaN outside of the image.
+
+        """
+        factor = self.factor(viewport, size)
+        # preview pixels under the centres of the display pixels
+        rows = np.floor(
+            (viewport[1] + (np.arange(size[0]) + 0.5) * (viewport[3] - viewport[1]) / size[0])
+            / factor
+        ).astype(np.int64)
+        cols = np.floor(
+            (viewport[0] + (np.arange(size[1]) + 0.5) * (viewport[2] - viewport[0]) / size[1])
+            / factor
+        ).astype(np.int64)
+        tile_rows = np.arange(rows[0] // self._tile, rows[-1] // self._tile + 1)
+        tile_cols = np.arange(cols[0] // self._tile, cols[-1] // self._tile + 1)
+        mosaic = np.full(
+            (tile_rows.size * self._tile, tile_cols.size * self._tile), np.nan, dtype=np.float32
+        )
+        for i, row in enumerate(tile_rows):
+            for j, col in enumerate(tile_cols):
+                tile = self._get_tile(name, factor, int(row), int(col))
+                if tile is not None:
+                    mosaic[
+                        i * self._tile : (i + 1) * self._tile,
+                        j * self._tile : (j + 1) * self._tile,
+                    ] = tile
+        return mosaic[np.ix_(rows - tile_rows[0] * self._tile, cols - tile_cols[0] * self._tile)]
+
+    def normalised(self, name: str, viewport: tuple, size: tuple = DISPLAY_SIZE):
+        """Viewport of the image ``name`` scaled to its display range [0, 1], NaN outside."""
+        low, high = self.limits(name)
+        return np.clip((self.layer(name, viewport, size) - low) / (high - low), 0.0, 1.0)
+
+    def render(
+        self,
+        viewport: tuple,
+        size: tuple = DISPLAY_SIZE,
+        layers: tuple = ("ref", "mov"),
+        mode: str = "blend",
+    ):
+        """RGB frame of the viewport. Two ``layers`` are combined by the overlay ``mode``, see
+        ``overlay.compose``, a single layer is shown in gray, black outside of the image.
+
+        Returns
+        -------
+        frame : np.ndarray
+            Frame of shape (rows, cols, 3) and type uint8.
+
+        """
+        if len(layers) == 1:
+            gray = np.nan_to_num(self.normalised(layers[0], viewport, size))
+            return np.repeat((255 * gray + 0.5).astype(np.uint8)[..., None], 3, axis=2)
+        ref, mov = (self.normalised(name, viewport, size) for name in layers)
+        return compose(ref, mov, mode)
+
+
+class _Viewport:
+    """Visible part of an image, its centre and the width in full resolution pixels, with the
+    aspect ratio of the display."""
+
+    def __init__(self, shape: tuple, size: tuple = DISPLAY_SIZE):
+        self.shape = tuple(shape[:2])
+        self.size = tuple(size)
+        self.reset()
+
+    def reset(self):
+        """Show the whole image."""
+        rows, cols = self.shape
+        self.center = np.array([cols / 2, rows / 2])
+        self.width = max(cols, rows * self.size[1] / self.size[0])
+
+    @property
+    def extent(self):
+        """(x0, y0, x1, y1) of the viewport in full resolution pixels."""
+        height = self.width * self.size[0] / self.size[1]
+        return (
+            self.center[0] - self.width / 2,
+            self.center[1] - height / 2,
+            self.center[0] + self.width / 2,
+            self.center[1] + height / 2,
+        )
+
+    def zoom(self, factor: float):
+        """Zoom in by ``factor``, out for factors below 1, down to 8 display pixels per pixel."""
+        self.width = min(max(self.width / factor, self.size[1] / 8), 2 * max(self.shape))
+
+    def pan(self, right: float, down: float):
+        """Move by fractions of the viewport width, the centre stays on the image."""
+        self.center = np.clip(
+            self.center + np.array([right, down]) * self.width, 0, self.shape[::-1]
+        )
+
+    def to_display(self, points):
+        """Display (col, row) of points given by full resolution (x, y) pixel positions."""
+        x_0, y_0, x_1, y_1 = self.extent
+        points = np.asarray(points, dtype=float).reshape(-1, 2) + 0.5
+        return (points - (x_0, y_0)) * (self.size[1] / (x_1 - x_0), self.size[0] / (y_1 - y_0))
+
+
+def _draw_marks(frame: np.ndarray, points, color: tuple, radius: int = 5):
+    """Draw crosses at the display positions ``points`` into ``frame``."""
+    rows, cols = frame.shape[:2]
+    points = np.round(np.asarray(points, dtype=float).reshape(-1, 2)).astype(np.int64)
+    arm = np.arange(-radius, radius + 1)
+    zero = np.zeros_like(arm)
+    x = (points[:, :1] + np.concatenate((arm, zero))).ravel()
+    y = (points[:, 1:] + np.concatenate((zero, arm))).ravel()
+    inside = (x >= 0) & (x < cols) & (y >= 0) & (y < rows)
+    frame[y[inside], x[inside]] = color
+
+
+def _draw_rectangle(frame: np.ndarray, corners, color: tuple):
+    """Draw the outline of the rectangle with display corners ((c0, r0), (c1, r1)) into
+    ``frame``."""
+    rows, cols = frame.shape[:2]
+    (c_0, r_0), (c_1, r_1) = np.round(np.asarray(corners, dtype=float)).astype(np.int64)
+    x = np.arange(max(c_0, 0), min(c_1, cols - 1) + 1)
+    y = np.arange(max(r_0, 0), min(r_1, rows - 1) + 1)
+    for row in (r_0, r_1):
+        if 0 <= row < rows:
+            frame[row, x] = color
+    for col in (c_0, c_1):
+        if 0 <= col < cols:
+            frame[y, col] = color
+
+
+class _NotebookAligner(_AlignmentResults, ABC):
+    """Shared part of the notebook aligners, the viewports, their rendering and transfer to the
+    browser and the results.
+
+    Attributes
+    ----------
+    _image_dict : dict
+        Dictionary containing the reference and moving images.
+    _renderer : TileRenderer
+        Renderer of the viewports.
+    _views : dict
+        Viewport of each displayed view.
+    _widgets : dict
+        Widgets of the views and the controls, empty until the aligner is displayed.
+    _sent : dict
+        Digest of the last frame sent to each view and the numbers of the ``frames`` and
+        ``bytes`` sent and the ``unchanged`` frames which were not sent.
+    _results : dict
+        Dictionary containing the transformation matrix, the transformed image, its lazy
+        ``TransformedView`` and the quality metrics of the alignment.
+
+    """
+
+    def __init__(self, ref_image, mov_image, views: tuple, display_size: tuple = DISPLAY_SIZE):
+        self._image_dict = {"ref": ref_image, "mov": mov_image}
+        self._renderer = TileRenderer(ref_image, mov_image)
+        shape = np.shape(ref_image)[:2]
+        self._views = {name: _Viewport(shape, display_size) for name in views}
+        self._widgets = {}
+        self._sent = {"digests": {}, "frames": 0, "bytes": 0, "unchanged": 0}
+        self._results = {
+            "tmat": None,
+            "result_image": None,
+            "result_view": None,
+            "metrics": None,
+            "result_future": None,
+        }
+
+    @property
+    def tmat(self):
+        return self._results["tmat"]
+
+    @property
+    def transfer(self):
+        """Numbers of the ``frames`` and ``bytes`` sent to the browser and of the ``unchanged``
+        frames, which were not sent."""
+        return {key: self._sent[key] for key in ("frames", "bytes", "unchanged")}
+
+    def _set_result(self, trans: ImageTransformer, tmat):
+        """Store the confirmed transformation and start resampling the full resolution result on
+        a background thread."""
+        self._results["tmat"] = tmat
+        self._results["result_view"] = trans.get_transformed_view()
+        self._results["result_future"] = self.result_view.materialise_async()
+        self._results["result_image"] = None
+        self._results["metrics"] = None
+
+    @abstractmethod
+    def frame(self, name: str):
+        """RGB frame of the view ``name`` with its annotations."""
+
+    def _refresh(self, *names):
+        """Render the displayed views, all of them by default, and send the frames which
+        changed."""
+        for name in names or tuple(self._views):
+            if name not in self._widgets:
+                continue
+            png = _encode_png(self.frame(name))
+            digest = hashlib.blake2b(png, digest_size=16).digest()
+            if self._sent["digests"].get(name) == digest:
+                self._sent["unchanged"] += 1
+                continue
+            self._sent["digests"][name] = digest
+            self._widgets[name].value = png
+            self._sent["frames"] += 1
+            self._sent["bytes"] += len(png)
+
+    def _status(self, text: str):
+        if "status" in self._widgets:
+            self._widgets["status"].value = text
+
+    def _navigation(self, name: str):
+        """Zoom and pan buttons of the view ``name``."""
+        widgets = _ipywidgets()
+        view = self._views[name]
+        actions = {
+            "+": lambda: view.zoom(2.0),
+            "−": lambda: view.zoom(0.5),
+            "◀": lambda: view.pan(-0.25, 0.0),
+            "▶": lambda: view.pan(0.25, 0.0),
+            "▲": lambda: view.pan(0.0, -0.25),
+            "▼": lambda: view.pan(0.0, 0.25),
+            "Fit": view.reset,
+        }
+        buttons = []
+        for label, action in actions.items():
+            button = widgets.Button(description=label, layout=widgets.Layout(width="40px"))
+
+            def on_click(_, action=action):
+                action()
+                self._refresh(name)
+
+            button.on_click(on_click)
+            buttons.append(button)
+        return widgets.HBox(buttons)
+
+    def _image_widget(self, name: str):
+        """Image widget of the view ``name``, its frame is sent by ``_refresh``."""
+        widgets = _ipywidgets()
+        rows, cols = self._views[name].size
+        self._widgets[name] = widgets.Image(format="png", width=cols, height=rows)
+        self._sent["digests"].pop(name, None)
+        return widgets.VBox([self._widgets[name], self._navigation(name)])
+
+    @abstractmethod
+    def _build(self):
+        """Widget tree of the aligner."""
+
+    @property
+    def widget(self):
+        """Widget tree of the aligner, built on first access."""
+        if "root" not in self._widgets:
+            self._widgets["status"] = _ipywidgets().HTML()
+            self._widgets["root"] = self._build()
+            self._refresh()
+        return self._widgets["root"]
+
+    def _ipython_display_(self):
+        from IPython.display import display  # pylint: disable=import-outside-toplevel
+
+        display(self.widget)
+
+
+class FineAlignmentWidget(_NotebookAligner):
+    """Notebook version of ``FineAlignments``. The buttons translate, rotate and scale the moving
+    image like the keys of ``FineAlignments``, ``Auto`` refines the alignment, see
+    ``refine.refine_ecc``, and ``Confirm`` starts computing the full resolution result in the
+    background. The overlay of the images is rendered by ``TileRenderer`` in one of the modes of
+    ``overlay.OVERLAY_MODES``. The session is compatible with ``FineAlignments.replay``.
+
+    Attributes
+    ----------
+    _params : dict
+        Dictionary containing the rebinning factor and the motion model of the automatic
+        refinement.
+    _steps : dict
+        Dictionary containing the steps for translation, rotation and scaling.
+    _rebinned : dict
+        Dictionary containing the rebinned reference and moving images.
+    _trans : ImageTransformer
+        Transformation of the rebinned moving image.
+    _keys : list
+        Applied keys and their step sizes, recorded for the ``session``.
+    _mode : str
+        Overlay mode of the view.
+
+    """
+
+    def __init__(
+        self,
+        ref_image,
+        mov_image,
+        rebin: int = 8,
+        refine: str = "affine",
+        display_size: tuple = DISPLAY_SIZE,
+    ):
+        """
+        Parameters
+        ----------
+        ref_image : np.ndarray or TransformedView
+            Reference image.
+        mov_image : np.ndarray or TransformedView
+            Moving image.
+        rebin : int, optional
+            Rebinning factor of the images the steps are applied to. The default is 8.
+        refine : str, optional
+            Motion model of the automatic refinement. The default is ``affine``.
+        display_size : tuple, optional
+            (rows, cols) of the view. The default is ``DISPLAY_SIZE``.
+
+        """
+        super().__init__(ref_image, mov_image, ("overlay",), display_size)
+        self._params = {"rebin": rebin, "refine": refine}
+        self._steps = {"translate": 5, "rotate": 2.5, "scale": 0.75}
+        self._rebinned = {
+            "ref": preview(ref_image, rebin),
+            # the warp of skimage needs a writeable image, the shared previews are read-only
+            "mov": preview(mov_image, rebin).copy(),
+        }
+        self._trans = ImageTransformer(self._rebinned["mov"])
+        self._keys = []
+        self._mode = "blend"
+        self._update_transform()
+
+    @property
+    def session(self):
+        """Record of the applied keys, see ``FineAlignments.replay``."""
+        return AlignmentSession(
+            "fine",
+            dict(self._params),
+            {"keys": self._keys},
+            np.shape(self._image_dict["ref"]),
+        )
+
+    def _update_transform(self):
+        tmat, _ = _full_resolution(self._trans, self._params["rebin"], self._image_dict["mov"])
+        self._renderer.set_transform(tmat)
+        return tmat
+
+    def press(self, key: str):
+        """Apply the step of ``key``, one of ``STEP_KEYS``, ``enter`` confirms the alignment."""
+        if key in STEP_KEYS:
+            step = self._steps.get(STEP_KEYS[key])
+            self._keys.append((key, step))
+            _apply_key(self._trans, key, step, self._rebinned, self._params["refine"])
+            tmat = self._update_transform()
+            self._status(f"Translation ({tmat.params[0, 2]:.1f}, {tmat.params[1, 2]:.1f}) px")
+        elif key == "enter":
+            self.confirm()
+        else:
+            raise ValueError(f"Unknown key: {key}")
+        self._refresh()
+
+    def confirm(self):
+        """Save the full resolution transformation and start resampling the result on a
+        background thread."""
+        tmat, trans = _full_resolution(
+            self._trans, self._params["rebin"], self._image_dict["mov"]
+        )
+        if self.tmat is not None and np.array_equal(tmat.params, self.tmat.params):
+            return
+        self._set_result(trans, tmat)
+        self._status("Confirmed, the result is computed in the background.")
+
+    def set_mode(self, mode: str):
+        """Show the overlay ``mode``, one of ``overlay.OVERLAY_MODES``."""
+        if mode not in OVERLAY_MODES:
+            raise ValueError(f"Unknown overlay mode: {mode}")
+        self._mode = mode
+        self._refresh()
+
+    def frame(self, name: str = "overlay"):
+        view = self._views[name]
+        return self._renderer.render(view.extent, view.size, mode=self._mode)
+
+    def _build(self):
+        widgets = _ipywidgets()
+        buttons = []
+        for key, label in KEY_LABELS.items():
+            button = widgets.Button(description=label, layout=widgets.Layout(width="60px"))
+            button.on_click(lambda _, key=key: self.press(key))
+            buttons.append(button)
+        confirm = widgets.Button(description="Confirm", button_style="success")
+        confirm.on_click(lambda _: self.press("enter"))
+        sliders = []
+        ranges = {"translate": (0, 10), "rotate": (0, 5), "scale": (0.5, 1)}
+        for step, (low, high) in ranges.items():
+            slider = widgets.FloatSlider(
+                value=self._steps[step], min=low, max=high, description=step.capitalize()
+            )
+            slider.observe(
+                lambda change, step=step: self._steps.update({step: change["new"]}), names="value"
+            )
+            sliders.append(slider)
+        modes = widgets.ToggleButtons(options=OVERLAY_MODES, value=self._mode)
+        modes.observe(lambda change: self.set_mode(change["new"]), names="value")
+        return widgets.VBox(
+            [
+                self._image_widget("overlay"),
+                modes,
+                widgets.HBox(buttons[:6]),
+                widgets.HBox(buttons[6:] + [confirm]),
+                widgets.HBox(sliders),
+                self._widgets["status"],
+            ]
+        )
+
+
+class CropAlignmentWidget(_NotebookAligner):
+    """Notebook version of ``CropAlignments``. The crops are moved by sliders, the moving crop
+    has the size of the reference crop. ``Confirm`` aligns the crops with the chosen
+    ``align_auto`` method and starts computing the full resolution result in the background. The
+    session is compatible with ``CropAlignments.replay``.
+
+    Attributes
+    ----------
+    _params : dict
+        Dictionary containing the alignment method, inverse bool parameter and subpixel factor.
+    _crops : dict
+        Centers (x, y) of the reference and moving crops and the (width, height) of the crops,
+        in full resolution pixels.
+    _inputs : dict
+        Positions and centers of the confirmed crops, recorded for the ``session``.
+
+    """
+
+    def __init__(
+        self,
+        ref_image,
+        mov_image,
+        method: str = "None",
+        inverse: bool = True,
+        sub_pixel_factor: int = 2,
+        display_size: tuple = DISPLAY_SIZE,
+    ):
+        """
+        Parameters
+        ----------
+        ref_image : np.ndarray or TransformedView
+            Reference image.
+        mov_image : np.ndarray or TransformedView
+            Image to be aligned.
+        method : str, optional
+            Method of ``align_auto``. The default is "None", only the crop translation.
+        inverse : bool, optional
+            If True, the image will be inverted before alignment. The default is True.
+        sub_pixel_factor : int, optional
+            Subpixel factor for cross corelation methods. The default is 2.
+        display_size : tuple, optional
+            (rows, cols) of each of the two views. The default is ``DISPLAY_SIZE``.
+
+        """
+        super().__init__(ref_image, mov_image, ("ref", "mov"), display_size)
+        self._params = {
+            "method": method,
+            "inverse": inverse,
+            "sub_pixel_factor": sub_pixel_factor,
+        }
+        rows, cols = np.shape(ref_image)[:2]
+        self._crops = {
+            "ref": np.array([cols // 2, rows // 2]),
+            "mov": np.array([cols // 2, rows // 2]),
+            "size": np.array([cols // 2, rows // 2]),
+        }
+        self._inputs = None
+
+    @property
+    def session(self):
+        """Record of the confirmed crops, see ``CropAlignments.replay``. None before the crops
+        are confirmed."""
+        if self._inputs is None:
+            return None
+        return AlignmentSession(
+            "crop", dict(self._params), self._inputs, np.shape(self._image_dict["ref"])
+        )
+
+    def positions(self):
+        """(x0, x1, y0, y1) extents and (x, y) centers of the crops, as in ``CropAlignments``."""
+        half = self._crops["size"] / 2
+        positions = {
+            name: np.array(
+                [
+                    normal_round(self._crops[name][0] - half[0]),
+                    normal_round(self._crops[name][0] + half[0]),
+                    normal_round(self._crops[name][1] - half[1]),
+                    normal_round(self._crops[name][1] + half[1]),
+                ]
+            )
+            for name in ("ref", "mov")
+        }
+        centers = {name: self._crops[name].copy() for name in ("ref", "mov")}
+        return positions, centers
+
+    def set_crop(self, name: str, center=None, size=None):
+        """Move the crop ``name``, ``ref`` or ``mov``, to ``center`` (x, y) and set the (width,
+        height) of both crops."""
+        if center is not None:
+            self._crops[name] = np.asarray(center, dtype=int)
+        if size is not None:
+            self._crops["size"] = np.asarray(size, dtype=int)
+        self._refresh()
+
+    def confirm(self):
+        """Align the crops and start resampling the full resolution result on a background
+        thread."""
+        positions, centers = self.positions()
+        trans, _ = _align_crops(
+            self._image_dict,
+            positions,
+            centers,
+            self._params["method"],
+            self._params["inverse"],
+            self._params["sub_pixel_factor"],
+        )
+        self._inputs = {"positions": positions, "centers": centers}
+        self._set_result(trans, trans.get_combined_transform())
+        shift = self.tmat.params[:2, 2]
+        self._status(f"Aligned, translation ({shift[0]:.1f}, {shift[1]:.1f}) px.")
+
+    def frame(self, name: str):
+        view = self._views[name]
+        frame = self._renderer.render(view.extent, view.size, layers=(name,))
+        positions, _ = self.positions()
+        x_0, x_1, y_0, y_1 = positions[name]
+        _draw_rectangle(frame, view.to_display([[x_0, y_0], [x_1, y_1]]) - 0.5, COLORS["crop"])
+        return frame
+
+    def _build(self):
+        widgets = _ipywidgets()
+        shapes = {name: np.shape(self._image_dict[name])[:2] for name in ("ref", "mov")}
+        # the crops of both images share the size
+        shapes["size"] = np.minimum(shapes["ref"], shapes["mov"])
+        controls = []
+        for name, (first, second) in {
+            "ref": ("x", "y"),
+            "mov": ("x", "y"),
+            "size": ("width", "height"),
+        }.items():
+            sliders = [
+                widgets.IntSlider(
+                    value=int(self._crops[name][axis]),
+                    min=0 if name != "size" else 8,
+                    max=int(shapes[name][1 - axis]),
+                    description=f"{name} {label}",
+                )
+                for axis, label in enumerate((first, second))
+            ]
+            for axis, slider in enumerate(sliders):
+
+                def on_change(change, name=name, axis=axis):
+                    self._crops[name][axis] = change["new"]
+                    self._refresh()
+
+                slider.observe(on_change, names="value")
+            controls.append(widgets.VBox(sliders))
+        confirm = widgets.Button(description="Confirm", button_style="success")
+        confirm.on_click(lambda _: self.confirm())
+        return widgets.VBox(
+            [
+                widgets.HBox([self._image_widget("ref"), self._image_widget("mov")]),
+                widgets.HBox(controls + [confirm]),
+                self._widgets["status"],
+            ]
+        )
+
+
+class PointAlignmentWidget(_NotebookAligner):
+    """Notebook version of ``PointAlignments``. Point pairs are placed at the centres of the
+    reference and moving views, marked by a cursor: pan and zoom both views onto the same feature
+    and press ``Add pair``. ``Remove pair`` removes the pair nearest to the cursor of the
+    reference view. ``Confirm`` estimates the transformation and starts computing the full
+    resolution result in the background. The session is compatible with
+    ``PointAlignments.replay``.
+
+    Attributes
+    ----------
+    _params : dict
+        Dictionary containing the alignment method and the outlier rejection.
+    _pairs : _PointPairs
+        Point pairs in full resolution pixels.
+    _trans : ImageTransformer
+        Transformation of the full resolution moving image.
+
+    """
+
+    def __init__(
+        self,
+        ref_image,
+        mov_image,
+        method: str = "euclidean",
+        robust: str = None,
+        points: tuple = None,
+        display_size: tuple = DISPLAY_SIZE,
+    ):
+        """
+        Parameters
+        ----------
+        ref_image : np.ndarray or TransformedView
+            Reference image.
+        mov_image : np.ndarray or TransformedView
+            Moving image.
+        method : str, optional
+            Alignment method, ``affine``, ``euclidean``, ``similarity`` or ``projective``. The
+            default is ``euclidean``.
+        robust : str, optional
+            Outlier rejection, ``ransac`` or ``lmeds``. The default is None.
+        points : tuple, optional
+            Initial points ``(ref_points, mov_points)``. The default is None.
+        display_size : tuple, optional
+            (rows, cols) of each of the two views. The default is ``DISPLAY_SIZE``.
+
+        """
+        super().__init__(ref_image, mov_image, ("ref", "mov"), display_size)
+        self._params = {"method": method, "robust": robust}
+        self._pairs = _PointPairs(*(points if points is not None else ()))
+        self._trans = ImageTransformer(mov_image)
+
+    @property
+    def ref_points(self):
+        return self._pairs.ref.copy()
+
+    @property
+    def mov_points(self):
+        return self._pairs.mov.copy()
+
+    @property
+    def session(self):
+        """Record of the point pairs, see ``PointAlignments.replay``."""
+        return AlignmentSession(
+            "points",
+            {"rebin": 1, "subpixel": False, **self._params},
+            {"ref_points": self.ref_points, "mov_points": self.mov_points},
+            np.shape(self._image_dict["ref"]),
+        )
+
+    def cursor(self, name: str):
+        """Full resolution (x, y) position under the cursor of the view ``name``."""
+        return self._views[name].center - 0.5
+
+    def add_pair(self, ref_xy=None, mov_xy=None):
+        """Add a point pair, by default at the cursors of the views. Returns the id of the pair."""
+        ref_xy = self.cursor("ref") if ref_xy is None else ref_xy
+        mov_xy = self.cursor("mov") if mov_xy is None else mov_xy
+        point_id = self._pairs.add(ref_xy, mov_xy)
+        self._status(f"{len(self._pairs)} point pairs.")
+        self._refresh()
+        return point_id
+
+    def remove_pair(self, point_id: int = None):
+        """Remove the pair ``point_id``, by default the pair nearest to the reference cursor."""
+        if point_id is None:
+            view = self._views["ref"]
+            radius = view.width / view.size[1] * 10
+            point_id = self._pairs.nearest(0, self.cursor("ref"), radius)
+            if point_id is None:
+                return
+        self._pairs.remove(point_id)
+        self._refresh()
+
+    def confirm(self):
+        """Estimate the transformation from the point pairs and start resampling the full
+        resolution result on a background thread."""
+        inliers, _ = _estimate(
+            self._trans,
+            self.ref_points,
+            self.mov_points,
+            self._params["method"],
+            self._params["robust"],
+            1,
+        )
+        self._set_result(self._trans, self._trans.get_combined_transform())
+        message = "Confirmed, the result is computed in the background."
+        if inliers is not None and not inliers.all():
+            message += f" Rejected point pairs: {np.flatnonzero(~inliers).tolist()}"
+        self._status(message)
+
+    def frame(self, name: str):
+        view = self._views[name]
+        frame = self._renderer.render(view.extent, view.size, layers=(name,))
+        cursor = np.array(view.size[::-1]) / 2
+        _draw_marks(frame, cursor, COLORS["cursor"], radius=12)
+        side = self._pairs.ref if name == "ref" else self._pairs.mov
+        if len(side):
+            _draw_marks(frame, view.to_display(side) - 0.5, COLORS["point"])
+        return frame
+
+    def _build(self):
+        widgets = _ipywidgets()
+        actions = {
+            "Add pair": lambda _: self.add_pair(),
+            "Remove pair": lambda _: self.remove_pair(),
+            "Confirm": lambda _: self.confirm(),
+        }
+        buttons = []
+        for label, action in actions.items():
+            button = widgets.Button(description=label)
+            button.on_click(action)
+            buttons.append(button)
+        buttons[-1].button_style = "success"
+        return widgets.VBox(
+            [
+                widgets.HBox([self._image_widget("ref"), self._image_widget("mov")]),
+                widgets.HBox(buttons),
+                self._widgets["status"],
+            ]
+        )
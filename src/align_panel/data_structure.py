@@ -16,6 +16,7 @@ from nexusformat.nexus import (
     NXgroup,
 )
 from hyperspy._signals.hologram_image import HologramImage, Signal2D
+from align_panel.align.session import AlignmentSession
 
 
 class ImageSet(ABC):
@@ -328,8 +329,12 @@ class ImageSet(ABC):
             full_image.metadata["General"]["title"] = full_image.metadata["General"][
                 "original_filename"
             ].split(".")[0]
-        if "alignments" in file[f"raw_data/imageset_{id_number}"].tree:
-            tmat = file[f"raw_data/imageset_{id_number}/alignments/tmat"].nxdata
+        alignments = f"raw_data/imageset_{id_number}/alignments"
+        # the group holds the saved sessions as well, possibly without a tmat
+        if "alignments" in file[f"raw_data/imageset_{id_number}"].tree and (
+            "tmat" in file[alignments]
+        ):
+            tmat = file[f"{alignments}/tmat"].nxdata
             return full_image, tmat
         return full_image, None
 
@@ -485,7 +490,8 @@ class ImageSet(ABC):
         """
         with nxopen(path, "a") as opened_file:
             if "alignments" in opened_file[f"raw_data/imageset_{id_number}"].tree:
-                print("The tmat is already saved and will be overwritten.")
+                if "tmat" in opened_file[f"raw_data/imageset_{id_number}/alignments"]:
+                    print("The tmat is already saved and will be overwritten.")
                 opened_file[f"raw_data/imageset_{id_number}/alignments/tmat"] = NXfield(
                     self.tmat
                 )
@@ -499,6 +505,62 @@ class ImageSet(ABC):
                     "note"
                 ] = note
 
+    @staticmethod
+    def save_session(path: str, id_number: int, session, name: str = None):
+        """Method that saves a recorded alignment session in the ``alignments`` group of the
+        NeXus file, as a JSON string. A session with the same name is overwritten.
+
+        Parameters
+        ----------
+        path : str
+            Path of the NeXus file, in which the session is saved.
+        id_number : int
+            Number of the imageset. Defines the order of the imagesets in the NeXus file.
+        session : AlignmentSession
+            Session recorded by the ``session`` property of an aligner.
+        name : str, optional
+            Name of the session, by default the name of the aligner, e.g. ``crop``.
+
+        """
+        name = f"session_{name or session.aligner}"
+        with nxopen(path, "a") as opened_file:
+            group = f"raw_data/imageset_{id_number}/alignments"
+            if "alignments" not in opened_file[f"raw_data/imageset_{id_number}"].tree:
+                opened_file[group] = NXdata()
+            elif name in opened_file[group]:
+                print(f"The {name} is already saved and will be overwritten.")
+                del opened_file[f"{group}/{name}"]
+            opened_file[f"{group}/{name}"] = NXfield(session.to_json())
+
+    @staticmethod
+    def load_sessions(path: str, id_number: int = 0):
+        """Method that loads the alignment sessions saved by ``save_session``.
+
+        Parameters
+        ----------
+        path : str
+            Path of the NeXus file.
+        id_number : int, optional
+            Number of the imageset. Defines the order of the imagesets in the NeXus file,
+            by default 0
+
+        Returns
+        -------
+        sessions : dict
+            Dictionary of the sessions, ``AlignmentSession`` objects, by their names.
+
+        """
+        sessions = {}
+        with nxopen(path, "r") as opened_file:
+            imageset = opened_file[f"raw_data/imageset_{id_number}"]
+            if "alignments" in imageset:
+                for name, field in imageset["alignments"].items():
+                    if name.startswith("session_"):
+                        sessions[name[len("session_") :]] = AlignmentSession.from_json(
+                            field.nxdata
+                        )
+        return sessions
+
 
 class ImageSetHolo(ImageSet):
     """A child class of the ImageSet class. It is used for the holography imagesets.
@@ -770,11 +832,14 @@ class ImageSetHolo(ImageSet):
             full_image.metadata["General"]["title"] = full_image.metadata["General"][
                 "original_filename"
             ].split(".")[0]
+        alignments = f"raw_data/imageset_{id_number}/alignments"
+        # the group holds the saved sessions as well, possibly without a tmat
         if (
             "alignments" in file[f"raw_data/imageset_{id_number}"].tree
+            and "tmat" in file[alignments]
             and key == "image"
         ):
-            tmat = file[f"raw_data/imageset_{id_number}/alignments/tmat"].nxdata
+            tmat = file[f"{alignments}/tmat"].nxdata
             return full_image, tmat
         return full_image, None
 
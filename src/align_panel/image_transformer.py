@@ -1,5 +1,9 @@
 import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from scipy import ndimage as ndi
 from skimage import transform as sktransform
 
 
@@ -11,15 +15,41 @@ class ImageTransformer:
     :code:`get_combined_transform()` method
 
     Based entirely on `skimage.transform`
+
+    The image can also be a :code:`TransformedView`, in which case the
+    transforms are composed with the view's matrix and the warp samples
+    the view's source array directly, so no intermediate image is resampled.
+
+    With :code:`cache_bytes` set, rendered frames are kept in an LRU cache
+    keyed by the combined matrix, output shape and interpolation order, so
+    returning to a previous state (:code:`undo()`, :code:`redo()`, toggling
+    between transforms) does not warp again. Cached frames are read-only.
     """
-    def __init__(self, image):
-        self._image = image
+    def __init__(self, image, cache_bytes=0):
+        self._image = None
+        self._source_matrix = None
+        self._image_shape = None
         self._transforms = []
         self._reshapes = []
+        self._redo = []
         self._frozen_len = -1
+        self._cache = _FrameCache(cache_bytes)
+        self.set_image(image)
+
+    @property
+    def cache(self):
+        return self._cache
 
     def set_image(self, image):
-        self._image = image
+        self._cache.clear()
+        if isinstance(image, TransformedView):
+            self._image = image.source
+            self._source_matrix = image.matrix
+            self._image_shape = image.shape
+        else:
+            self._image = image
+            self._source_matrix = None
+            self._image_shape = None
 
     @property
     def transforms(self):
@@ -28,12 +58,14 @@ class ImageTransformer:
     def add_transform(self, *transforms, output_shape=None, frozen=False):
         self.transforms.append(self._combine_transforms(*transforms))
         self._reshapes.append(output_shape)
+        self._redo.clear()
         if frozen:
             self._frozen_len = len(self.transforms)
 
     def add_null_transform(self, output_shape=None, frozen=False):
         self.transforms.append(self._null_transform())
         self._reshapes.append(output_shape)
+        self._redo.clear()
         if frozen:
             self._frozen_len = len(self.transforms)
 
@@ -52,13 +84,33 @@ class ImageTransformer:
         return sktransform.EuclideanTransform()
 
     def clear_transforms(self):
+        # cleared steps can be restored one by one with redo()
+        self._redo.extend(zip(self.transforms[::-1], self._reshapes[::-1]))
         self.transforms.clear()
         self._reshapes.clear()
 
+    def undo(self, n=1):
+        """Remove the last :code:`n` transforms, keeping them for :code:`redo()`"""
+        for _ in range(n):
+            if not self.transforms or len(self.transforms) <= self._frozen_len:
+                break
+            self._redo.append((self.transforms.pop(-1), self._reshapes.pop(-1)))
+
+    def redo(self, n=1):
+        """Restore the last :code:`n` transforms removed by :code:`undo()`"""
+        for _ in range(n):
+            if not self._redo:
+                break
+            transform, reshape = self._redo.pop(-1)
+            self.transforms.append(transform)
+            self._reshapes.append(reshape)
+
     def current_shape(self):
         reshapes = [r for r in self._reshapes if r is not None]
         if reshapes:
             return reshapes[-1]
+        if self._image_shape is not None:
+            return self._image_shape
         return self._image.shape
 
     def get_combined_transform(self):
@@ -72,6 +124,23 @@ class ImageTransformer:
         combined = sktransform.AffineTransform(matrix=transform_mat)
         return combined
 
+    def get_source_transform(self):
+        """
+        The combined transform including the matrix of the view the
+        transformer was built from, i.e. the map from output pixels
+        to pixels of the underlying source array
+        """
+        combined = self.get_combined_transform()
+        if self._source_matrix is None:
+            return combined
+        return sktransform.AffineTransform(matrix=self._source_matrix @ combined.params)
+
+    def get_transformed_view(self):
+        """Lazy equivalent of :code:`get_transformed_image()`"""
+        return TransformedView(self._image,
+                               matrix=self.get_source_transform().params,
+                               shape=self.current_shape())
+
     @staticmethod
     def _combine_transforms(*transforms):
         transforms = [sktransform.AffineTransform(matrix=t)
@@ -85,17 +154,156 @@ class ImageTransformer:
             transform_mat = functools.reduce(np.matmul, [t.params for t in transforms])
             return sktransform.AffineTransform(matrix=transform_mat)
 
-    def get_transformed_image(self, preserve_range=True, order=None, cval=np.nan, **kwargs):
-        if not self.transforms:
+    def get_transformed_image(self, preserve_range=True, order=None, cval=np.nan,
+                              out=None, **kwargs):
+        if out is not None:
+            return self.warp_preserving_dtype(order=order, cval=cval, out=out,
+                                              output_shape=kwargs.pop('output_shape', None))
+        if not self.transforms and self._source_matrix is None:
             return self._image
-        combined_transform = self.get_combined_transform()
-        return sktransform.warp(self._image,
-                                combined_transform,
-                                order=order,
-                                output_shape=kwargs.pop('output_shape', self.current_shape()),
-                                preserve_range=preserve_range,
-                                cval=cval,
-                                **kwargs)
+        combined_transform = self.get_source_transform()
+        output_shape = kwargs.pop('output_shape', self.current_shape())
+        key = None
+        if self._cache.max_bytes and not kwargs:
+            key = self._cache.key(combined_transform.params, output_shape, order,
+                                  cval, preserve_range)
+            frame = self._cache.get(key)
+            if frame is not None:
+                return frame
+        frame = sktransform.warp(self._image,
+                                 combined_transform,
+                                 order=order,
+                                 output_shape=output_shape,
+                                 preserve_range=preserve_range,
+                                 cval=cval,
+                                 **kwargs)
+        if key is not None:
+            self._cache.put(key, frame)
+        return frame
+
+    def warp_preserving_dtype(self, order=None, cval=np.nan, output_shape=None, out=None):
+        """
+        Warp the image without the float64 round trip of :code:`sktransform.warp`
+
+        Floating point images keep their dtype (float32 stays float32),
+        other dtypes are warped to float64. The image is passed to
+        :code:`scipy.ndimage` as-is, so no intermediate converted copy
+        is made. If :code:`out` is given the result is written into it
+        and it is returned, allowing batch loops to reuse one buffer.
+        """
+        image = np.asarray(self._image)
+        if out is not None:
+            output_shape = out.shape
+        elif output_shape is None:
+            output_shape = self.current_shape()
+        if out is None:
+            dtype = image.dtype if np.issubdtype(image.dtype, np.floating) else np.float64
+            out = np.empty(output_shape, dtype=dtype)
+        if order is None:
+            order = 0 if image.dtype == bool else 1
+        if not self.transforms and self._source_matrix is None:
+            if out.shape != image.shape:
+                raise ValueError('Output shape must match image shape for null transform')
+            np.copyto(out, image, casting='same_kind')
+            return out
+        matrix = self.get_source_transform().params
+        if np.allclose(matrix[2, :2], 0.):
+            # scipy works in (row, col) coordinates, skimage in (x, y)
+            # the bottom row may differ from (0, 0, 1) by rounding of a projective fit
+            ndi.affine_transform(image,
+                                 _swap_xy(matrix)[:2] / matrix[2, 2],
+                                 output_shape=tuple(output_shape),
+                                 output=out,
+                                 order=order,
+                                 mode='constant',
+                                 cval=cval)
+        else:
+            rows, cols = np.indices(output_shape, dtype=np.float64)
+            coords_xy = np.stack((cols.ravel(), rows.ravel()), axis=1)
+            coords_xy = sktransform.ProjectiveTransform(matrix=matrix)(coords_xy)
+            coords_rc = coords_xy.T[::-1].reshape(2, *output_shape)
+            ndi.map_coordinates(image, coords_rc, output=out, order=order,
+                                mode='constant', cval=cval)
+        return out
+
+    def _input_shape(self, source=False):
+        if source or self._image_shape is None:
+            return self._image.shape
+        return self._image_shape
+
+    def _matrix(self, source=False):
+        if source:
+            return self.get_source_transform().params
+        return self.get_combined_transform().params
+
+    def map_points(self, points_xy, inverse=False, source=False):
+        """
+        Map an (..., 2) array of (x, y) points through the combined transform
+
+        By default points of the input image are mapped to where they land
+        in the transformed image; :code:`inverse=True` maps points of the
+        transformed image back to the input image. With :code:`source=True`
+        the input is the source array of a :code:`TransformedView`.
+        Projective transforms are handled with the perspective division.
+        """
+        matrix = self._matrix(source=source)
+        if not inverse:
+            matrix = np.linalg.inv(matrix)
+        return _apply_matrix(matrix, points_xy)
+
+    def output_bounds(self, input_shape=None, source=False):
+        """
+        Bounding box (xmin, xmax, ymin, ymax) of the pixel centres of an
+        input image of :code:`input_shape` in the transformed image
+
+        Computed from the four mapped corners, exact for affine and projective
+        transforms as long as the input does not cross the projective horizon.
+        """
+        if input_shape is None:
+            input_shape = self._input_shape(source=source)
+        corners = _corners(input_shape)
+        mapped = self.map_points(corners, source=source)
+        return (mapped[:, 0].min(), mapped[:, 0].max(),
+                mapped[:, 1].min(), mapped[:, 1].max())
+
+    def output_shape_for(self, input_shape=None, source=False):
+        """
+        Output shape and the translation moving the whole transformed
+        input into it, usable as :code:`translate(*shift, output_shape=shape)`
+        """
+        xmin, xmax, ymin, ymax = self.output_bounds(input_shape=input_shape, source=source)
+        xmin, ymin = np.floor(xmin), np.floor(ymin)
+        shape = (int(np.ceil(ymax) - ymin) + 1, int(np.ceil(xmax) - xmin) + 1)
+        return shape, (xmin, ymin)
+
+    def overlap_bounds(self, output_shape=None, input_shape=None, source=False):
+        """
+        Bounding box (xmin, xmax, ymin, ymax) of the region of the output
+        frame covered by the transformed input, or None if they do not overlap
+        """
+        if output_shape is None:
+            output_shape = self.current_shape()
+        xmin, xmax, ymin, ymax = self.output_bounds(input_shape=input_shape, source=source)
+        xmin, ymin = max(xmin, 0.), max(ymin, 0.)
+        xmax, ymax = min(xmax, output_shape[1] - 1.), min(ymax, output_shape[0] - 1.)
+        if xmin > xmax or ymin > ymax:
+            return None
+        return xmin, xmax, ymin, ymax
+
+    def valid_mask(self, output_shape=None, input_shape=None, source=False):
+        """
+        Boolean mask of the output pixels which sample inside the input,
+        i.e. the non-:code:`cval` pixels of the warp, computed without warping
+        """
+        if output_shape is None:
+            output_shape = self.current_shape()
+        if input_shape is None:
+            input_shape = self._input_shape(source=source)
+        rows, cols = np.indices(output_shape, dtype=np.float64)
+        mapped = self.map_points(np.stack((cols, rows), axis=-1), inverse=True, source=source)
+        eps = 1e-6
+        return ((mapped[..., 0] >= -eps) & (mapped[..., 0] <= input_shape[1] - 1 + eps)
+                & (mapped[..., 1] >= -eps) & (mapped[..., 1] <= input_shape[0] - 1 + eps))
 
     def get_current_center(self):
         current_shape = np.asarray(self.current_shape())
@@ -158,3 +366,340 @@ class ImageTransformer:
             self.clear_transforms()
         self.add_transform(transform, output_shape=output_shape)
         return transform
+
+    @staticmethod
+    def available_robust_methods():
+        """The outlier-rejecting estimators of :code:`estimate_transform_robust()`"""
+        return ['ransac', 'lmeds']
+
+    def estimate_transform_robust(self, static_points, moving_points,
+                                  method='affine', robust='ransac',
+                                  residual_threshold=3., max_trials=1000,
+                                  output_shape=None, clear=False, random_state=None):
+        """
+        Estimate a transform while rejecting mismatched points
+
+        Random minimal point subsets are fitted and scored all at once as
+        a batch of matrices; the best hypothesis (most inliers for
+        :code:`'ransac'`, lowest median squared residual for
+        :code:`'lmeds'`) selects the inliers, which are refitted by least
+        squares. The transform is added like in :code:`estimate_transform()`.
+
+        Returns
+        -------
+        transform, inliers, residuals
+            The estimated transform, a boolean inlier mask and the distance
+            in pixels of every mapped static point to its moving point
+        """
+        assert method in self.available_transforms()
+        assert robust in self.available_robust_methods()
+        static_points = np.asarray(static_points, dtype=float).reshape(-1, 2)
+        moving_points = np.asarray(moving_points, dtype=float).reshape(-1, 2)
+        assert static_points.size and moving_points.size, 'Need points to match'
+        assert static_points.size == moving_points.size, 'Must supply matching pointsets'
+        n_points = static_points.shape[0]
+        n_min = _MIN_POINTS[method]
+        if n_points < n_min:
+            raise ValueError(f'Need at least {n_min} point pairs for {method}')
+
+        rng = np.random.default_rng(random_state)
+        if n_points == n_min:
+            subsets = np.arange(n_points)[np.newaxis, :]
+        else:
+            subsets = rng.random((max_trials, n_points)).argpartition(n_min, axis=1)[:, :n_min]
+        best_score, best_inliers = None, None
+        for start in range(0, subsets.shape[0], _HYPOTHESIS_BATCH):
+            batch = subsets[start:start + _HYPOTHESIS_BATCH]
+            matrices = _fit_minimal(method, static_points[batch], moving_points[batch])
+            residuals = _residuals(matrices, static_points, moving_points)
+            if robust == 'ransac':
+                inliers = residuals <= residual_threshold
+                # more inliers first, smaller inlier error breaks ties
+                scores = (-inliers.sum(axis=1)
+                          + np.where(inliers, residuals, 0.).sum(axis=1)
+                          / (residual_threshold * n_points + 1.))
+            else:
+                scores = np.median(residuals ** 2, axis=1)
+            best = np.nanargmin(scores)
+            if best_score is None or scores[best] < best_score:
+                best_score = scores[best]
+                if robust == 'ransac':
+                    best_inliers = inliers[best]
+                else:
+                    dof = max(n_points - n_min, 1)
+                    sigma = 1.4826 * (1. + 5. / dof) * np.sqrt(scores[best])
+                    best_inliers = residuals[best] <= max(2.5 * sigma, 1e-9)
+
+        if best_inliers.sum() < n_min:
+            best_inliers = np.ones(n_points, dtype=bool)
+        transform = sktransform.estimate_transform(method,
+                                                   static_points[best_inliers],
+                                                   moving_points[best_inliers])
+        residuals = _residuals(transform.params[np.newaxis], static_points, moving_points)[0]
+        if clear:
+            self.clear_transforms()
+        self.add_transform(transform, output_shape=output_shape)
+        return transform, best_inliers, residuals
+
+
+_MIN_POINTS = {'euclidean': 2, 'similarity': 2, 'affine': 3, 'projective': 4}
+_HYPOTHESIS_BATCH = 256
+
+
+def _fit_minimal(method, src, dst):
+    """
+    Fit one transform per point subset, vectorised over the subsets
+
+    :code:`src` and :code:`dst` are (K, m, 2) arrays, returns (K, 3, 3)
+    matrices mapping :code:`src` to :code:`dst`. Degenerate subsets give
+    pseudo-inverse solutions which simply score badly.
+    """
+    n_hyp = src.shape[0]
+    x, y = src[..., 0], src[..., 1]
+    u, v = dst[..., 0], dst[..., 1]
+    ones, zeros = np.ones_like(x), np.zeros_like(x)
+    matrices = np.zeros((n_hyp, 3, 3))
+    matrices[:, 2, 2] = 1.
+    if method == 'affine':
+        design = np.stack((x, y, ones), axis=-1)
+        params = np.linalg.pinv(design) @ dst
+        matrices[:, :2, :] = params.transpose(0, 2, 1)
+    elif method in ('euclidean', 'similarity'):
+        # u = a x - b y + tx, v = b x + a y + ty
+        design = np.concatenate((np.stack((x, -y, ones, zeros), axis=-1),
+                                 np.stack((y, x, zeros, ones), axis=-1)), axis=1)
+        target = np.concatenate((u, v), axis=1)[..., np.newaxis]
+        a, b, tx, ty = (np.linalg.pinv(design) @ target)[..., 0].T
+        if method == 'euclidean':
+            norm = np.hypot(a, b)
+            norm[norm == 0] = 1.
+            a, b = a / norm, b / norm
+        matrices[:, 0] = np.stack((a, -b, tx), axis=-1)
+        matrices[:, 1] = np.stack((b, a, ty), axis=-1)
+    else:
+        # direct linear transform with h33 = 1
+        design = np.concatenate((np.stack((x, y, ones, zeros, zeros, zeros, -u * x, -u * y),
+                                          axis=-1),
+                                 np.stack((zeros, zeros, zeros, x, y, ones, -v * x, -v * y),
+                                          axis=-1)), axis=1)
+        target = np.concatenate((u, v), axis=1)[..., np.newaxis]
+        params = (np.linalg.pinv(design) @ target)[..., 0]
+        matrices.reshape(n_hyp, 9)[:, :8] = params
+    return matrices
+
+
+def _residuals(matrices, src, dst):
+    """Distances of (K, 3, 3) :code:`matrices` applied to (N, 2) :code:`src` from :code:`dst`"""
+    src_h = np.concatenate((src, np.ones((src.shape[0], 1))), axis=1)
+    mapped = matrices @ src_h.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mapped_xy = mapped[:, :2] / mapped[:, 2:]
+    residuals = np.hypot(*(mapped_xy - dst.T[np.newaxis]).transpose(1, 0, 2))
+    return np.where(np.isfinite(residuals), residuals, np.inf)
+
+
+class _FrameCache:
+    """LRU cache of rendered frames bounded by their total size in bytes"""
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._frames)
+
+    @staticmethod
+    def key(matrix, output_shape, order, *args):
+        # rounding merges matrices which differ only by accumulated float error
+        matrix = np.round(np.asarray(matrix, dtype=float), 9) + 0.
+        return (matrix.tobytes(), tuple(output_shape), order) + tuple(repr(a) for a in args)
+
+    def get(self, key):
+        frame = self._frames.get(key)
+        if frame is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._frames.move_to_end(key)
+        return frame
+
+    def put(self, key, frame):
+        if frame.nbytes > self.max_bytes or key in self._frames:
+            return
+        frame.flags.writeable = False
+        self._frames[key] = frame
+        self._nbytes += frame.nbytes
+        while self._nbytes > self.max_bytes:
+            _, evicted = self._frames.popitem(last=False)
+            self._nbytes -= evicted.nbytes
+
+    def clear(self):
+        self._frames.clear()
+        self._nbytes = 0
+
+    def evict(self, predicate):
+        # drop the frames whose key satisfies the predicate
+        for key in [key for key in self._frames if predicate(key)]:
+            self._nbytes -= self._frames.pop(key).nbytes
+
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _background_executor():
+    """Thread pool shared by the background resampling of the views"""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='materialise')
+        return _EXECUTOR
+
+
+def _apply_matrix(matrix, points_xy):
+    """Apply a homogeneous 3x3 matrix to an (..., 2) array of (x, y) points"""
+    points_xy = np.asarray(points_xy, dtype=float)
+    mapped = points_xy @ matrix[:2, :2].T + matrix[:2, 2]
+    if np.allclose(matrix[2], (0, 0, 1)):
+        return mapped
+    denominator = points_xy @ matrix[2, :2] + matrix[2, 2]
+    return mapped / denominator[..., np.newaxis]
+
+
+def _corners(shape):
+    """(x, y) pixel centres of the four corners of an image of :code:`shape`"""
+    rows, cols = shape[0] - 1., shape[1] - 1.
+    return np.array([[0., 0.], [cols, 0.], [0., rows], [cols, rows]])
+
+
+def _swap_xy(matrix):
+    """Reorder a homogeneous (x, y) matrix to act on (row, col) coordinates"""
+    return matrix[[1, 0, 2]][:, [1, 0, 2]]
+
+
+class TransformedView:
+    """
+    Lazy view of a source array through a transformation matrix
+
+    Holds the source array, the matrix mapping view pixels to source
+    pixels (same convention as :code:`ImageTransformer`) and the shape
+    of the view. Cropping with slices and further transforms only
+    compose matrices; the pixels are resampled once, from the source,
+    when :code:`materialise()` is called or the view is converted with
+    :code:`np.asarray`. Crops of an untransformed view stay plain slices.
+
+    Can be passed to :code:`ImageTransformer` and the alignment classes
+    in place of a numpy array.
+    """
+    def __init__(self, source, matrix=None, shape=None, offset=(0, 0)):
+        if isinstance(source, TransformedView):
+            matrix = source.matrix if matrix is None else source.matrix @ np.asarray(matrix)
+            shape = source.shape if shape is None else shape
+            offset = np.asarray(source.offset) + np.asarray(offset)
+            source = source.source
+        self._source = source
+        self._matrix = np.eye(3) if matrix is None else np.asarray(matrix, dtype=float)
+        self._shape = tuple(source.shape if shape is None else shape)
+        self._offset = np.asarray(offset, dtype=float)
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def matrix(self):
+        return self._matrix
+
+    @property
+    def offset(self):
+        """Accumulated (x, y) crop offset relative to the uncropped view"""
+        return self._offset
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def ndim(self):
+        return len(self._shape)
+
+    @property
+    def dtype(self):
+        return self._source.dtype
+
+    def __repr__(self):
+        return f'TransformedView(shape={self.shape}, source_shape={self.source.shape})'
+
+    def transform(self, *transforms, output_shape=None):
+        """New view with :code:`transforms` applied after this view"""
+        transform = ImageTransformer._combine_transforms(*transforms)
+        return TransformedView(self._source,
+                               matrix=self._matrix @ transform.params,
+                               shape=self._shape if output_shape is None else output_shape,
+                               offset=self._offset)
+
+    def crop(self, x0, x1, y0, y1):
+        """New view of the region [y0:y1, x0:x1], offsets are accumulated"""
+        shift = sktransform.EuclideanTransform(translation=(x0, y0)).params
+        return TransformedView(self._source,
+                               matrix=self._matrix @ shift,
+                               shape=(y1 - y0, x1 - x0),
+                               offset=self._offset + (x0, y0))
+
+    def __getitem__(self, key):
+        if (isinstance(key, tuple) and len(key) == 2
+                and all(isinstance(k, slice) and k.step in (None, 1) for k in key)):
+            (y0, y1, _), (x0, x1, _) = (k.indices(n) for k, n in zip(key, self._shape))
+            return self.crop(x0, max(x0, x1), y0, max(y0, y1))
+        return self.materialise()[key]
+
+    def _source_slice(self):
+        """Slices of the source if the view is an integer crop of it, else None"""
+        matrix = self._matrix
+        if not np.allclose(matrix[:2, :2], np.eye(2)) or not np.allclose(matrix[2], (0, 0, 1)):
+            return None
+        x0, y0 = matrix[:2, 2]
+        if not (float(x0).is_integer() and float(y0).is_integer()):
+            return None
+        x0, y0 = int(x0), int(y0)
+        rows, cols = self._shape
+        if x0 < 0 or y0 < 0 or y0 + rows > self._source.shape[0] \
+                or x0 + cols > self._source.shape[1]:
+            return None
+        return slice(y0, y0 + rows), slice(x0, x0 + cols)
+
+    def materialise(self, order=None, cval=np.nan, out=None):
+        """Resample the view from its source, in a single warp"""
+        slices = self._source_slice()
+        if slices is not None:
+            if out is None:
+                return self._source[slices]
+            np.copyto(out, self._source[slices], casting='same_kind')
+            return out
+        trans = ImageTransformer(self)
+        if out is not None:
+            return trans.warp_preserving_dtype(order=order, cval=cval, out=out)
+        return trans.get_transformed_image(order=order, cval=cval)
+
+    def materialise_async(self, order=None, cval=np.nan):
+        """
+        Start :code:`materialise()` on a background thread and return a
+        :code:`concurrent.futures.Future` of the array, the warp releases
+        the GIL so an interactive window stays responsive meanwhile
+        """
+        return _background_executor().submit(self.materialise, order=order, cval=cval)
+
+    def copy(self):
+        return np.array(self.materialise(), copy=True)
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.materialise()
+        if dtype is not None:
+            array = array.astype(dtype, copy=False)
+        return np.array(array, copy=True) if copy else array
@@ -0,0 +1,223 @@
+"""
+Tests of the interactive aligners and their blitting, rendered off-screen.
+"""
+import threading
+import matplotlib
+import numpy as np
+import pytest
+from skimage import transform as sktransform
+from matplotlib.backend_bases import KeyEvent, MouseEvent
+from align_panel.align.blit import BlitManager, DebouncedTask
+from align_panel.align.benchmark import synthetic_pair, registration_error
+from align_panel.align.crop import CropAlignments
+from align_panel.align.fine import FineAlignments
+from align_panel.align.points import PointAlignments, _PointPairs
+
+matplotlib.use("agg")
+
+
+class _ManualTimer:
+    """Timer of an interactive backend, fired by the test instead of the event loop."""
+
+    def __init__(self):
+        self.started = 0
+
+    def start(self):
+        self.started += 1
+
+    def stop(self):
+        pass
+
+
+def test_blit_manager_coalesces_requests():
+    figure = matplotlib.figure.Figure()
+    matplotlib.backends.backend_agg.FigureCanvasAgg(figure)
+    (line,) = figure.subplots().plot([0, 1], [0, 1])
+    blit = BlitManager(figure, [line])
+    assert line.get_animated()
+    # the timers of the Agg canvas never fire, the updates run immediately
+    assert blit._timer is None
+    blit._timer = _ManualTimer()
+    calls = []
+
+    def prepare():
+        calls.append(1)
+
+    for _ in range(5):
+        blit.request_update(prepare)
+    assert blit._timer.started == 1 and not calls
+    blit._run_pending()
+    stats = blit.frame_rate()
+    assert len(calls) == 1
+    assert stats["updates"] == 1 and stats["coalesced"] == 4
+
+
+def test_fine_alignments_blit():
+    ref_image, mov_image = synthetic_pair((256, 256), margin=16)
+    aligner = FineAlignments(ref_image, mov_image, rebin=2, show_result=False)
+    canvas = aligner._figure.canvas
+    canvas.draw()
+    assert aligner._blit._background is not None
+    for key in ("up", "up", "left"):
+        aligner._on_press(KeyEvent("key_press_event", canvas, key))
+    assert aligner.frame_rate["updates"] == 3
+    expected = aligner._trans.get_transformed_image()
+    np.testing.assert_array_equal(aligner._image1.get_array(), expected)
+    aligner._on_close(None)
+    assert aligner.tmat.params[:2, 2] == pytest.approx([10.0, 20.0])
+
+
+def test_fine_alignments_confirm():
+    ref_image, mov_image = synthetic_pair((128, 128), margin=8)
+    aligner = FineAlignments(ref_image, mov_image, rebin=2, show_result=False)
+    canvas = aligner._figure.canvas
+    for key in ("right", "enter"):
+        aligner._on_press(KeyEvent("key_press_event", canvas, key))
+    future = aligner.result_future
+    assert future is not None
+    assert aligner.tmat.params[:2, 2] == pytest.approx([-10.0, 0.0])
+    np.testing.assert_array_equal(aligner.result_image, aligner.result_view.materialise())
+    # closing without further changes keeps the result of the confirmation
+    aligner._on_close(None)
+    assert aligner.result_future is future
+
+
+def test_fine_alignments_rotated_full_resolution():
+    ref_image, mov_image = synthetic_pair((256, 256), margin=8)
+    aligner = FineAlignments(ref_image, mov_image, rebin=8, show_result=False)
+    canvas = aligner._figure.canvas
+    for key in ("r", "r", "+", "right", "enter"):
+        aligner._on_press(KeyEvent("key_press_event", canvas, key))
+    rebinned = aligner._trans.get_combined_transform()
+    # the centre of a block of 8 x 8 pixels follows the centre of its preview pixel
+    preview_points = np.array([[0.0, 0.0], [31.0, 0.0], [5.0, 27.0], [31.0, 31.0]])
+    np.testing.assert_allclose(
+        aligner.tmat(8 * preview_points + 3.5), 8 * rebinned(preview_points) + 3.5, atol=1e-9
+    )
+    aligner._on_close(None)
+
+
+def _mouse(name, axis, xy, button=1):
+    """Mouse event at the centre of the pixel ``xy`` of ``axis``."""
+    x, y = axis.transData.transform(np.add(xy, 0.5))
+    return MouseEvent(name, axis.figure.canvas, x, y, button=button)
+
+
+def test_point_alignments_editing():
+    ref_image, mov_image = synthetic_pair((128, 128), margin=8)
+    aligner = PointAlignments(ref_image, mov_image, rebin=2, show_result=False)
+    ref_axis, mov_axis = aligner._axes
+    aligner._figure.canvas.draw()
+    for xy in [(10, 10), (60, 20), (100, 100)]:
+        aligner._on_click(_mouse("button_press_event", ref_axis, xy))
+    # drag the second point in the moving image, the others keep their position
+    aligner._on_click_2(_mouse("button_press_event", mov_axis, (61, 21)))
+    aligner._on_motion_2(_mouse("motion_notify_event", mov_axis, (65, 25)))
+    aligner._on_release_2(_mouse("button_release_event", mov_axis, (65, 25)))
+    np.testing.assert_array_equal(aligner.mov_points, [[10, 10], [65, 25], [100, 100]])
+    np.testing.assert_array_equal(aligner.ref_points, [[10, 10], [60, 20], [100, 100]])
+    # right click removes the pair of the clicked point, not a pair sharing its x coordinate
+    aligner._on_click(_mouse("button_press_event", ref_axis, (10, 10), button=3))
+    np.testing.assert_array_equal(aligner._pairs.ids, [1, 2])
+    np.testing.assert_array_equal(aligner.ref_points, [[60, 20], [100, 100]])
+    np.testing.assert_array_equal(aligner._line2.get_xydata(), aligner.mov_points)
+
+
+def test_point_pairs_many():
+    points = np.random.default_rng(0).random((300, 2)) * 1000
+    pairs = _PointPairs(points, points + 1)
+    assert len(pairs) == 300
+    assert pairs.nearest(1, points[123] + 1.5, radius=1) == 123
+    for point_id in range(0, 300, 2):
+        pairs.remove(point_id)
+    assert pairs.row(123) == 61 and pairs.row(124) is None
+    pairs.move(123, 0, (0, 0))
+    np.testing.assert_array_equal(pairs.ref[61], [0, 0])
+    assert pairs.add((1, 1), (2, 2)) == 300
+
+
+@pytest.mark.parametrize("method", ["euclidean", "affine", "projective"])
+def test_point_alignments_live(method):
+    ref_image, mov_image = synthetic_pair((128, 128), margin=8)
+    aligner = PointAlignments(
+        ref_image, mov_image, rebin=2, method=method, show_result=False, live=True
+    )
+    ref_axis, mov_axis = aligner._axes
+    aligner._figure.canvas.draw()
+    assert aligner.live_transform is None
+    for xy in [(10, 10), (100, 20), (60, 100), (100, 100), (20, 70)]:
+        aligner._on_click(_mouse("button_press_event", ref_axis, xy))
+    aligner._on_click(_mouse("button_press_event", ref_axis, (20, 70), button=3))
+    aligner._on_click_2(_mouse("button_press_event", mov_axis, (100, 20)))
+    for xy in [(90, 30), (104, 22)]:
+        aligner._on_motion_2(_mouse("motion_notify_event", mov_axis, xy))
+    aligner._on_release_2(_mouse("button_release_event", mov_axis, (104, 22)))
+    expected = sktransform.estimate_transform(method, aligner.ref_points, aligner.mov_points)
+    predicted = aligner.live_transform(aligner.ref_points)
+    # total and ordinary least squares differ by a fraction of the residuals
+    atol = 1e-6 if method == "euclidean" else 0.05
+    np.testing.assert_allclose(predicted, expected(aligner.ref_points), atol=atol)
+    np.testing.assert_allclose(
+        aligner.live_residuals, np.hypot(*(predicted - aligner.mov_points).T)
+    )
+    overlay = aligner._live["overlay"]
+    assert overlay.get_visible() and np.isfinite(overlay.get_array()).any()
+
+
+def test_debounced_task_drops_stale():
+    figure = matplotlib.figure.Figure()
+    matplotlib.backends.backend_agg.FigureCanvasAgg(figure)
+    gate = threading.Event()
+    applied = []
+
+    def compute(value):
+        gate.wait(5)
+        return value
+
+    task = DebouncedTask(figure, compute, applied.append)
+    task._timers = {"debounce": _ManualTimer(), "poll": _ManualTimer()}
+    for value in range(3):
+        task.request(value)
+    assert task._timers["debounce"].started == 3
+    # the first computation blocks the worker, the second is queued and cancelled by the third
+    for value in (None, 3, 4):
+        if value is not None:
+            task.request(value)
+        task._submit()
+    gate.set()
+    task._future[1].result()
+    task._poll()
+    assert applied == [4]
+    # a result overtaken by a newer request is dropped
+    task._submit()
+    task.request(5)
+    task._future[1].result()
+    task._poll()
+    assert applied == [4]
+    stats = task.stats
+    assert stats["cancelled"] == 1 and stats["dropped"] == 1 and stats["submitted"] == 4
+    task.close()
+
+
+def test_crop_alignments_live():
+    transform = sktransform.EuclideanTransform(translation=(10.0, -6.0))
+    ref_image, mov_image = synthetic_pair((256, 256), transform, sigma=6, margin=32)
+    aligner = CropAlignments(
+        ref_image, mov_image, rebin=2, method="cross_corelation_fft", inverse=False,
+        sub_pixel_factor=10, show_result=False, live=True,
+    )
+    canvas = aligner.figure.canvas
+    canvas.draw()
+    assert aligner.live_transform is None
+    # draw the reference crop, the moving crop takes its place until it is drawn
+    for name, xy in [
+        ("button_press_event", (64, 64)),
+        ("motion_notify_event", (128, 128)),
+        ("motion_notify_event", (192, 192)),
+        ("button_release_event", (192, 192)),
+    ]:
+        canvas.callbacks.process(name, _mouse(name, aligner.axes[0], xy))
+    assert aligner._live["task"].stats["applied"] >= 2
+    assert registration_error(aligner.live_transform, transform, ref_image.shape) < 1.5
+    assert aligner.live_metrics["ncc"] > 0.9
+    assert aligner._live["overlay"].get_visible()
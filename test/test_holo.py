@@ -8,6 +8,7 @@ from hyperspy._signals.hologram_image import HologramImage
 from hyperspy._signals.complex_signal import ComplexSignal
 from hyperspy._signals.signal2d import Signal2D
 from align_panel.data_structure import ImageSetHolo
+from align_panel.align.session import AlignmentSession
 
 
 @pytest.mark.parametrize(
@@ -163,6 +164,20 @@ def test_save_load_only_1image(image_set_no_ref, tmp_path):
     )
 
 
+def test_save_session_load(image_set, tmp_path):
+    d = tmp_path / "results"
+    d.mkdir()
+    p = d / "test.nxs"
+    image_set.save(path=p)
+    session = AlignmentSession("fine", {"rebin": 2, "refine": "affine"}, {"keys": []}, (200, 200))
+    ImageSetHolo.save_session(p, 0, session)
+    # the alignments group without a tmat does not break the loading
+    image_set_loaded = ImageSetHolo.load_from_nxs(p)
+    assert image_set_loaded.tmat is None
+    sessions = ImageSetHolo.load_sessions(p)
+    assert sessions["fine"].to_dict() == session.to_dict()
+
+
 def test_save_load_2_imagesets_full(image_set, image_set1, tmp_path):
     d = tmp_path / "results"
     d.mkdir()
@@ -0,0 +1,152 @@
+"""
+Tests of the ImageTransformer class, no data files are needed.
+"""
+import pytest
+import numpy as np
+from skimage import transform as sktransform
+from align_panel.image_transformer import ImageTransformer, TransformedView
+
+
+@pytest.fixture
+def image():
+    rng = np.random.default_rng(0)
+    return rng.random((64, 80)).astype(np.float32)
+
+
+@pytest.fixture
+def transform():
+    return sktransform.AffineTransform(rotation=0.2, translation=(3.3, -2.1), scale=(1.1, 0.9))
+
+
+def test_warp_preserving_dtype(image, transform):
+    trans = ImageTransformer(image)
+    trans.add_transform(transform)
+    expected = trans.get_transformed_image(order=1)
+    result = trans.warp_preserving_dtype(order=1)
+    assert result.dtype == np.float32
+    assert np.array_equal(np.isnan(expected), np.isnan(result))
+    assert np.allclose(expected[~np.isnan(expected)], result[~np.isnan(result)], atol=1e-4)
+
+
+def test_warp_preserving_dtype_out(image, transform):
+    trans = ImageTransformer(image)
+    trans.add_transform(transform)
+    out = np.empty(image.shape, dtype=np.float32)
+    result = trans.get_transformed_image(out=out)
+    assert result is out
+
+
+def test_warp_preserving_dtype_projective(image):
+    matrix = np.array([[1., 0.05, 2.], [0.02, 1., -1.], [1e-4, 2e-4, 1.]])
+    trans = ImageTransformer(image)
+    trans.add_transform(sktransform.ProjectiveTransform(matrix=matrix))
+    expected = sktransform.warp(image, sktransform.ProjectiveTransform(matrix=matrix),
+                                order=1, preserve_range=True, cval=np.nan)
+    result = trans.warp_preserving_dtype(order=1)
+    assert result.dtype == np.float32
+    valid = ~np.isnan(expected) & ~np.isnan(result)
+    assert np.allclose(expected[valid], result[valid], atol=1e-4)
+
+
+def test_view_crop_is_slice(image):
+    view = TransformedView(image)[10:30, 5:45]
+    assert view.shape == (20, 40)
+    assert np.all(view.offset == (5, 10))
+    assert np.shares_memory(view.materialise(), image)
+
+
+def test_view_single_resampling(image, transform):
+    trans = ImageTransformer(TransformedView(image)[8:56, 10:70])
+    trans.add_transform(transform)
+    shift = sktransform.EuclideanTransform(translation=(10, 8))
+    expected = sktransform.warp(image, sktransform.AffineTransform(
+        matrix=shift.params @ transform.params), output_shape=(48, 60),
+        order=1, preserve_range=True, cval=np.nan)
+    result = trans.get_transformed_view()
+    assert isinstance(result, TransformedView)
+    assert np.allclose(np.asarray(result), expected, equal_nan=True)
+
+
+def test_view_materialise_async(image, transform):
+    trans = ImageTransformer(image)
+    trans.add_transform(transform)
+    view = trans.get_transformed_view()
+    future = view.materialise_async(order=1)
+    assert np.array_equal(future.result(), view.materialise(order=1), equal_nan=True)
+
+
+@pytest.mark.parametrize("method", ImageTransformer.available_transforms())
+@pytest.mark.parametrize("robust", ImageTransformer.available_robust_methods())
+def test_estimate_transform_robust(method, robust):
+    rng = np.random.default_rng(1)
+    expected = sktransform.SimilarityTransform(rotation=0.1, translation=(5., -3.))
+    static_points = rng.random((200, 2)) * 500
+    moving_points = expected(static_points) + rng.normal(0, 0.2, (200, 2))
+    outliers = np.zeros(200, dtype=bool)
+    outliers[::5] = True
+    moving_points[outliers] += rng.uniform(20, 50, (outliers.sum(), 2))
+    trans = ImageTransformer(np.zeros((10, 10)))
+    transform, inliers, residuals = trans.estimate_transform_robust(
+        static_points, moving_points, method=method, robust=robust, random_state=0)
+    assert np.array_equal(inliers, ~outliers)
+    assert residuals.shape == (200,)
+    assert np.allclose(transform(static_points), expected(static_points), atol=0.5)
+
+
+def test_map_points(image, transform):
+    trans = ImageTransformer(image)
+    trans.add_transform(transform)
+    points = np.random.default_rng(2).random((50, 2)) * 60
+    assert np.allclose(trans.map_points(points, inverse=True), transform(points))
+    assert np.allclose(trans.map_points(trans.map_points(points), inverse=True), points)
+
+
+def test_valid_mask(image, transform):
+    trans = ImageTransformer(image)
+    trans.add_transform(transform)
+    warped = trans.get_transformed_image(order=1)
+    valid = trans.valid_mask()
+    assert np.array_equal(valid, ~np.isnan(warped))
+    xmin, xmax, ymin, ymax = trans.overlap_bounds()
+    rows, cols = np.nonzero(valid)
+    assert xmin <= cols.min() and cols.max() <= xmax
+    assert ymin <= rows.min() and rows.max() <= ymax
+
+
+def test_output_shape_for(image):
+    trans = ImageTransformer(image)
+    trans.rotate_about_center(rotation_degrees=30)
+    shape, shift = trans.output_shape_for()
+    trans.translate(*shift, output_shape=shape)
+    xmin, xmax, ymin, ymax = trans.output_bounds()
+    assert xmin >= 0 and ymin >= 0
+    assert xmax <= shape[1] - 1 and ymax <= shape[0] - 1
+
+
+def test_frame_cache_undo_redo(image, transform):
+    trans = ImageTransformer(image, cache_bytes=10 * image.nbytes)
+    trans.add_transform(transform)
+    first = trans.get_transformed_image()
+    trans.translate(xshift=2.)
+    second = trans.get_transformed_image()
+    trans.undo()
+    assert trans.get_transformed_image() is first
+    trans.redo()
+    assert trans.get_transformed_image() is second
+    trans.clear_transforms()
+    trans.redo(2)
+    assert trans.get_transformed_image() is second
+    assert trans.cache.hits == 3 and trans.cache.misses == 2
+
+
+def test_frame_cache_bounded(image, transform):
+    trans = ImageTransformer(image)
+    trans.add_transform(transform)
+    frame_bytes = trans.get_transformed_image().nbytes
+    trans = ImageTransformer(image, cache_bytes=int(2.5 * frame_bytes))
+    trans.add_transform(transform)
+    for _ in range(5):
+        trans.translate(xshift=1.)
+        trans.get_transformed_image()
+    assert len(trans.cache) == 2
+    assert trans.cache.nbytes <= trans.cache.max_bytes
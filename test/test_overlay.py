@@ -0,0 +1,53 @@
+"""
+Tests of the overlay modes of the alignment results, rendered off-screen.
+"""
+import matplotlib
+import numpy as np
+import pytest
+from matplotlib.backend_bases import KeyEvent
+from skimage import transform as sktransform
+from align_panel.align.benchmark import synthetic_pair
+from align_panel.align.fine import FineAlignments
+from align_panel.align.overlay import OVERLAY_MODES, OverlayPreview, compose
+
+matplotlib.use("agg")
+
+
+def test_compose_modes():
+    ref = np.linspace(0, 1, 64 * 64).reshape(64, 64)
+    aligned = ref.copy()
+    aligned[:, :8] = np.nan
+    for mode in OVERLAY_MODES:
+        frame = compose(ref, aligned, mode, square=16)
+        assert frame.shape == (64, 64, 3) and frame.dtype == np.uint8
+    # identical images are white in the difference and gray in red/cyan
+    np.testing.assert_array_equal(compose(ref, aligned, "difference"), 255)
+    frame = compose(ref, aligned, "red_cyan")
+    np.testing.assert_array_equal(frame[..., 0], frame[..., 1])
+    board = compose(np.zeros((64, 64)), np.ones((64, 64)), "checkerboard", square=16)
+    assert board[0, 0, 0] == 0 and board[0, 16, 0] == 255 and board[16, 16, 0] == 0
+    with pytest.raises(ValueError):
+        compose(ref, ref, "unknown")
+
+
+def test_overlay_preview_keys():
+    transform = sktransform.EuclideanTransform(translation=(10.0, -6.0))
+    ref_image, mov_image = synthetic_pair((512, 512), transform, sigma=6, margin=32)
+    aligned = OverlayPreview(ref_image, mov_image, transform, max_size=128)
+    misaligned = OverlayPreview(ref_image, mov_image, np.eye(3), max_size=128)
+    assert aligned.frame().shape == (128, 128, 3)
+    # the difference of aligned images is close to white
+    assert aligned.frame("difference").mean() > misaligned.frame("difference").mean() + 10
+    figure = aligned.show()
+    for key, mode in [("2", "difference"), ("m", "checkerboard"), ("5", "edges")]:
+        aligned._on_key(KeyEvent("key_press_event", figure.canvas, key))
+        assert aligned.mode == mode
+    np.testing.assert_array_equal(aligned._image.get_array(), aligned.frame("edges"))
+
+
+def test_aligner_result_overlay():
+    ref_image, mov_image = synthetic_pair((128, 128), margin=8)
+    aligner = FineAlignments(ref_image, mov_image, rebin=2, show_result=True)
+    aligner._on_press(KeyEvent("key_press_event", aligner._figure.canvas, "right"))
+    aligner._on_close(None)
+    assert aligner.overlay.mode == "blend"
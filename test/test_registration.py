@@ -0,0 +1,290 @@
+"""
+Tests of the automatic alignments on synthetic images, no data files are needed.
+"""
+import json
+import weakref
+import pytest
+import numpy as np
+from matplotlib.backend_bases import KeyEvent
+from skimage import transform as sktransform
+from skimage.registration import phase_cross_correlation
+from align_panel.align.crop import align_auto
+from align_panel.align.benchmark import (synthetic_pair, registration_error, benchmark_methods,
+                                         summarise, format_table, save_json)
+from align_panel.align.registration import (bin_image, rescale_matrix, rescale_transform,
+                                            RegistrationTarget, rotation_scan)
+from align_panel.align.batch import align_stack, track_drift
+from align_panel.align.features import FeatureAlignments, match_features
+from align_panel.align.fine import FineAlignments
+from align_panel.align.points import PointAlignments, refine_points
+from align_panel.align.refine import refine_ecc
+from align_panel.align.metrics import alignment_metrics, mutual_information
+from align_panel.align.preview import preview, preview_extent, _PREVIEWS, _WATCHED
+
+
+@pytest.fixture(scope="module")
+def shifted_pair():
+    transform = sktransform.AffineTransform(translation=(-9.3, 6.6))
+    return transform, synthetic_pair((256, 256), transform, noise=0.05)
+
+
+def test_bin_image():
+    image = np.arange(7 * 9, dtype=np.float32).reshape(7, 9)
+    binned = bin_image(image, 3)
+    assert binned.shape == (2, 3)
+    assert binned.dtype == np.float32
+    assert binned[0, 0] == image[:3, :3].mean()
+
+
+def test_rescale_transform():
+    transform = sktransform.AffineTransform(rotation=0.1, translation=(2.0, -1.0))
+    fine = rescale_transform(transform, 4)
+    coarse_point = np.array([[10.0, 20.0]])
+    fine_point = 4 * coarse_point + 1.5
+    assert np.allclose(fine(fine_point), 4 * transform(coarse_point) + 1.5)
+    # 1 / factor converts back to the binned image
+    np.testing.assert_allclose(rescale_matrix(fine.params, 1 / 4), transform.params, atol=1e-12)
+
+
+@pytest.mark.parametrize("method", ["PyStackReg_translation", "cross_corelation_hyperspy",
+                                    "cross_corelation_skimage", "cross_corelation_fft"])
+@pytest.mark.parametrize("levels", [1, 3])
+def test_align_auto_pyramid(shifted_pair, method, levels):
+    transform, (ref_image, mov_image) = shifted_pair
+    estimated = align_auto(ref_image, mov_image, method, inverse=False, levels=levels)
+    assert registration_error(estimated, transform, ref_image.shape) < 1.0
+
+
+@pytest.mark.parametrize("method", ["PyStackReg_translation", "cross_corelation_fft"])
+@pytest.mark.parametrize("workers,shared_threshold", [(1, 0), (2, 0), (2, 2**40)])
+def test_align_stack(workers, shared_threshold, method):
+    transforms = [sktransform.AffineTransform(translation=(dx, dy))
+                  for dx, dy in [(3.0, -2.0), (-5.5, 1.0), (0.0, 4.5)]]
+    pairs = [synthetic_pair((128, 128), transform, seed=1) for transform in transforms]
+    ref_image = pairs[0][0]
+    matrices, stats = align_stack(ref_image, [mov for _, mov in pairs],
+                                  method, workers=workers,
+                                  shared_threshold=shared_threshold, inverse=False)
+    assert matrices.shape == (3, 3, 3)
+    assert np.allclose(matrices, [t.params for t in transforms], atol=0.5)
+    assert stats["time"].shape == (3,)
+    assert np.all(stats["ncc"] > 0.95)
+    assert np.all(stats["overlap"] > 0.9)
+
+
+@pytest.mark.parametrize("reference", ["previous", "running"])
+def test_track_drift(reference):
+    image, _ = synthetic_pair(shape=(512, 512), margin=0)
+    shifts = np.cumsum(np.random.default_rng(1).integers(-2, 3, size=(10, 2)), axis=0)
+    shifts[0] = 0
+    shifts[6:] += 24
+    offsets = 100 + shifts
+
+    def frames():
+        for y, x in offsets:
+            frame = image[y : y + 256, x : x + 256].copy()
+            if (y, x) == tuple(offsets[4]):
+                frame = np.random.default_rng(2).normal(size=frame.shape).astype(np.float32)
+            yield frame
+
+    matrices, stats = track_drift(frames(), "cross_corelation_fft", reference=reference)
+    assert matrices.shape == (10, 3, 3)
+    good = np.arange(10) != 4
+    np.testing.assert_allclose(matrices[good, :2, 2], -shifts[good, ::-1], atol=0.5)
+    assert stats["ncc"][good].min() > 0.9
+
+
+@pytest.mark.parametrize("upsample_factor", [1, 2, 20])
+@pytest.mark.parametrize("shape", [(128, 128), (127, 130)])
+def test_registration_target(shape, upsample_factor):
+    transform = sktransform.AffineTransform(translation=(-7.3, 4.6))
+    ref_image, mov_image = synthetic_pair(shape, transform, noise=0.05)
+    expected, _, _ = phase_cross_correlation(ref_image, mov_image, normalization=None,
+                                             upsample_factor=upsample_factor)
+    target = RegistrationTarget(ref_image, upsample_factor=upsample_factor, window=False)
+    shifts, peak = target.register(mov_image)
+    assert np.allclose(shifts, expected)
+    assert 0.8 < peak <= 1.0
+    estimated = align_auto(target, mov_image, "cross_corelation_fft", inverse=False)
+    assert registration_error(estimated, transform, shape) < 1.0
+
+
+@pytest.mark.parametrize("rotation,scale", [(0.3, 1.0), (-0.5, 1.05), (2.5, 0.97)])
+def test_fourier_mellin(rotation, scale):
+    center = np.array([127.5, 127.5])
+    transform = sktransform.AffineTransform(
+        matrix=sktransform.EuclideanTransform(translation=center).params
+        @ sktransform.SimilarityTransform(rotation=rotation, scale=scale,
+                                          translation=(4.0, -3.0)).params
+        @ sktransform.EuclideanTransform(translation=-center).params)
+    ref_image, mov_image = synthetic_pair((256, 256), transform, noise=0.05, margin=160)
+    estimated = align_auto(ref_image, mov_image, "fourier_mellin", inverse=False)
+    assert registration_error(estimated, transform, ref_image.shape) < 3.0
+
+
+def test_match_features():
+    rng = np.random.default_rng(3)
+    descriptors = rng.random((50, 256)) > 0.5
+    order = rng.permutation(50)
+    matches = match_features(descriptors, descriptors[order])
+    assert len(matches) == 50
+    assert np.array_equal(order[matches[:, 1]], matches[:, 0])
+
+
+@pytest.mark.parametrize("detector", ["orb", "harris"])
+def test_feature_alignments(detector):
+    center = np.array([127.5, 127.5])
+    transform = sktransform.AffineTransform(
+        matrix=sktransform.EuclideanTransform(translation=center).params
+        @ sktransform.EuclideanTransform(rotation=0.15, translation=(5.0, -2.0)).params
+        @ sktransform.EuclideanTransform(translation=-center).params)
+    ref_image, mov_image = synthetic_pair((256, 256), transform, noise=0.05, sigma=3, margin=160)
+    aligned = FeatureAlignments(ref_image, mov_image, detector=detector)
+    assert aligned.inliers.sum() >= 10
+    assert registration_error(aligned.tmat, transform, ref_image.shape) < 1.5
+    assert aligned.metrics["ncc"] > 0.9
+
+
+@pytest.mark.parametrize("level", [0, 1, 2])
+def test_alignment_metrics(level):
+    transform = sktransform.AffineTransform(translation=(7.3, -4.1))
+    ref_image, mov_image = synthetic_pair((256, 256), transform, noise=0.05)
+    good = alignment_metrics(ref_image, mov_image, transform, level=level)
+    bad = alignment_metrics(
+        ref_image, mov_image, sktransform.AffineTransform(translation=(40.0, 0.0)), level=level
+    )
+    assert good["ncc"] > 0.99 and abs(bad["ncc"]) < 0.2
+    assert good["mutual_information"] > 5 * bad["mutual_information"]
+    assert good["peak_sharpness"] > 5 * bad["peak_sharpness"]
+    assert bad["overlap"] == pytest.approx(1 - 40 / 256, abs=0.02)
+    inverted = alignment_metrics(ref_image, -mov_image, transform, level=level, inverse=True)
+    assert inverted["ncc"] == pytest.approx(good["ncc"])
+
+
+def test_mutual_information_inverted():
+    image = np.random.default_rng(0).random((64, 64))
+    noise = np.random.default_rng(1).random((64, 64))
+    assert mutual_information(image, 2 - 3 * image, bins=8) == pytest.approx(np.log(8), rel=0.01)
+    assert mutual_information(image, noise, bins=8) < 0.05
+
+
+def test_benchmark_methods(tmp_path):
+    methods = ("cross_corelation_skimage", "PyStackReg_rigid")
+    records = benchmark_methods(methods, sizes=(128,), noises=(0.1,), repeats=2)
+    assert len(records) == 2 * 2 * len(methods)
+    summary = summarise(records)
+    assert len(summary) == 2 * len(methods)
+    rates = {(row["method"], row["transform"]): row["success_rate"] for row in summary}
+    assert rates[("cross_corelation_skimage", "translation")] == 1.0
+    assert rates[("PyStackReg_rigid", "rigid")] == 1.0
+    assert "PyStackReg_rigid" in format_table(summary)
+    failed = dict(records[0], time=np.nan, error=None, success=False)
+    save_json(records + [failed], tmp_path / "benchmark.json", sizes=[128])
+    saved = json.loads((tmp_path / "benchmark.json").read_text())
+    assert saved["config"] == {"sizes": [128]} and len(saved["records"]) == len(records) + 1
+    assert saved["records"][-1]["time"] is None
+
+
+def _about_center(matrix, shape):
+    center = np.array(shape[::-1]) / 2 - 0.5
+    return (sktransform.EuclideanTransform(translation=center).params @ matrix
+            @ sktransform.EuclideanTransform(translation=-center).params)
+
+
+@pytest.mark.parametrize("motion", ["translation", "affine", "projective"])
+def test_refine_ecc(motion):
+    matrix = {
+        "translation": np.array([[1.0, 0.0, 3.3], [0.0, 1.0, -2.2], [0.0, 0.0, 1.0]]),
+        "affine": np.array([[1.02, 0.01, -3.0], [-0.015, 0.99, 2.5], [0.0, 0.0, 1.0]]),
+        "projective": np.array([[1.01, 0.01, -3.0], [-0.01, 0.99, 2.5], [2e-5, -1e-5, 1.0]]),
+    }[motion]
+    transform = sktransform.ProjectiveTransform(matrix=_about_center(matrix, (256, 256)))
+    ref_image, mov_image = synthetic_pair((256, 256), transform, noise=0.1, margin=160)
+    refined = refine_ecc(ref_image, mov_image, motion=motion)
+    assert registration_error(refined, transform, ref_image.shape) < 0.2
+
+
+def test_align_auto_ecc(shifted_pair):
+    transform, (ref_image, mov_image) = shifted_pair
+    estimated = align_auto(ref_image, mov_image, "ecc_affine", inverse=False)
+    assert registration_error(estimated, transform, ref_image.shape) < 0.2
+
+
+def test_fine_alignments_refine():
+    rigid = sktransform.EuclideanTransform(rotation=0.03, translation=(8.0, -4.0))
+    transform = sktransform.AffineTransform(matrix=_about_center(rigid.params, (256, 256)))
+    ref_image, mov_image = synthetic_pair((256, 256), transform, sigma=6, margin=160)
+    aligner = FineAlignments(ref_image, mov_image, rebin=2, show_result=False)
+    aligner._on_press(KeyEvent("key_press_event", aligner._figure.canvas, "a"))
+    aligner._on_close(None)
+    assert registration_error(aligner.tmat, transform, ref_image.shape) < 1.5
+    assert aligner.metrics["ncc"] > 0.95
+
+
+@pytest.mark.parametrize("angle", [-150.0, 5.2, 90.7])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_rotation_scan(angle, workers):
+    rigid = sktransform.EuclideanTransform(rotation=np.deg2rad(angle), translation=(4.2, -1.3))
+    transform = sktransform.AffineTransform(matrix=_about_center(rigid.params, (256, 256)))
+    ref_image, mov_image = synthetic_pair((256, 256), transform, noise=0.2, sigma=6, margin=200)
+    estimated, (angles, peaks) = rotation_scan(ref_image, mov_image, scan_size=64,
+                                               workers=workers)
+    assert angles.shape == peaks.shape == (360,)
+    assert abs(angles[np.argmax(peaks)] - angle) <= 1.0
+    assert registration_error(estimated, transform, ref_image.shape) < 0.5
+
+
+def test_align_auto_rotation_scan():
+    rigid = sktransform.EuclideanTransform(rotation=np.deg2rad(-37.3), translation=(2.0, 3.0))
+    transform = sktransform.AffineTransform(matrix=_about_center(rigid.params, (128, 128)))
+    ref_image, mov_image = synthetic_pair((128, 128), transform, sigma=4, margin=100)
+    estimated = align_auto(ref_image, mov_image, "rotation_scan", inverse=False)
+    assert registration_error(estimated, transform, ref_image.shape) < 0.5
+
+
+def test_preview_cache():
+    image = np.random.default_rng(0).random((70, 90)).astype(np.float32)
+    binned = preview(image, 4)
+    assert binned.shape == (17, 22) and not binned.flags.writeable
+    np.testing.assert_allclose(binned[1, 2], image[4:8, 8:12].mean(), rtol=1e-6)
+    assert preview(image, 4) is binned
+    assert preview(image, 2) is not binned
+    assert preview_extent(image, 4) == [0, 88, 68, 0]
+    image[::2, ::2] = 0
+    assert preview(image, 4) is not binned
+    full = preview(image, 1)
+    assert np.shares_memory(full, image) and not full.flags.writeable and image.flags.writeable
+    key = id(image)
+    # one finalizer per image, however many previews it has
+    assert weakref.getweakrefcount(image) == 1 and key in _WATCHED
+    del image, full
+    assert not [k for k in _PREVIEWS._frames if k[0] == key] and key not in _WATCHED
+
+
+def test_refine_points():
+    transform = sktransform.AffineTransform(translation=(7.3, -5.6), rotation=0.01)
+    ref_image, mov_image = synthetic_pair((256, 256), transform, noise=0.1, margin=32)
+    rng = np.random.default_rng(0)
+    ref_points = np.rint(rng.uniform(30, 220, (40, 2)))
+    ref_points[0] = (3, 3)  # patch outside of the image
+    true_points = transform(ref_points)
+    clicked = np.rint(true_points + rng.uniform(-4, 4, true_points.shape))
+    refined, scores = refine_points(ref_image, mov_image, ref_points, clicked)
+    assert np.isnan(scores[0]) and np.array_equal(refined[0], clicked[0])
+    assert np.all(scores[1:] > 0.9)
+    assert np.abs(refined[1:] - true_points[1:]).max() < 0.4
+    assert np.abs(refined[1:] - true_points[1:]).mean() < 0.1
+
+
+def test_point_alignments_subpixel():
+    transform = sktransform.EuclideanTransform(translation=(7.3, -5.6), rotation=0.01)
+    ref_image, mov_image = synthetic_pair((256, 256), transform, margin=32)
+    ref_points = np.array([[40.0, 40.0], [200.0, 60.0], [120.0, 210.0], [210.0, 200.0]])
+    clicked = np.rint(transform(ref_points)) + [[2, -1], [-3, 0], [1, 3], [0, -2]]
+    aligner = PointAlignments(
+        ref_image, mov_image, rebin=2, points=(ref_points, clicked), show_result=False,
+        subpixel=True,
+    )
+    aligner._on_close(None)
+    assert np.all(aligner.match_scores > 0.9)
+    assert np.abs(aligner.tmat(ref_points) - transform(ref_points)).max() < 0.3
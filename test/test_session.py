@@ -0,0 +1,99 @@
+"""
+Tests of the recording and headless replay of the alignment sessions, no data files are needed.
+"""
+import subprocess
+import sys
+import matplotlib
+import numpy as np
+import pytest
+from matplotlib.backend_bases import KeyEvent
+from skimage import transform as sktransform
+from align_panel.align.batch import replay_session, replay_sessions
+from align_panel.align.benchmark import synthetic_pair, registration_error
+from align_panel.align.crop import CropAlignments
+from align_panel.align.fine import FineAlignments
+from align_panel.align.points import PointAlignments
+from align_panel.align.registration import bin_image
+from align_panel.align.session import AlignmentSession
+
+matplotlib.use("agg")
+
+
+@pytest.fixture
+def rigid_pair():
+    transform = sktransform.EuclideanTransform(translation=(10.0, -6.0))
+    return transform, synthetic_pair((256, 256), transform, sigma=6, margin=32)
+
+
+def _round_trip(session):
+    return AlignmentSession.from_json(session.to_json())
+
+
+def test_fine_session_replay(rigid_pair):
+    transform, (ref_image, mov_image) = rigid_pair
+    aligner = FineAlignments(ref_image, mov_image, rebin=2, show_result=False)
+    canvas = aligner._figure.canvas
+    for key in ("right", "up", "down", "ctrl+z", "enter"):
+        aligner._on_press(KeyEvent("key_press_event", canvas, key))
+    session = _round_trip(aligner.session)
+    assert [key for key, _ in session.inputs["keys"]] == ["right", "up", "down", "ctrl+z"]
+    replayed = replay_session(session, ref_image, mov_image)
+    np.testing.assert_allclose(replayed["tmat"].params, aligner.tmat.params)
+    # replayed at twice the resolution, the translation doubles
+    large = [np.kron(image, np.ones((2, 2))) for image in (ref_image, mov_image)]
+    replayed = replay_session(session, *large)
+    np.testing.assert_allclose(replayed["tmat"].params[:2, 2], 2 * aligner.tmat.params[:2, 2])
+
+
+def test_points_session_replay(rigid_pair):
+    transform, (ref_image, mov_image) = rigid_pair
+    binned = [bin_image(image, 2) for image in (ref_image, mov_image)]
+    ref_points = np.array([[20.0, 20.0], [100.0, 30.0], [60.0, 110.0], [110.0, 100.0]])
+    binned_transform = sktransform.EuclideanTransform(translation=(5.0, -3.0))
+    aligner = PointAlignments(
+        *binned, rebin=1, points=(ref_points, binned_transform(ref_points)),
+        show_result=False, subpixel=True,
+    )
+    aligner._on_close(None)
+    session = _round_trip(aligner.session)
+    results = replay_session(session, ref_image, mov_image)
+    assert registration_error(results["tmat"], transform, ref_image.shape) < 0.5
+
+
+def test_crop_session_replay(rigid_pair):
+    transform, (ref_image, mov_image) = rigid_pair
+    session = AlignmentSession(
+        "crop",
+        {"rebin": 4, "method": "cross_corelation_fft", "inverse": False, "sub_pixel_factor": 10},
+        {
+            "positions": {"ref": [64, 192, 64, 192], "mov": [74, 202, 58, 186]},
+            "centers": {"ref": [128, 128], "mov": [138, 122]},
+        },
+        ref_image.shape,
+    )
+    results = CropAlignments.replay(_round_trip(session), ref_image, mov_image)
+    assert registration_error(results["tmat"], transform, ref_image.shape) < 0.5
+
+
+def test_replay_sessions_parallel(rigid_pair):
+    transform, (ref_image, mov_image) = rigid_pair
+    session = AlignmentSession(
+        "fine", {"rebin": 2, "refine": "affine"}, {"keys": [["a", None]]}, ref_image.shape
+    )
+    pairs = [(ref_image, mov_image)] * 3
+    sequential = replay_sessions(session.to_dict(), pairs, workers=1)
+    parallel = replay_sessions([session] * 3, pairs, workers=3, materialise=True)
+    for first, second in zip(sequential, parallel):
+        np.testing.assert_allclose(first["tmat"].params, second["tmat"].params)
+        assert second["result_image"].shape == ref_image.shape
+    assert registration_error(parallel[0]["tmat"], transform, ref_image.shape) < 1.5
+    with pytest.raises(ValueError):
+        replay_sessions([session] * 2, pairs)
+
+
+def test_batch_import_without_pyplot():
+    code = "import sys, align_panel.align.batch; print('matplotlib.pyplot' in sys.modules)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "False"
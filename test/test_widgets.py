@@ -0,0 +1,125 @@
+"""
+Tests of the notebook aligners and their tiled rendering, no data files are needed.
+"""
+import numpy as np
+import pytest
+from skimage import transform as sktransform
+from align_panel.align.benchmark import synthetic_pair, registration_error
+from align_panel.align.crop import CropAlignments
+from align_panel.align.fine import FineAlignments
+from align_panel.align.widgets import (
+    TileRenderer,
+    _NotebookAligner,
+    CropAlignmentWidget,
+    FineAlignmentWidget,
+    PointAlignmentWidget,
+)
+
+
+@pytest.fixture
+def rigid_pair():
+    transform = sktransform.EuclideanTransform(translation=(10.0, -6.0))
+    return transform, synthetic_pair((512, 512), transform, sigma=6, margin=32)
+
+
+def test_tile_renderer(rigid_pair):
+    transform, (ref_image, mov_image) = rigid_pair
+    renderer = TileRenderer(ref_image, mov_image, tile=64)
+    # the whole image on a display of a quarter of its size is rendered from the previews
+    assert renderer.factor((0, 0, 512, 512), (128, 128)) == 4
+    frame = renderer.render((0, 0, 512, 512), (128, 128))
+    assert frame.shape == (128, 128, 3) and frame.dtype == np.uint8
+    # at full resolution, only the tiles of the viewport are computed
+    viewport, size = (100, 100, 200, 200), (100, 100)
+    np.testing.assert_array_equal(
+        renderer.layer("ref", viewport, size), ref_image[100:200, 100:200]
+    )
+    computed = renderer.stats["computed"]
+    renderer.layer("ref", viewport, size)
+    assert renderer.stats["computed"] == computed
+    # the moving image warped by the transformation matches the reference image
+    renderer.set_transform(transform)
+    np.testing.assert_allclose(
+        renderer.layer("mov", viewport, size), ref_image[100:200, 100:200], atol=1e-4
+    )
+
+
+def test_incomplete_aligner_fails_on_creation(rigid_pair):
+    _, (ref_image, mov_image) = rigid_pair
+
+    class FrameOnly(_NotebookAligner):
+        def frame(self, name):
+            return np.zeros((8, 8, 3), dtype=np.uint8)
+
+    with pytest.raises(TypeError):
+        FrameOnly(ref_image, mov_image, ("ref",))
+
+
+def test_fine_alignment_widget(rigid_pair):
+    transform, (ref_image, mov_image) = rigid_pair
+    aligner = FineAlignmentWidget(ref_image, mov_image, rebin=2)
+    for key in ("right", "left", "a", "enter"):
+        aligner.press(key)
+    assert registration_error(aligner.tmat, transform, ref_image.shape) < 0.5
+    assert aligner.result_image.shape == ref_image.shape
+    replayed = FineAlignments.replay(aligner.session, ref_image, mov_image)
+    np.testing.assert_allclose(replayed["tmat"].params, aligner.tmat.params)
+    with pytest.raises(ValueError):
+        aligner.press("x")
+
+
+def test_crop_and_point_widgets(rigid_pair):
+    transform, (ref_image, mov_image) = rigid_pair
+    crop = CropAlignmentWidget(
+        ref_image, mov_image, method="cross_corelation_fft", inverse=False, sub_pixel_factor=10
+    )
+    assert crop.session is None
+    crop.set_crop("ref", (256, 256), (192, 192))
+    crop.set_crop("mov", (266, 250))
+    crop.confirm()
+    assert registration_error(crop.tmat, transform, ref_image.shape) < 0.5
+    replayed = CropAlignments.replay(crop.session, ref_image, mov_image)
+    np.testing.assert_allclose(replayed["tmat"].params, crop.tmat.params)
+    points = PointAlignmentWidget(ref_image, mov_image)
+    for xy in [(60.0, 60.0), (450.0, 80.0), (250.0, 440.0)]:
+        points.add_pair(xy, transform(np.array([xy]))[0])
+    points.confirm()
+    assert registration_error(points.tmat, transform, ref_image.shape) < 1e-6
+
+
+def test_widgets_send_changed_frames(rigid_pair):
+    pytest.importorskip("ipywidgets")
+    _, (ref_image, mov_image) = rigid_pair
+    aligner = PointAlignmentWidget(ref_image, mov_image, display_size=(128, 128))
+    aligner.widget
+    assert aligner.transfer["frames"] == 2
+    # adding a pair changes both views, a refresh without changes sends nothing
+    aligner.add_pair()
+    aligner._refresh()
+    transfer = aligner.transfer
+    assert transfer["frames"] == 4 and transfer["unchanged"] == 2
+    assert transfer["bytes"] < 4 * 3 * 128 * 128
+
+
+def test_point_widget_reports_rejected_pairs(rigid_pair):
+    pytest.importorskip("ipywidgets")
+    transform, (ref_image, mov_image) = rigid_pair
+    aligner = PointAlignmentWidget(
+        ref_image, mov_image, method="euclidean", robust="ransac", display_size=(64, 64)
+    )
+    aligner.widget
+    for xy in [(60.0, 60.0), (450.0, 80.0), (250.0, 440.0), (440.0, 400.0), (120.0, 300.0)]:
+        aligner.add_pair(xy, transform(np.array([xy]))[0])
+    aligner.add_pair((200.0, 200.0), (20.0, 400.0))
+    aligner.confirm()
+    assert aligner._widgets["status"].value.endswith("Rejected point pairs: [5]")
+    assert registration_error(aligner.tmat, transform, ref_image.shape) < 1e-6
+
+
+def test_crop_widget_slider_limits():
+    pytest.importorskip("ipywidgets")
+    ref_image, mov_image = np.zeros((200, 300)), np.zeros((120, 180))
+    aligner = CropAlignmentWidget(ref_image, mov_image)
+    controls = aligner.widget.children[1].children[:3]
+    limits = [[slider.max for slider in sliders.children] for sliders in controls]
+    assert limits == [[300, 200], [180, 120], [180, 120]]